@@ -0,0 +1,45 @@
+BEGIN;
+--
+-- Normalized storage of quality labels, used with `--label-storage normalized`.
+-- The metadata of a QA/QC test (func, args, kwargs) is stored once per distinct
+-- test in "quality_label", every observation gets a compact row with its flag
+-- in "observation_quality", instead of a rewrite of the whole observation.
+--
+CREATE TABLE "quality_label" ("id" bigserial NOT NULL PRIMARY KEY, "hash" char(32) NOT NULL UNIQUE, "meta" jsonb NOT NULL);
+--
+-- An observation without a row is not quality controlled yet. A row without
+-- a label means the observation was controlled, but never flagged.
+--
+CREATE TABLE "observation_quality" ("observation_id" bigint NOT NULL PRIMARY KEY, "label_id" bigint NULL, "flag" double precision NULL);
+ALTER TABLE "observation_quality" ADD CONSTRAINT "observation_quality_observation_id_fk_observation_id" FOREIGN KEY ("observation_id") REFERENCES "observation" ("id") ON DELETE CASCADE;
+ALTER TABLE "observation_quality" ADD CONSTRAINT "observation_quality_label_id_fk_quality_label_id" FOREIGN KEY ("label_id") REFERENCES "quality_label" ("id");
+--
+-- A changed value needs a new QA/QC: the upsert resets "result_quality" to
+-- json 'null', which drops the normalized label as well.
+--
+CREATE FUNCTION "observation_quality_reset"() RETURNS trigger AS $$
+BEGIN
+    DELETE FROM "observation_quality" WHERE "observation_id" = NEW."id";
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+CREATE TRIGGER "observation_quality_reset" AFTER UPDATE OF "result_quality" ON "observation"
+    FOR EACH ROW WHEN (NEW."result_quality" = 'null'::jsonb) EXECUTE FUNCTION "observation_quality_reset"();
+--
+-- Observations with "result_quality" as before, for readers of either storage:
+-- a normalized label takes precedence over the jsonb column.
+--
+CREATE VIEW "observation_labeled" AS
+SELECT o."id", o."phenomenon_time_start", o."phenomenon_time_end", o."result_time", o."result_type",
+       o."result_number", o."result_string", o."result_json", o."result_boolean", o."result_latitude",
+       o."result_longitude", o."result_altitude",
+       CASE
+           WHEN q."observation_id" IS NULL THEN o."result_quality"
+           WHEN q."label_id" IS NULL THEN '{}'::jsonb
+           ELSE l."meta" || jsonb_build_object('flag', q."flag")
+       END AS "result_quality",
+       o."valid_time_start", o."valid_time_end", o."parameters", o."datastream_id"
+FROM "observation" o
+LEFT JOIN "observation_quality" q ON q."observation_id" = o."id"
+LEFT JOIN "quality_label" l ON l."id" = q."label_id";
+COMMIT;
@@ -0,0 +1,54 @@
+from typing import Any, Dict
+
+from tsm_datastore_lib.AbstractDatastore import AbstractDatastore
+from Datastore.DatastoreWrapper import DatastoreWrapper
+from metadata_cache import DatastreamInfo, MetadataCache, get_thing_version
+
+
+class CachedDatastore(DatastoreWrapper):
+    """
+    Look up the metadata of the thing in a `MetadataCache`, before the
+    database is queried.
+
+    The properties of the thing (`thing_properties`), the parameters of
+    parsers (`get_parser_parameters`) and the datastreams by position
+    (`get_datastream`) are cached. Datastreams are returned as
+    `metadata_cache.DatastreamInfo`, not as ORM objects, so compare
+    observations by ``Observation.datastream_id == datastream.id``.
+
+    Before the first lookup, the cached metadata is validated against the
+    version of the metadata of the thing in the database, so metadata
+    cached before a change of the configuration isn't used.
+    """
+
+    def __init__(self, datastore: AbstractDatastore, cache: MetadataCache, thing_uuid: str):
+        super().__init__(datastore)
+        self.cache = cache
+        self.thing_uuid = str(thing_uuid)
+        self._validated = False
+
+    def _get(self, kind: str, key: str, load):
+        if not self._validated:
+            self.cache.validate(self.thing_uuid, get_thing_version(self.datastore, self.thing_uuid))
+            self._validated = True
+        return self.cache.get(self.thing_uuid, kind, key, load)
+
+    @property
+    def thing_properties(self) -> Dict[str, Any]:
+        return self._get(
+            "properties", "thing", lambda: self.datastore.sqla_thing.properties or {}
+        )
+
+    def get_parser_parameters(self, parser_type: str) -> Dict[str, Any]:
+        return self._get(
+            "parser_parameters", parser_type,
+            lambda: self.datastore.get_parser_parameters(parser_type),
+        )
+
+    def get_datastream(self, position) -> DatastreamInfo:
+        def load() -> DatastreamInfo:
+            # raises for missing datastreams, which aren't cached
+            datastream = self.datastore.get_datastream(position)
+            return DatastreamInfo(id=datastream.id, name=datastream.name, position=str(datastream.position))
+
+        return self._get("datastreams", str(position), load)
@@ -0,0 +1,20 @@
+from tsm_datastore_lib.AbstractDatastore import AbstractDatastore
+
+
+class DatastoreWrapper:
+    """
+    Base class for wrappers, that change how a datastore stores data.
+
+    All attributes, which are not defined by the wrapper itself, are
+    looked up on the wrapped datastore, so a wrapper can be used in
+    place of the datastore (e.g. by parsers or the QA/QC).
+    """
+
+    def __init__(self, datastore: AbstractDatastore):
+        self.datastore = datastore
+
+    def __getattr__(self, name):
+        # prevent an endless recursion, if `datastore` isn't set (yet)
+        if name == "datastore":
+            raise AttributeError(name)
+        return getattr(self.datastore, name)
@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+from typing import List, Sequence
+
+import numpy as np
+import pandas as pd
+
+from tsm_datastore_lib.AbstractDatastore import AbstractDatastore
+from tsm_datastore_lib.Observation import Observation, NanNotAllowedHereError
+
+
+class ObservationBatch:
+    """
+    Columnar batch of observations of one origin.
+
+    Instead of one `Observation` object per value, a batch holds one array
+    per attribute, all of the same length, in the order the values should
+    be stored.
+
+    Parameters
+    ----------
+    timestamps:
+        the time of every value, converted to a `pandas.DatetimeIndex`,
+        which keeps the timezone, if any
+    values:
+        the values, a numeric array, or an object array for mixed types
+    positions:
+        the (integer) position of the datastream of every value
+    origin:
+        the raw data source of all values
+    headers:
+        the column header of every value, or a single header for all
+    """
+
+    def __init__(
+        self, timestamps, values, positions, origin: str, headers=None,
+    ):
+        self.timestamps = pd.DatetimeIndex(timestamps)
+        self.values = np.asarray(values)
+        self.positions = np.asarray(positions, dtype=np.int64)
+        self.origin = origin
+        if headers is None or np.ndim(headers) == 0:
+            headers = np.full(len(self.positions), "" if headers is None else headers, dtype=object)
+        self.headers = np.asarray(headers, dtype=object)
+        if not len(self.timestamps) == len(self.values) == len(self.positions) == len(self.headers):
+            raise ValueError(
+                f"all arrays need the same length, got {len(self.timestamps)} timestamps, "
+                f"{len(self.values)} values, {len(self.positions)} positions and {len(self.headers)} headers"
+            )
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    @property
+    def nbytes(self) -> int:
+        """ Memory of the arrays, including the objects in object arrays. """
+        values = self.values.nbytes
+        if self.values.dtype == object:
+            values = int(pd.Series(self.values).memory_usage(index=False, deep=True))
+        # the headers are shared column names, only count the references
+        return values + self.timestamps.nbytes + self.positions.nbytes + self.headers.nbytes
+
+    @classmethod
+    def from_frame(
+        cls, data: pd.DataFrame, timestamp_column: int, origin: str, keep: np.ndarray = None,
+    ) -> ObservationBatch:
+        """
+        Get all values of the wide frame `data` row by row, the integer
+        location of a column is its position. Missing values are left out.
+
+        Parameters
+        ----------
+        data:
+            one column holds the timestamps, all others the values
+        timestamp_column:
+            integer location of the timestamp column
+        keep:
+            boolean mask (rows x columns) of the values to take, optional
+        """
+        columns = [i for i in range(len(data.columns)) if i != timestamp_column]
+        values = data.iloc[:, columns]
+        # a common numeric type stays compact, mixed types become objects
+        dtypes = set(values.dtypes)
+        array = values.to_numpy(dtype=None if len(dtypes) == 1 else object)
+        take = values.notna().to_numpy()
+        if keep is not None:
+            take &= keep[:, columns]
+        rows, cols = np.nonzero(take)
+        return cls(
+            timestamps=pd.DatetimeIndex(data.iloc[:, timestamp_column]).take(rows),
+            values=array[rows, cols],
+            positions=np.asarray(columns, dtype=np.int64)[cols],
+            origin=origin,
+            headers=np.asarray(data.columns, dtype=object)[columns][cols],
+        )
+
+    @classmethod
+    def concat(cls, batches: Sequence[ObservationBatch]) -> ObservationBatch:
+        """ Join batches of the same origin, in order. """
+        if len({b.origin for b in batches}) > 1:
+            raise ValueError("can only join batches of the same origin")
+        return cls(
+            timestamps=batches[0].timestamps.append([b.timestamps for b in batches[1:]]),
+            values=np.concatenate([b.values for b in batches]),
+            positions=np.concatenate([b.positions for b in batches]),
+            origin=batches[0].origin,
+            headers=np.concatenate([b.headers for b in batches]),
+        )
+
+    def to_observations(self) -> List[Observation]:
+        """ Convert the batch into `Observation` objects, NaN values are left out. """
+        observations = []
+        for timestamp, value, position, header in zip(
+            self.timestamps, self.values.tolist(), self.positions.tolist(), self.headers.tolist()
+        ):
+            try:
+                observations.append(Observation(
+                    timestamp=timestamp,
+                    value=value,
+                    position=position,
+                    origin=self.origin,
+                    header=header,
+                ))
+            except NanNotAllowedHereError:
+                pass
+        return observations
+
+
+def store_batch(datastore: AbstractDatastore, batch: ObservationBatch) -> None:
+    """
+    Store `batch` in `datastore`. Datastores, that support batches, have
+    a method `store_observation_batch`, all others get `Observation` lists.
+    """
+    if not len(batch):
+        return
+    if (store := getattr(datastore, "store_observation_batch", None)) is not None:
+        store(batch)
+    else:
+        datastore.store_observations(batch.to_observations())
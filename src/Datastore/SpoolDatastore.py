@@ -0,0 +1,338 @@
+import collections
+import fcntl
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from typing import Deque, List
+
+import numpy as np
+import pandas as pd
+
+from tsm_datastore_lib.AbstractDatastore import AbstractDatastore
+from tsm_datastore_lib.Observation import Observation
+from Datastore.DatastoreWrapper import DatastoreWrapper
+from Datastore.ObservationBatch import ObservationBatch, store_batch
+
+# Segments are written to the datastore in transactions of at least this many rows
+FLUSH_ROWS = 100000
+# Seconds to wait before the first retry of a failed transaction, doubled per retry ...
+RETRY_INTERVAL = 1.
+# ... up to this many seconds
+RETRY_MAX_INTERVAL = 60.
+# Seconds `finalize` waits for the spool to drain, before it gives up
+DRAIN_TIMEOUT = 600.
+# Seconds a job waits for another job of the same spool to finish, before it gives up
+LOCK_TIMEOUT = DRAIN_TIMEOUT + 60.
+# Seconds between the attempts to lock the spool
+LOCK_INTERVAL = .1
+
+SUFFIX = ".npz"
+
+
+class SpoolNotDrainedError(Exception):
+    def __init__(self, directory: str, segments: int, error: Exception = None):
+        self.message = (
+            f"{segments} segments of the spool {directory} couldn't be written to the datastore"
+            + ("" if error is None else f", last error: {error!r}")
+            + ". They are written by the next job with the same spool."
+        )
+        super().__init__(self.message)
+
+
+class SpoolLockedError(Exception):
+    def __init__(self, directory: str, timeout: float):
+        self.message = f"the spool {directory} is still used by another job after {timeout:.0f}s"
+        super().__init__(self.message)
+
+
+class SpoolDatastore(DatastoreWrapper):
+    """
+    Spool observations on local disk and write them to the datastore
+    in the background.
+
+    Every batch of observations is written to its own segment file in
+    `directory` (atomically: to a temporary file, which is renamed) and
+    acknowledged at once, so parsing is bound by the speed of the local
+    disk, not by the datastore. A flusher thread writes the segments in
+    order to the wrapped datastore, in transactions of `flush_rows` rows,
+    and deletes them after the commit. Failed transactions are rolled back
+    and retried with an exponential backoff.
+
+    Segments left over by an interrupted job are written on init, before
+    anything else. A segment may be written twice, if the job stops between
+    the commit and the deletion of the segment, so wrap an idempotent
+    datastore, e.g. an `UpsertDatastore`.
+
+    A job holds an exclusive lock (`fcntl.flock`) on `directory` from init
+    until `finalize`, or until its process ends. Other jobs with the same
+    `directory`, e.g. of two uploads of a device, wait up to `lock_timeout`
+    seconds for it, so they never write or replay the same segments.
+
+    The number of spooled, flushed and replayed rows and segments and the
+    number of retries are available from `counts`.
+
+    Notes
+    -----
+    The wrapped datastore is only used by the flusher, from the first
+    stored batch until `finalize`, which waits up to `drain_timeout`
+    seconds for all segments to be written.
+    """
+
+    def __init__(
+        self, datastore: AbstractDatastore, directory: str, flush_rows: int = FLUSH_ROWS,
+        drain_timeout: float = DRAIN_TIMEOUT, lock_timeout: float = LOCK_TIMEOUT,
+    ):
+        super().__init__(datastore)
+        self.directory = directory
+        self.flush_rows = flush_rows
+        self.drain_timeout = drain_timeout
+        self.counts = dict(
+            spooled_rows=0, spooled_segments=0, flushed_rows=0, flushed_segments=0,
+            replayed_segments=0, retries=0,
+        )
+        os.makedirs(directory, exist_ok=True)
+        self._lock = _lock(directory, lock_timeout)
+        for name in os.listdir(directory):
+            if name.endswith(".tmp"):
+                # never acknowledged
+                os.remove(os.path.join(directory, name))
+        self._segments: Deque[str] = collections.deque(sorted(
+            os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(SUFFIX)
+        ))
+        self._sequence = itertools.count(
+            1 + max((int(os.path.basename(p)[:-len(SUFFIX)]) for p in self._segments), default=0)
+        )
+        self._condition = threading.Condition()
+        self._closing = self._stopped = False
+        self._error = None
+        self._flusher = None
+
+        if self._segments:
+            logging.info(f"Spool: writing {len(self._segments)} segments left over by an earlier job")
+            self.counts["replayed_segments"] = len(self._segments)
+            try:
+                while self._segments:
+                    for _ in range(self._flush(list(self._segments))):
+                        self._segments.popleft()
+            except BaseException:
+                self._unlock()
+                raise
+
+    def _unlock(self) -> None:
+        if self._lock is not None:
+            os.close(self._lock)  # releases the lock
+            self._lock = None
+
+    def store_observations(self, observations: List[Observation]) -> None:
+        # one batch per run of observations of the same origin
+        for origin, group in itertools.groupby(observations, key=lambda o: o.origin):
+            group = list(group)
+            values = np.empty(len(group), dtype=object)
+            values[:] = [o.value for o in group]
+            self.store_observation_batch(ObservationBatch(
+                timestamps=[o.timestamp for o in group],
+                values=values,
+                positions=[o.position for o in group],
+                origin=origin,
+                headers=[o.header for o in group],
+            ))
+
+    def store_observation_batch(self, batch: ObservationBatch) -> None:
+        """ Write `batch` to a new segment and hand it to the flusher. """
+        if not len(batch):
+            return
+        path = os.path.join(self.directory, f"{next(self._sequence):012d}{SUFFIX}")
+        _write_segment(path, batch)
+        self.counts["spooled_rows"] += len(batch)
+        self.counts["spooled_segments"] += 1
+        with self._condition:
+            self._segments.append(path)
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._run, name="spool-flusher", daemon=True)
+                self._flusher.start()
+            self._condition.notify()
+
+    def _run(self) -> None:
+        retries = 0
+        while True:
+            with self._condition:
+                while not self._segments and not self._closing:
+                    self._condition.wait()
+                if self._stopped or not self._segments:
+                    return
+                pending = list(self._segments)
+            try:
+                written = self._flush(pending)
+            except Exception as e:
+                self._error = e
+                _rollback(self.datastore)
+                delay = min(RETRY_INTERVAL * 2 ** retries, RETRY_MAX_INTERVAL)
+                retries += 1
+                self.counts["retries"] += 1
+                logging.warning(f"Spool: writing the spooled observations failed ({e!r}), retrying in {delay:.0f}s")
+                with self._condition:
+                    self._condition.wait_for(lambda: self._stopped, timeout=delay)
+                continue
+            retries, self._error = 0, None
+            with self._condition:
+                for _ in range(written):
+                    self._segments.popleft()
+                self._condition.notify_all()
+
+    def _flush(self, paths: List[str]) -> int:
+        """
+        Write the oldest of the segments at `paths` in one transaction, until
+        it has `flush_rows` rows, and delete them. Returns their number.
+        """
+        rows, written = 0, []
+        for path in paths:
+            batch = _read_segment(path)
+            store_batch(self.datastore, batch)
+            rows += len(batch)
+            written.append(path)
+            if rows >= self.flush_rows:
+                break
+        _commit(self.datastore)
+        for path in written:
+            os.remove(path)
+        self.counts["flushed_rows"] += rows
+        self.counts["flushed_segments"] += len(written)
+        return len(written)
+
+    def finalize(self) -> None:
+        """
+        Wait for the spool to drain, then finalize the wrapped datastore.
+        The spool is unlocked in any case.
+        """
+        try:
+            if self._flusher is not None:
+                deadline = time.monotonic() + self.drain_timeout
+                with self._condition:
+                    self._closing = True
+                    self._condition.notify_all()
+                    drained = self._condition.wait_for(
+                        lambda: not self._segments, timeout=max(0., deadline - time.monotonic())
+                    )
+                    if not drained:
+                        self._stopped = True
+                        self._condition.notify_all()
+                self._flusher.join()
+                if not drained:
+                    raise SpoolNotDrainedError(self.directory, len(self._segments), self._error)
+        finally:
+            self._unlock()
+        self.datastore.finalize()
+        logging.info(
+            "Spool: {spooled_rows} observations spooled, {flushed_rows} written "
+            "({replayed_segments} segments replayed, {retries} retries)".format(**self.counts)
+        )
+
+
+def _lock(directory: str, timeout: float) -> int:
+    """ Lock the spool in `directory` exclusively, returns the descriptor holding the lock. """
+    fd = os.open(directory, os.O_RDONLY)
+    deadline = time.monotonic() + timeout
+    waiting = False
+    while True:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return fd
+        except BlockingIOError:
+            pass
+        except BaseException:
+            os.close(fd)
+            raise
+        if time.monotonic() >= deadline:
+            os.close(fd)
+            raise SpoolLockedError(directory, timeout)
+        if not waiting:
+            logging.info(f"Spool: waiting for another job of the spool {directory}")
+            waiting = True
+        time.sleep(LOCK_INTERVAL)
+
+
+def _write_segment(path: str, batch: ObservationBatch) -> None:
+    """ Write `batch` atomically and durably to `path`. """
+    timestamps = batch.timestamps
+    values = batch.values
+    meta = dict(origin=batch.origin, aware=timestamps.tz is not None, json_values=values.dtype == object)
+    if meta["json_values"]:
+        # numbers, strings, booleans and json documents, in one compact string
+        values = _encode(values.tolist())
+    arrays = dict(
+        # instants, a timezone is restored as UTC
+        timestamps=(timestamps.tz_convert("UTC") if meta["aware"] else timestamps).asi8,
+        values=values,
+        positions=batch.positions,
+        headers=_encode(batch.headers.tolist()),
+        meta=_encode(meta),
+    )
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        np.savez(f, **arrays)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    _fsync_directory(os.path.dirname(path))
+
+
+def _read_segment(path: str) -> ObservationBatch:
+    with np.load(path, allow_pickle=False) as arrays:
+        meta = _decode(arrays["meta"])
+        values = arrays["values"]
+        if meta["json_values"]:
+            decoded = _decode(values)
+            values = np.empty(len(decoded), dtype=object)
+            values[:] = decoded
+        timestamps = pd.DatetimeIndex(arrays["timestamps"].astype("datetime64[ns]"))
+        return ObservationBatch(
+            timestamps=timestamps.tz_localize("UTC") if meta["aware"] else timestamps,
+            values=values,
+            positions=arrays["positions"],
+            origin=meta["origin"],
+            headers=_decode(arrays["headers"]),
+        )
+
+
+def _encode(obj) -> np.ndarray:
+    return np.frombuffer(json.dumps(obj, default=str).encode(), dtype=np.uint8)
+
+
+def _decode(array: np.ndarray):
+    return json.loads(array.tobytes().decode())
+
+
+def _fsync_directory(directory: str) -> None:
+    """ Make a rename in `directory` durable, where the OS supports it. """
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _commit(datastore) -> None:
+    """ Write everything buffered by `datastore` and commit its transaction. """
+    if (flush := getattr(datastore, "flush", None)) is not None:
+        flush()
+    if (session := getattr(datastore, "session", None)) is not None:
+        session.commit()
+
+
+def _rollback(datastore) -> None:
+    """ Discard everything buffered by `datastore`, after an error. """
+    try:
+        if (rollback := getattr(datastore, "rollback", None)) is not None:
+            rollback()
+        elif (session := getattr(datastore, "session", None)) is not None:
+            session.rollback()
+    except Exception as e:
+        logging.warning(f"Spool: rollback failed: {e!r}")
@@ -0,0 +1,214 @@
+import logging
+from datetime import datetime
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+import sqlalchemy
+from sqlalchemy.dialects import postgresql
+
+from tsm_datastore_lib.Observation import Observation
+from Datastore.ObservationBatch import ObservationBatch
+from tsm_datastore_lib.SqlAlchemyDatastore import SqlAlchemyDatastore, DatastreamNotFoundError
+from tsm_datastore_lib.SqlAlchemy.Model import Datastream, Observation as ObservationModel
+from Datastore.DatastoreWrapper import DatastoreWrapper
+
+# Number of observations written by one statement
+UPSERT_BATCH_SIZE = 5000
+
+UNIQUE_COLUMNS = ("datastream_id", "result_time")
+
+# The `result_type` is the index of the column, that holds the value
+RESULT_COLUMNS = ("result_number", "result_string", "result_json", "result_boolean")
+
+
+def result_columns(value: Any) -> Dict[str, Any]:
+    """ Map a value to the `result_type` and the matching `result_*` column. """
+    if isinstance(value, (bool, np.bool_)):
+        result_type, value = 3, bool(value)
+    elif isinstance(value, (int, float, np.integer, np.floating)):
+        result_type, value = 0, float(value)
+    elif isinstance(value, (dict, list)):
+        result_type = 2
+    else:
+        result_type, value = 1, str(value)
+    row = dict.fromkeys(RESULT_COLUMNS)
+    row[RESULT_COLUMNS[result_type]] = value
+    row["result_type"] = result_type
+    return row
+
+
+# `result_columns` of a number, without the number
+EMPTY_RESULT = {**dict.fromkeys(RESULT_COLUMNS), "result_type": 0}
+
+
+def _complete_row(row: dict, datastream_id: int, result_time: datetime, origin: str, header: str) -> dict:
+    """ Add the datastream, time and metadata to the `result_columns` of a value. """
+    row["datastream_id"] = datastream_id
+    row["result_time"] = result_time
+    row["parameters"] = dict(origin=origin, column_header=header)
+    # a json 'null' marks observations, which are not quality controlled yet
+    row["result_quality"] = sqlalchemy.JSON.NULL
+    if row["result_json"] is None:
+        row["result_json"] = sqlalchemy.null()
+    return row
+
+
+def _to_datetime(timestamp) -> datetime:
+    return timestamp.to_pydatetime() if isinstance(timestamp, pd.Timestamp) else timestamp
+
+
+class UpsertDatastore(DatastoreWrapper):
+    """
+    Store observations idempotently.
+
+    Observations are buffered and written in batches with
+    ``INSERT ... ON CONFLICT (datastream_id, result_time) DO UPDATE``.
+    Existing observations are only updated (and their quality labels
+    reset), if the value actually changed. So parsing the same raw data
+    twice is safe and cheap.
+
+    The number of inserted, updated and unchanged observations is
+    available from `counts`.
+
+    Notes
+    -----
+    Only PostgreSQL datastores are supported, and the table `observation`
+    needs a unique constraint or index on ``(datastream_id, result_time)``
+    (see `postgres/postgres-ddl.sql`).
+    """
+
+    def __init__(self, datastore: SqlAlchemyDatastore, batch_size: int = UPSERT_BATCH_SIZE):
+        super().__init__(datastore)
+        self.datastore: SqlAlchemyDatastore
+        if self.session.bind.dialect.name != "postgresql":
+            raise NotImplementedError("upserting observations is only supported for PostgreSQL")
+        _check_unique_index(self.session.bind)
+        self.batch_size = batch_size
+        self.counts = dict(inserted=0, updated=0, unchanged=0)
+        self._datastream_ids: Dict[int, int] = {}
+        self._rows: Dict[tuple, dict] = {}
+
+    def _get_datastream_id(self, position: int) -> int:
+        if (datastream_id := self._datastream_ids.get(position)) is None:
+            try:
+                datastream = self.datastore.get_datastream(position)
+            except DatastreamNotFoundError:
+                thing = self.sqla_thing
+                datastream = Datastream(
+                    name=f"{thing.name}/{position}", position=str(position), thing_id=thing.id
+                )
+                self.session.add(datastream)
+                self.session.flush()
+            datastream_id = self._datastream_ids[position] = datastream.id
+        return datastream_id
+
+    def to_row(self, observation: Observation) -> dict:
+        return _complete_row(
+            result_columns(observation.value),
+            self._get_datastream_id(observation.position),
+            _to_datetime(observation.timestamp),
+            observation.origin,
+            observation.header,
+        )
+
+    def store_observations(self, observations: List[Observation]) -> None:
+        for observation in observations:
+            row = self.to_row(observation)
+            # a statement can't touch a row twice, so the last value wins
+            self._rows[row["datastream_id"], row["result_time"]] = row
+        if len(self._rows) >= self.batch_size:
+            self.flush()
+
+    def store_observation_batch(self, batch: ObservationBatch) -> None:
+        """
+        Same as `store_observations`, but for a columnar batch. The
+        datastream ids and result columns are resolved per array, not
+        per value.
+        """
+        positions, inverse = np.unique(batch.positions, return_inverse=True)
+        datastream_ids = np.array([self._get_datastream_id(int(p)) for p in positions])[inverse].tolist()
+        kind = batch.values.dtype.kind
+        if kind in "iuf":
+            # all values go to `result_number`
+            values = batch.values.astype(float)
+            keep = ~np.isnan(values)
+            results = ({**EMPTY_RESULT, "result_number": v} for v in values.tolist())
+        elif kind == "b":
+            keep = np.ones(len(batch), dtype=bool)
+            results = ({**EMPTY_RESULT, "result_type": 3, "result_boolean": v} for v in batch.values.tolist())
+        else:
+            keep = ~pd.isna(batch.values)
+            results = (result_columns(v) for v in batch.values.tolist())
+
+        for result, ok, datastream_id, result_time, header in zip(
+            results, keep.tolist(), datastream_ids, batch.timestamps.to_pydatetime(), batch.headers.tolist()
+        ):
+            if ok:
+                row = _complete_row(result, datastream_id, result_time, batch.origin, header)
+                self._rows[datastream_id, result_time] = row
+        if len(self._rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """ Write all buffered observations. """
+        if not self._rows:
+            return
+        rows = list(self._rows.values())
+        self._rows.clear()
+
+        table = ObservationModel.__table__
+        stmt = postgresql.insert(table).values(rows)
+        value_columns = ["result_type", *RESULT_COLUMNS]
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(UNIQUE_COLUMNS),
+            set_={
+                **{c: stmt.excluded[c] for c in value_columns},
+                "parameters": stmt.excluded.parameters,
+                # the value changed, so it needs a new QA/QC
+                "result_quality": sqlalchemy.JSON.NULL,
+            },
+            where=sqlalchemy.or_(*[table.c[c].is_distinct_from(stmt.excluded[c]) for c in value_columns]),
+        ).returning(
+            # xmax is zero for freshly inserted rows
+            sqlalchemy.literal_column("xmax = 0").label("inserted")
+        )
+        written = self.session.execute(stmt).fetchall()
+        inserted = sum(1 for row in written if row.inserted)
+        self.counts["inserted"] += inserted
+        self.counts["updated"] += len(written) - inserted
+        self.counts["unchanged"] += len(rows) - len(written)
+
+    def rollback(self) -> None:
+        """ Discard the buffered observations and roll back the transaction. """
+        self._rows.clear()
+        # datastreams created in the transaction are gone
+        self._datastream_ids.clear()
+        self.session.rollback()
+
+    def finalize(self) -> None:
+        self.flush()
+        self.session.commit()
+        self.datastore.finalize()
+        logging.info(
+            "Upsert: {inserted} observations inserted, {updated} updated, "
+            "{unchanged} unchanged".format(**self.counts)
+        )
+
+
+def _check_unique_index(bind) -> None:
+    inspector = sqlalchemy.inspect(bind)
+    table = ObservationModel.__table__.name
+    unique = [c["column_names"] for c in inspector.get_unique_constraints(table)]
+    unique += [i["column_names"] for i in inspector.get_indexes(table) if i["unique"]]
+    if set(UNIQUE_COLUMNS) not in map(set, unique):
+        raise MissingUniqueIndexError(table, UNIQUE_COLUMNS)
+
+
+class MissingUniqueIndexError(Exception):
+    def __init__(self, table: str, columns: tuple):
+        self.message = (
+            f'Upserting needs a unique index on {table}({", ".join(columns)}). Create it with: '
+            f'CREATE UNIQUE INDEX ON "{table}" ({", ".join(columns)});'
+        )
+        super().__init__(self.message)
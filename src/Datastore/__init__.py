@@ -0,0 +1,7 @@
+from .DatastoreWrapper import DatastoreWrapper
+from .ObservationBatch import ObservationBatch, store_batch
+from .UpsertDatastore import UpsertDatastore, MissingUniqueIndexError
+from .SpoolDatastore import SpoolDatastore, SpoolNotDrainedError, SpoolLockedError
+from .CachedDatastore import CachedDatastore
+from .watermarks import get_watermarks
+from .positions import get_positions
@@ -0,0 +1,28 @@
+from typing import Optional, Set
+
+import sqlalchemy
+
+from tsm_datastore_lib.SqlAlchemyDatastore import SqlAlchemyDatastore
+from tsm_datastore_lib.SqlAlchemy.Model import Datastream
+
+
+def get_positions(datastore: SqlAlchemyDatastore) -> Optional[Set[int]]:
+    """
+    Get the positions of all datastreams of the thing, i.e. the columns
+    of the raw data, that are mapped to a datastream.
+
+    Returns
+    -------
+    the integer positions, or None, if the datastore can't tell (it
+    isn't a database), datastreams with other positions are left out
+    """
+    if (positions := getattr(datastore, "datastream_positions", None)) is not None:
+        return positions()
+    if getattr(datastore, "session", None) is None:
+        return None
+    stmt = sqlalchemy.select(Datastream.position).where(
+        Datastream.thing_id == datastore.sqla_thing.id
+    )
+    return {
+        int(position) for position, in datastore.session.execute(stmt) if str(position).isdigit()
+    }
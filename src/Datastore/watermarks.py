@@ -0,0 +1,40 @@
+from typing import Dict
+
+import pandas as pd
+import sqlalchemy
+
+from tsm_datastore_lib.SqlAlchemyDatastore import SqlAlchemyDatastore
+from tsm_datastore_lib.SqlAlchemy.Model import Datastream, Observation
+
+
+def get_watermarks(datastore: SqlAlchemyDatastore) -> Dict[int, pd.Timestamp]:
+    """
+    Get the latest stored `result_time` of every datastream of the thing.
+
+    All datastreams are queried at once, the maximum per datastream is a
+    correlated subquery, which is answered from the unique index on
+    ``observation(datastream_id, result_time)``.
+
+    Returns
+    -------
+    position -> latest result time as naive UTC timestamp, datastreams
+    without observations or a non-integer position are left out
+    """
+    latest = (
+        sqlalchemy.select(sqlalchemy.func.max(Observation.result_time))
+        .where(Observation.datastream_id == Datastream.id)
+        .scalar_subquery()
+    )
+    stmt = sqlalchemy.select(Datastream.position, latest).where(
+        Datastream.thing_id == datastore.sqla_thing.id
+    )
+    watermarks = {}
+    for position, result_time in datastore.session.execute(stmt):
+        if result_time is None or not str(position).isdigit():
+            continue
+        result_time = pd.Timestamp(result_time)
+        if result_time.tz is not None:
+            # naive timestamps are stored as UTC
+            result_time = result_time.tz_convert("UTC").tz_localize(None)
+        watermarks[int(position)] = result_time
+    return watermarks
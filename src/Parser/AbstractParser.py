@@ -1,9 +1,19 @@
+import contextlib
+import time
 from abc import abstractmethod, ABC
-
-import click
+from typing import List, Optional
 
 from tsm_datastore_lib.AbstractDatastore import AbstractDatastore
+from Datastore.ObservationBatch import ObservationBatch, store_batch
 from RawDataSource import AbstractRawDataSource
+from progress import AbstractProgressSink, ProgressReporter
+from instrumentation import JobStats
+from memory import MemoryBudget
+
+# Buffered values are written, as soon as there are this many ...
+BATCH_SIZE = 10000
+# ... or the oldest of them waits for this many seconds
+BATCH_INTERVAL = 5.
 
 
 class AbstractParser(ABC):
@@ -11,17 +21,82 @@ class AbstractParser(ABC):
     def __init__(self, rawdata_source: AbstractRawDataSource, datastore: AbstractDatastore):
         self.datastore: AbstractDatastore = datastore
         self.rawdata_source: AbstractRawDataSource = rawdata_source
-        self.progress = click.progressbar(length=0, show_pos=True, label='Parsing raw data')
+        self.progress = ProgressReporter(label='Parsing raw data')
         self.name = self.__class__.__name__
+        # replaced by the stats of the whole job, if run from the cli
+        self.stats = JobStats(self.name)
+        # number of processes a parser may use
+        self.workers = 1
+        # thresholds to write the values passed to `emit`
+        self.batch_size = BATCH_SIZE
+        self.batch_interval = BATCH_INTERVAL
+        # set to bound the memory of buffers and frames, see `memory`
+        self.memory_budget: Optional[MemoryBudget] = None
+        self._batches: List[ObservationBatch] = []
+        self._buffered = 0
+        self._buffered_since = 0.
+
+    def set_progress_sink(self, sink: AbstractProgressSink, interval: float = None):
+        self.progress.sink = sink
+        if interval is not None:
+            self.progress.interval = interval
 
     def set_progress_length(self, length: int):
-        self.progress.length = length
-        # Tune number of updates so only five percent steps are reported
-        self.progress.update_min_steps = length / 20
+        self.progress.set_length(length)
 
     def update_progress(self, steps=1):
         self.progress.update(steps)
 
+    def emit(self, timestamps, values, positions, headers=None, origin: str = None, timed: bool = True):
+        """
+        Buffer values to store, given as arrays of the same length, see
+        `ObservationBatch`. The `origin` defaults to the raw data source.
+
+        The buffered values are written to the datastore, as soon as there
+        are `batch_size` of them (or less, if they would exceed the share
+        of the `memory_budget`) or the oldest waits for `batch_interval`
+        seconds. Call `flush` at the end of `do_parse` to write the rest.
+        """
+        origin = self.rawdata_source.src if origin is None else origin
+        self.emit_batch(ObservationBatch(timestamps, values, positions, origin, headers), timed)
+
+    def emit_batch(self, batch: ObservationBatch, timed: bool = True):
+        """ Same as `emit`, but with a ready `ObservationBatch`. """
+        if not len(batch):
+            return
+        if self._batches and self._batches[0].origin != batch.origin:
+            self.flush(timed)
+        if not self._batches:
+            self._buffered_since = time.monotonic()
+        self._batches.append(batch)
+        self._buffered += len(batch)
+        batch_size = self.batch_size
+        if self.memory_budget is not None:
+            self.memory_budget.observe("store", batch.nbytes, len(batch))
+            batch_size = min(batch_size, self.memory_budget.rows("store"))
+        if self._buffered >= batch_size or time.monotonic() - self._buffered_since >= self.batch_interval:
+            self.flush(timed)
+
+    def flush(self, timed: bool = True):
+        """
+        Write all buffered values to the datastore. Iff `timed`, the
+        writes are timed as stage `store`.
+        """
+        if not self._batches:
+            return
+        batches, self._batches, self._buffered = self._batches, [], 0
+        batch = batches[0] if len(batches) == 1 else ObservationBatch.concat(batches)
+        with self.stats.stage("store") if timed else contextlib.nullcontext():
+            store_batch(self.datastore, batch)
+
+    def get_parsed_frame(self):
+        """
+        Get the data of the last `do_parse` call as `pandas.DataFrame` with
+        a `DatetimeIndex` and the (integer) positions as columns. Iff a parser
+        does not support this, `None` is returned.
+        """
+        return None
+
     @abstractmethod
     def do_parse(self):
         raise NotImplementedError
@@ -1,5 +1,7 @@
 from datetime import datetime
-from tsm_datastore_lib import Observation, SqlAlchemyDatastore
+
+import numpy as np
+from tsm_datastore_lib import SqlAlchemyDatastore
 from Parser.AbstractParser import AbstractParser
 from RawDataSource import AbstractRawDataSource
 
@@ -33,7 +35,12 @@ class AnotherCustomParser(AbstractParser):
 
         for n in range(0, self.demo_iterations):
             ts = datetime.now()
-            for i in range(0, self.demo_datastreams):
-                v = Observation(ts, 23, self.rawdata_source.src, i)
-                self.datastore.store_observations([v])
-                self.update_progress()
+            # one value per datastream, as columnar arrays
+            positions = np.arange(self.demo_datastreams)
+            self.emit(
+                timestamps=np.full(self.demo_datastreams, np.datetime64(ts, "ns")),
+                values=np.full(self.demo_datastreams, 23.),
+                positions=positions,
+            )
+            self.update_progress(self.demo_datastreams)
+        self.flush()
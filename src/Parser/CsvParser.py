@@ -1,17 +1,31 @@
 #! /usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from typing import Any, Dict, Iterator, List
-from io import BytesIO
+import collections
+import functools
+import hashlib
+import io
+import json
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
 
 import numpy as np
 import pandas as pd
 from tsm_datastore_lib.AbstractDatastore import AbstractDatastore
 
-from tsm_datastore_lib.Observation import Observation, NanNotAllowedHereError
 from tsm_datastore_lib.SqlAlchemyDatastore import SqlAlchemyDatastore
+from Datastore.ObservationBatch import ObservationBatch
+from Datastore.positions import get_positions
 from Parser.AbstractParser import AbstractParser
+from Parser.SchemaCache import SchemaCache
 from RawDataSource.AbstractRawDataSource import AbstractRawDataSource
+from RawDataSource.ArchiveRawDataSource import ArchiveRawDataSource
+from RawDataSource.BufferReader import open_buffer, open_chunks
+from RawDataSource.StreamingRawDataSource import StreamingRawDataSource
+from instrumentation import Stage
+from memory import frame_bytes
+from pipeline import Pipeline, QUEUE_SIZE
 
 """
 A basic CSV-Parser.
@@ -29,6 +43,34 @@ elements to those data structures.
 For a detailed description of all available parameters and their semantics, please
 refer to the pandas documentation:
 https://pandas.pydata.org/docs/reference/api/pandas.read_csv.html
+
+If a `schema_cache` is set, the schema of the first successfully parsed file
+(the column dtypes, the used columns and the timestamp column) is persisted and
+passed as `dtype` and `usecols` to `pandas.read_csv` on later runs, which skips
+the type inference of the columns, that held values, and the conversion of the
+unused columns. Used are the timestamp column, the columns, that are mapped to a
+datastream of the thing (see `Datastore.get_positions`), and the columns, that
+held values. The unused columns are added back as empty columns, so the positions
+of the others don't change. If the datastore can't tell the positions of its
+datastreams, all columns are used. The schema is bound to a fingerprint of the
+header lines, the number of columns, the positions of the datastreams and the
+parser parameters, so it is re-learned automatically, whenever one of those
+changes (e.g. a datastream is added for an unused column) or the data doesn't
+fit the schema.
+
+Single large files are split at line breaks after the header and the chunks are
+parsed concurrently in `workers` processes. Each chunk is prefixed with the header
+lines, only the last chunk skips the footer. The file is parsed serially, if it
+can't be split safely (e.g. multibyte line breaks as in 'utf-16'), or if the chunks
+would yield other column types than parsing the file as a whole.
+
+If `pipelined` is set, the raw data is read (or downloaded, for a
+`StreamingRawDataSource`), parsed and stored concurrently, see `pipeline.Pipeline`.
+The file is parsed in frames of `PIPELINE_CHUNK_ROWS` rows, as soon as they
+arrive. The column types are inferred per frame, so a column, that changes
+between numbers and text from one frame to the next fails the job, instead of
+storing other values than parsing the file as a whole would. Archives and files
+with a footer are not pipelined. The schema cache is not used.
 """
 
 # Need to be given in `AbstractDatastore.get_parser_parameters`
@@ -51,12 +93,38 @@ DEFAULT_SETTINGS = {
     "engine": "python",
 }
 
+# Single files larger than this are split and parsed concurrently, if `workers` > 1
+PARALLEL_THRESHOLD = 1024*1024*4
+# Window size to scan the raw data for line breaks and quotes
+SCAN_SIZE = 1024*1024
+# Archive members submitted to the worker pool, before the oldest is collected, per worker
+PENDING_MEMBERS = 2
+# Number of rows parsed at once, if `pipelined`
+PIPELINE_CHUNK_ROWS = 10000
+
 
 class CsvParser(AbstractParser):
     def __init__(
         self, rawdata_source: AbstractRawDataSource, datastore: AbstractDatastore
     ):
         super().__init__(rawdata_source, datastore)
+        # the parsed data for `get_parsed_frame`, None if it isn't kept,
+        # because it wouldn't fit into the `memory_budget`
+        self._frames: Optional[List[pd.DataFrame]] = []
+        self._timestamp_column: int = 0
+        # archive members, that couldn't be parsed: src -> error
+        self.failed_members: Dict[str, str] = {}
+        # set to reuse the learned schema of the files across runs
+        self.schema_cache: Optional[SchemaCache] = None
+        self.schema_counts = dict(hits=0, misses=0)
+        # positions of the datastreams of the thing, for the schema cache
+        self._positions: Optional[Set[int]] = None
+        # latest stored result time per position, values at or before it
+        # (minus `late_tolerance`) are skipped, see `Datastore.get_watermarks`
+        self.watermarks: Optional[Dict[int, pd.Timestamp]] = None
+        self.late_tolerance = pd.Timedelta(0)
+        # read, parse and store concurrently
+        self.pipelined = False
 
     @staticmethod
     def _prep_parser_kwargs(parser_kwargs: Dict[str, Any]) -> Dict[str, Any]:
@@ -82,17 +150,24 @@ class CsvParser(AbstractParser):
         return {**DEFAULT_SETTINGS, **parser_kwargs}
 
     @staticmethod
-    def _parse(data: bytes, parser_kwargs: Dict[str, Any]) -> pd.DataFrame:
+    def _parse(
+        data: Union[bytes, memoryview], parser_kwargs: Dict[str, Any], schema: Dict[str, Any] = None
+    ) -> pd.DataFrame:
         """
         Parse the given data string into a `DataFrame`
 
         Parameters
         ----------
         data:
-            string representation of the data to parse
+            bytes representation of the data to parse, or a buffer
+            holding it (e.g. `AbstractRawDataSource.getbuffer`), which
+            is read without copying
         parser_kwargs:
             parser parameters, will be 'translated', if necessary, and are
             passed to `pandas.read_csv`
+        schema:
+            a schema learned by `_learn_schema`, its `dtype` and `usecols`
+            are passed to `pandas.read_csv`, the unused columns are empty
 
         Returns
         -------
@@ -103,9 +178,19 @@ class CsvParser(AbstractParser):
         timestamp_column = kwargs.pop("timestamp_column")
         timestamp_format = kwargs.pop("timestamp_format")
         header = kwargs.pop("header") - 1
+        if schema is not None:
+            # (name, dtype) pairs, json would turn integer names into strings
+            kwargs["dtype"] = dict(schema["dtype"])
+            kwargs["usecols"] = schema.get("usecols")
 
         try:
-            df = pd.read_csv(BytesIO(data), header=header, **kwargs)
+            df = pd.read_csv(open_buffer(data), header=header, **kwargs)
+            if schema is not None:
+                columns, usecols = schema["columns"], schema.get("usecols")
+                if df.columns.tolist() != (columns if usecols is None else [columns[i] for i in usecols]):
+                    raise ValueError("the data has other columns than the schema")
+                if usecols is not None:
+                    df = df.reindex(columns=columns)
             df.iloc[:, timestamp_column] = pd.to_datetime(
                 df.iloc[:, timestamp_column], format=timestamp_format
             )
@@ -114,33 +199,576 @@ class CsvParser(AbstractParser):
 
         return df
 
+    @staticmethod
+    def _parse_with_schema(
+        data: Union[bytes, memoryview], parser_kwargs: Dict[str, Any], schema: Optional[Dict[str, Any]]
+    ) -> Tuple[pd.DataFrame, bool]:
+        """
+        Parse `data` with `schema`, or without it, if the data doesn't fit.
+
+        Returns
+        -------
+        parsed data and whether the schema was used
+        """
+        if schema is not None:
+            try:
+                return CsvParser._parse(data, parser_kwargs, schema), True
+            except (ValueError, TypeError) as e:
+                logging.warning(f"The data doesn't fit the cached schema, inferring it again: {e!r}")
+        return CsvParser._parse(data, parser_kwargs), False
+
+    @staticmethod
+    def _parse_member(
+        data: bytes, parser_kwargs: Dict[str, Any], schema: Optional[Dict[str, Any]]
+    ) -> Tuple[pd.DataFrame, bool, Stage]:
+        """
+        Same as `_parse_with_schema`, run in a worker process, which also
+        returns the time it took as stage `parse`.
+        """
+        stage = Stage("parse")
+        with stage:
+            data, used = CsvParser._parse_with_schema(data, parser_kwargs, schema)
+        return data, used, stage
+
+    @staticmethod
+    def _fingerprint(
+        data: Union[bytes, memoryview], parser_kwargs: Dict[str, Any], positions: Optional[Set[int]] = None
+    ) -> str:
+        """
+        Hash the header lines, the number of columns of the first data
+        line, the positions of the datastreams and the parser parameters.
+        """
+        digest = hashlib.sha256(json.dumps(parser_kwargs, sort_keys=True, default=str).encode())
+        if positions is not None:
+            digest.update(json.dumps(sorted(positions)).encode())
+        comment = parser_kwargs["comment"]
+        with io.TextIOWrapper(open_buffer(data), encoding=parser_kwargs["encoding"], newline="") as f:
+            for _ in range(parser_kwargs["header"]):
+                digest.update(f.readline().encode())
+            for line in f:
+                if line.strip() and not (comment and line.lstrip().startswith(comment)):
+                    digest.update(str(len(line.split(parser_kwargs["delimiter"]))).encode())
+                    break
+        return digest.hexdigest()
+
+    @staticmethod
+    def _learn_schema(
+        fingerprint: str, data: pd.DataFrame, parser_kwargs: Dict[str, Any], positions: Optional[Set[int]] = None
+    ) -> Dict[str, Any]:
+        """
+        Derive the schema of `data`: float and object columns, that hold at
+        least one value, are read with the dtype pandas inferred for them.
+        Empty columns are inferred on every run, they may hold other values
+        in later files. Empty columns, that aren't at one of the `positions`
+        of the datastreams, are skipped, unless `positions` is None.
+
+        Integer and boolean columns are still inferred on every run, the
+        python engine silently casts e.g. '0.5' to 0 or 'x' to True, if
+        those dtypes are given explicitly.
+        """
+        timestamp_column = parser_kwargs["timestamp_column"]
+        usecols = [
+            i for i, (_, values) in enumerate(data.items())
+            if positions is None or i == timestamp_column or i in positions or values.notna().any()
+        ]
+        return dict(
+            fingerprint=fingerprint,
+            columns=data.columns.tolist(),
+            usecols=None if len(usecols) == len(data.columns) else usecols,
+            timestamp_column=timestamp_column,
+            dtype=[
+                (name, values.dtype.name) for i, (name, values) in enumerate(data.items())
+                if i != timestamp_column and values.dtype.kind in "fO" and values.notna().any()
+            ],
+        )
+
+    def _lookup_schema(
+        self, data: Union[bytes, memoryview], parser_kwargs: Dict[str, Any]
+    ) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        if self.schema_cache is None:
+            return None, None
+        fingerprint = self._fingerprint(data, parser_kwargs, self._positions)
+        return fingerprint, self.schema_cache.get(fingerprint)
+
+    def _update_schema(
+        self, fingerprint: Optional[str], used: bool, data: pd.DataFrame, parser_kwargs: Dict[str, Any]
+    ):
+        if fingerprint is None:
+            return
+        if used:
+            self.schema_counts["hits"] += 1
+            return
+        self.schema_counts["misses"] += 1
+        if data.empty:
+            # nothing to learn from, but don't keep a schema, that didn't fit
+            if self.schema_cache.get(fingerprint) is not None:
+                self.schema_cache.invalidate()
+            return
+        if self.schema_cache.get(fingerprint) is None:
+            logging.info("Learned a new schema of the raw data")
+        self.schema_cache.put(self._learn_schema(fingerprint, data, parser_kwargs, self._positions))
+
+    @staticmethod
+    def _count(data: memoryview, start: int, stop: int, char: bytes) -> int:
+        """
+        Count `char` in data[start:stop], in windows of `SCAN_SIZE`,
+        to not copy the whole buffer at once.
+        """
+        return sum(
+            bytes(data[pos:min(pos + SCAN_SIZE, stop)]).count(char)
+            for pos in range(start, stop, SCAN_SIZE)
+        )
+
+    @staticmethod
+    def _find(data: memoryview, start: int, char: bytes) -> int:
+        """ Index of the first `char` at or after `start`, or -1. """
+        for pos in range(start, len(data), SCAN_SIZE):
+            if (i := bytes(data[pos:pos + SCAN_SIZE]).find(char)) >= 0:
+                return pos + i
+        return -1
+
+    @classmethod
+    def _split(
+        cls, data: memoryview, parser_kwargs: Dict[str, Any], chunks: int
+    ) -> Optional[Tuple[int, List[Tuple[int, int]]]]:
+        """
+        Split `data` into up to `chunks` chunks of whole lines after the
+        header.
+
+        Blank lines and comment lines are not counted as header lines, like
+        `pandas.read_csv` does. Line breaks within quoted fields are skipped
+        by tracking the parity of the quote characters.
+
+        Returns
+        -------
+        end of the header and the (start, stop) of the chunks, or None,
+        if the data can't be split
+        """
+        encoding = parser_kwargs["encoding"]
+        try:
+            newline, quote = "\n".encode(encoding), '"'.encode(encoding)
+            comment = (parser_kwargs["comment"] or "").encode(encoding)
+        except (LookupError, UnicodeError):
+            return None
+        if newline != b"\n" or quote != b'"':
+            # multibyte encodings can't be split at a single byte
+            return None
+
+        header_end, header = 0, parser_kwargs["header"]
+        while header > 0:
+            end = cls._find(data, header_end, newline)
+            if end < 0:
+                return None
+            line = bytes(data[header_end:end]).strip()
+            if line and not (comment and line.startswith(comment)):
+                header -= 1
+            header_end = end + 1
+
+        size = len(data) - header_end
+        ranges, start = [], header_end
+        for i in range(1, chunks):
+            stop = cls._find(data, max(start, header_end + size * i // chunks), newline)
+            quotes = cls._count(data, start, stop, quote) if stop >= 0 else 0
+            while stop >= 0 and quotes % 2:
+                # inside a quoted field
+                end = cls._find(data, stop + 1, newline)
+                quotes += cls._count(data, stop, end, quote)
+                stop = end
+            if stop < 0:
+                break
+            ranges.append((start, stop + 1))
+            start = stop + 1
+        ranges.append((start, len(data)))
+        ranges = [(a, b) for a, b in ranges if b > a]
+
+        if len(ranges) < 2:
+            return None
+        skipfooter = parser_kwargs["skipfooter"]
+        if skipfooter and cls._count(data, *ranges[-1], newline) <= skipfooter:
+            # the whole footer must be part of the last chunk
+            return None
+        return header_end, ranges
+
+    @staticmethod
+    def _concat_chunks(frames: List[pd.DataFrame]) -> Optional[pd.DataFrame]:
+        """
+        Concatenate the parsed chunks of a file, or return None, if the
+        result might differ from parsing the file as a whole.
+        """
+        filled = [df for df in frames if not df.empty]
+        if not filled:
+            return frames[0]
+        columns = filled[0].columns
+        if not all(df.columns.equals(columns) for df in filled):
+            return None
+        numbers = {np.dtype("int64"), np.dtype("float64")}
+        for i in range(len(columns)):
+            dtypes = {df.dtypes.iloc[i] for df in filled}
+            # e.g. a column of numbers in one chunk, but of strings in another
+            if len(dtypes) > 1 and not dtypes <= numbers:
+                return None
+        return pd.concat(filled, ignore_index=True)
+
+    def _parse_parallel(
+        self, data: memoryview, parser_kwargs: Dict[str, Any], schema: Optional[Dict[str, Any]]
+    ) -> Tuple[pd.DataFrame, bool]:
+        """
+        Same as `_parse_with_schema`, but the file is split into `workers`
+        chunks (see `_split`), which are parsed concurrently.
+        """
+        split = self._split(data, parser_kwargs, self.workers)
+        if split is None:
+            logging.info("The raw data can't be split, parsing it serially")
+            return self._parse_with_schema(data, parser_kwargs, schema)
+
+        header_end, ranges = split
+        header = bytes(data[:header_end])
+        with ProcessPoolExecutor(self.workers) as pool:
+            futures = []
+            for i, (start, stop) in enumerate(ranges):
+                kwargs = parser_kwargs
+                if i < len(ranges) - 1:
+                    kwargs = {**parser_kwargs, "skipfooter": 0}
+                chunk = header + bytes(data[start:stop])
+                futures.append(pool.submit(CsvParser._parse_with_schema, chunk, kwargs, schema))
+            results = [future.result() for future in futures]
+
+        frame = self._concat_chunks([df for df, _ in results])
+        if frame is None:
+            logging.info("The chunks of the raw data have different column types, parsing it serially")
+            return self._parse_with_schema(data, parser_kwargs, schema)
+        logging.debug(f"Parsed the raw data in {len(ranges)} chunks")
+        return frame, all(used for _, used in results)
+
+    @staticmethod
+    def _to_frame(data: pd.DataFrame, timestamp_column: int) -> pd.DataFrame:
+        frame = data.drop(columns=data.columns[timestamp_column])
+        frame.index = pd.DatetimeIndex(data.iloc[:, timestamp_column])
+        frame.columns = [i for i in range(len(data.columns)) if i != timestamp_column]
+        return frame
+
+    def _filter_stored(
+        self, data: pd.DataFrame, timestamp_column: int
+    ) -> Tuple[pd.DataFrame, Optional[np.ndarray]]:
+        """
+        Drop the values, that are not newer than the `watermarks` of their
+        position minus the `late_tolerance`, before any observation is built.
+
+        Returns
+        -------
+        the rows with at least one new value, and a boolean mask
+        (rows x columns) of the new values within those rows, or None,
+        if all their values are new
+        """
+        if self.watermarks is None or data.empty:
+            return data, None
+        timestamps = pd.DatetimeIndex(data.iloc[:, timestamp_column])
+        if timestamps.tz is not None:
+            # the watermarks are naive UTC
+            timestamps = timestamps.tz_convert("UTC").tz_localize(None)
+        cutoffs = np.full(len(data.columns), pd.Timestamp.min.to_datetime64())
+        for i, watermark in self.watermarks.items():
+            if i < len(cutoffs):
+                cutoffs[i] = (watermark - self.late_tolerance).to_datetime64()
+
+        keep = timestamps.values[:, np.newaxis] > cutoffs[np.newaxis, :]
+        keep[:, timestamp_column] = False
+        rows = keep.any(axis=1)
+        keep[:, timestamp_column] = True
+
+        skipped = len(rows) - int(rows.sum())
+        self.stats.info["skipped_rows"] = self.stats.info.get("skipped_rows", 0) + skipped
+        if skipped:
+            logging.info(f"Skipped {skipped} rows, that are already stored")
+            data, keep = data[rows], keep[rows]
+        return data, None if keep.all() else keep
+
+    def get_parsed_frame(self) -> Optional[pd.DataFrame]:
+        if self._frames is None:
+            return None
+        frames = [self._to_frame(df, self._timestamp_column) for df in self._frames if not df.empty]
+        if not frames:
+            return pd.DataFrame(index=pd.DatetimeIndex([]))
+        if len(frames) == 1:
+            return frames[0]
+        return pd.concat(frames).sort_index(kind="stable")
+
+    def _parse_members(self, parser_kwargs: Dict[str, Any]) -> Iterator[Tuple[str, pd.DataFrame]]:
+        """
+        Parse all files of the raw data source in order and yield their
+        `src` and the parsed data.
+
+        Only archives hold more than one file. Their members are parsed
+        concurrently by `workers` processes, members that fail to parse
+        are logged, skipped and recorded in `failed_members`. At most
+        `PENDING_MEMBERS` members per worker are extracted and waiting
+        for their result at once. The parse time of the workers is
+        recorded as stage `parse`, the time spent waiting for them as
+        stage `parse_wait`. Single large files are split into chunks,
+        which are parsed concurrently.
+        """
+        source = self.rawdata_source
+        stage = self.stats.stage("parse")
+
+        if not isinstance(source, ArchiveRawDataSource):
+            with stage:
+                buffer = source.getbuffer()
+                fingerprint, schema = self._lookup_schema(buffer, parser_kwargs)
+                if self.workers > 1 and len(buffer) >= PARALLEL_THRESHOLD:
+                    data, used = self._parse_parallel(buffer, parser_kwargs, schema)
+                else:
+                    data, used = self._parse_with_schema(buffer, parser_kwargs, schema)
+                self._update_schema(fingerprint, used, data, parser_kwargs)
+            stage.rows += len(data.index)
+            yield source.src, data
+            return
+
+        def failed(src: str, e: Exception):
+            logging.error(f'Parsing "{src}" failed: {e!r}')
+            self.failed_members[src] = repr(e)
+
+        if self.workers > 1:
+            wait = self.stats.stage("parse_wait")
+            with ProcessPoolExecutor(self.workers) as pool:
+                futures = collections.deque()
+                members = source.members()
+                while True:
+                    # keep the pool busy, without extracting the whole archive into memory
+                    while len(futures) < PENDING_MEMBERS * self.workers:
+                        if (member := next(members, None)) is None:
+                            break
+                        fingerprint, schema = self._lookup_schema(member.getbuffer(), parser_kwargs)
+                        future = pool.submit(CsvParser._parse_member, member.read(), parser_kwargs, schema)
+                        futures.append((member.src, fingerprint, future))
+                        member.close()
+                    if not futures:
+                        break
+                    src, fingerprint, future = futures.popleft()
+                    try:
+                        with wait:
+                            data, used, timed = future.result()
+                        stage.add(timed)
+                        self._update_schema(fingerprint, used, data, parser_kwargs)
+                    except Exception as e:
+                        failed(src, e)
+                        continue
+                    stage.rows += len(data.index)
+                    yield src, data
+        else:
+            for member in source.members():
+                try:
+                    with stage:
+                        fingerprint, schema = self._lookup_schema(member.getbuffer(), parser_kwargs)
+                        data, used = self._parse_with_schema(member.getbuffer(), parser_kwargs, schema)
+                        self._update_schema(fingerprint, used, data, parser_kwargs)
+                except Exception as e:
+                    failed(member.src, e)
+                    continue
+                stage.rows += len(data.index)
+                yield member.src, data
+
+        self.failed_members.update(source.failed)
+
+    @staticmethod
+    def _parse_stream(
+        chunks: Iterable, parser_kwargs: Dict[str, Any], chunk_rows: Callable[[], int] = None,
+    ) -> Iterator[pd.DataFrame]:
+        """
+        Parse the raw data from an iterable of chunks of bytes and yield
+        it in frames of up to `chunk_rows()` rows (default
+        `PIPELINE_CHUNK_ROWS`), with a running index. The size is asked
+        for before every frame, so it may change while parsing.
+
+        Raises
+        ------
+        ValueError
+            if the type of a column differs from the previous frames, see
+            `_check_dtypes`
+        """
+        kwargs = {**parser_kwargs}
+        timestamp_column = kwargs.pop("timestamp_column")
+        timestamp_format = kwargs.pop("timestamp_format")
+        header = kwargs.pop("header") - 1
+
+        try:
+            reader = pd.read_csv(open_chunks(chunks), header=header, iterator=True, **kwargs)
+        except pd.errors.EmptyDataError:
+            return
+        dtypes = {}
+        with reader:
+            while True:
+                try:
+                    df = reader.get_chunk(PIPELINE_CHUNK_ROWS if chunk_rows is None else chunk_rows())
+                except StopIteration:
+                    return
+                try:
+                    df.iloc[:, timestamp_column] = pd.to_datetime(
+                        df.iloc[:, timestamp_column], format=timestamp_format
+                    )
+                except IndexError:
+                    return
+                CsvParser._check_dtypes(dtypes, df)
+                yield df
+
+    @staticmethod
+    def _check_dtypes(dtypes: Dict[Any, np.dtype], df: pd.DataFrame):
+        """
+        Check, that the columns of `df` have the same types as in the
+        previous frames of the same file, given as `dtypes` (column ->
+        dtype), which is updated. Integers and floats are compatible,
+        columns without any value are compatible with every type.
+        """
+        numbers = {np.dtype("int64"), np.dtype("float64")}
+        for name, values in df.items():
+            if not values.notna().any():
+                continue
+            seen = dtypes.setdefault(name, values.dtype)
+            if values.dtype != seen and not {values.dtype, seen} <= numbers:
+                raise ValueError(
+                    f"column {name!r} is of type {values.dtype} from row {df.index[0]} on, but was "
+                    f"of type {seen} before, parse the file without pipelining"
+                )
+
+    def _pipeline_source(self, parser_kwargs: Dict[str, Any]) -> Optional[Tuple[str, Iterable]]:
+        """
+        The name of the first stage and the chunks of the raw data to
+        parse, or None, if the raw data can't be pipelined.
+        """
+        source = self.rawdata_source
+        if isinstance(source, ArchiveRawDataSource):
+            logging.info("Archives are not pipelined, parsing their files one by one")
+            return None
+        if parser_kwargs["skipfooter"]:
+            logging.info("Files with a footer are not pipelined, parsing the file at once")
+            return None
+        if isinstance(source, StreamingRawDataSource):
+            return "download", source.stream()
+        buffer = source.getbuffer()
+        return "read", (buffer[pos:pos + SCAN_SIZE] for pos in range(0, len(buffer), SCAN_SIZE))
+
+    def _parse_pipelined(self, name: str, chunks: Iterable, parser_kwargs: Dict[str, Any]):
+        """
+        Read, parse and store the raw data concurrently, the data is
+        the same as parsed by `_parse_members`.
+        """
+        timestamp_column = parser_kwargs["timestamp_column"]
+        origin = self.rawdata_source.src
+
+        budget = self.memory_budget
+        chunk_rows = None
+        if budget is not None:
+            # every queue and stage of the pipeline may hold a frame
+            chunk_rows = functools.partial(budget.rows, "read", parts=QUEUE_SIZE + 2)
+            self._frames = None
+
+        def parse(chunks: Iterator) -> Iterator[pd.DataFrame]:
+            stage = self.stats.stage("parse")
+            for data in self._parse_stream(chunks, parser_kwargs, chunk_rows):
+                stage.rows += len(data.index)
+                if budget is not None:
+                    budget.observe("read", frame_bytes(data), len(data.index))
+                yield data
+
+        def store(frames: Iterator[pd.DataFrame]) -> Iterator:
+            for data in frames:
+                data, keep = self._filter_stored(data, timestamp_column)
+                if self._frames is not None:
+                    # the skipped values of kept rows are no new data either
+                    self._frames.append(data if keep is None else data.where(keep))
+                self.set_progress_length(self.progress.total + len(data.index))
+                self._store(data, timestamp_column, origin, keep, timed=False)
+            self.flush(timed=False)
+            return iter(())
+
+        pipeline = Pipeline(self.stats)
+        pipeline.run((name, chunks), ("parse", parse), ("store", store))
+        report = pipeline.report
+        logging.info(
+            "Pipeline utilization: " + ", ".join(
+                f"{stage} {r['utilization']:.0%}" for stage, r in report["stages"].items()
+            ) + f", bottleneck: {report['bottleneck']}"
+        )
+
+    def _exceeds_budget(self, parser_kwargs: Dict[str, Any]) -> bool:
+        """
+        Whether the raw data, parsed at once, would likely take more than
+        the `read` share of the `memory_budget`. The number of rows is
+        estimated by the line breaks of the raw data.
+        """
+        budget = self.memory_budget
+        if budget is None or isinstance(self.rawdata_source, ArchiveRawDataSource) or parser_kwargs["skipfooter"]:
+            return False
+        buffer = self.rawdata_source.getbuffer()
+        rows = self._count(buffer, 0, len(buffer), b"\n")
+        return rows * budget.bytes_per_row["read"] > budget.share("read")
+
+    def _parse_chunked(self, parser_kwargs: Dict[str, Any]) -> Iterator[Tuple[str, pd.DataFrame]]:
+        """
+        Parse the raw data in frames, that fit into the `read` share of
+        the `memory_budget`, and yield them like `_parse_members`.
+        """
+        budget = self.memory_budget
+        buffer = self.rawdata_source.getbuffer()
+        chunks = (buffer[pos:pos + SCAN_SIZE] for pos in range(0, len(buffer), SCAN_SIZE))
+        stage = self.stats.stage("parse")
+        frames = self._parse_stream(chunks, parser_kwargs, lambda: budget.rows("read"))
+        while True:
+            with stage:
+                data = next(frames, None)
+            if data is None:
+                return
+            stage.rows += len(data.index)
+            budget.observe("read", frame_bytes(data), len(data.index))
+            yield self.rawdata_source.src, data
+
     def do_parse(self):
         parser_kwargs = self._prep_parser_kwargs(
             self.datastore.get_parser_parameters(self.name)
         )
-        content = self.rawdata_source.read()
-        data = self._parse(content, parser_kwargs)
         timestamp_column = parser_kwargs["timestamp_column"]
+        self._frames, self._timestamp_column = [], timestamp_column
+        self.failed_members = {}
+        self.schema_counts = dict(hits=0, misses=0)
+        if self.schema_cache is not None:
+            self._positions = get_positions(self.datastore)
 
-        self.set_progress_length(np.prod(data.shape))
+        if self.pipelined and (source := self._pipeline_source(parser_kwargs)) is not None:
+            self._parse_pipelined(*source, parser_kwargs)
+            return
 
-        for _, row in data.iterrows():
+        if self._exceeds_budget(parser_kwargs):
+            logging.info("The raw data exceeds the memory budget, parsing it in chunks")
+            self._frames = None
+            members = self._parse_chunked(parser_kwargs)
+        else:
+            members = self._parse_members(parser_kwargs)
 
-            timestamp = row.iloc[timestamp_column]
+        for src, data in members:
+            data, keep = self._filter_stored(data, timestamp_column)
+            if self._frames is not None:
+                # the skipped values of kept rows are no new data either
+                self._frames.append(data if keep is None else data.where(keep))
+            self.set_progress_length(self.progress.total + len(data.index))
+            self._store(data, timestamp_column, src, keep)
+        self.flush()
 
-            for i, value in enumerate(row):
-                if i == timestamp_column:
-                    continue
-                try:
-                    observation = Observation(
-                        timestamp=timestamp,
-                        value=value,
-                        position=i,
-                        origin=self.rawdata_source.src,
-                        header=data.columns[i]
-                    )
-                    self.datastore.store_observations([observation])
-                except NanNotAllowedHereError:
-                    pass
+        if self.schema_cache is not None:
+            self.stats.info["schema_cache"] = self.schema_counts
+        if self.failed_members:
+            self.stats.info["failed_members"] = self.failed_members
+            if not self._frames:
+                raise RuntimeError(f"all {len(self.failed_members)} files of the archive failed")
 
-            self.update_progress(len(row))
+    def _store(
+        self, data: pd.DataFrame, timestamp_column: int, origin: str, keep: np.ndarray = None, timed: bool = True
+    ):
+        """
+        Emit the values of `data` as one batch, only the values in `keep`
+        (rows x columns), if given. Iff `timed`, the writes are timed as
+        stage `store`, otherwise only the rows are counted.
+        """
+        if data.empty:
+            return
+        self.emit_batch(ObservationBatch.from_frame(data, timestamp_column, origin, keep), timed)
+        self.stats.stage("store").rows += len(data.index)
+        self.update_progress(len(data.index))
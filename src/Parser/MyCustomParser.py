@@ -1,5 +1,4 @@
-import tsm_datastore_lib
-# import numpy as np
+import numpy as np
 from datetime import datetime
 from Parser.AbstractParser import AbstractParser
 
@@ -10,18 +9,10 @@ class MyCustomParser(AbstractParser):
 
         # your custom numpy magic
         # dataset = np.loadtxt('path', dtype=np.str, delimiter=',')  # Read file
-        dataset = [{
-            "datetime": datetime.now(),
-            "value": 23,
-            "origin": self.rawdata_source.src,
-            "position": 42
-        }]
+        timestamps = np.array([datetime.now()], dtype="datetime64[ns]")
+        values = np.array([23.])
+        positions = np.array([42])
 
-        for item in dataset:
-            v = tsm_datastore_lib.Observation(
-                item["datetime"],
-                item["value"],
-                item["origin"],
-                item["position"]
-            )
-            self.datastore.store_observations([v])
+        # values are buffered and written in batches, `flush` writes the rest
+        self.emit(timestamps, values, positions, origin=self.rawdata_source.src)
+        self.flush()
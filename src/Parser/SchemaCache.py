@@ -0,0 +1,74 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import os
+import tempfile
+from typing import Any, Dict, Optional
+
+
+class SchemaCache:
+    """
+    Persist the schema of the raw data files of one device.
+
+    The schema is stored as JSON file ``<directory>/<key>.json`` together
+    with the `fingerprint` of the files it was learned from. A schema is
+    only returned for files with the same fingerprint, so a changed file
+    layout invalidates it automatically.
+
+    Parameters
+    ----------
+    directory:
+        directory of the cache files, created if missing
+    key:
+        name of the cache file, e.g. the device id
+    """
+
+    def __init__(self, directory: str, key: str):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"{key}.json")
+        self._schema: Optional[Dict[str, Any]] = None
+        self._loaded = False
+
+    def _load(self) -> Optional[Dict[str, Any]]:
+        if not self._loaded:
+            self._loaded = True
+            try:
+                with open(self.path) as f:
+                    self._schema = json.load(f)
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError) as e:
+                logging.warning(f'Ignoring unreadable schema cache "{self.path}": {e!r}')
+        return self._schema
+
+    def get(self, fingerprint: str) -> Optional[Dict[str, Any]]:
+        """ Get the cached schema, iff it was learned from files with `fingerprint`. """
+        schema = self._load()
+        if schema is None or schema.get("fingerprint") != fingerprint:
+            return None
+        return schema
+
+    def put(self, schema: Dict[str, Any]) -> None:
+        """ Replace the cached schema, `schema` needs a `fingerprint`. """
+        if "fingerprint" not in schema:
+            raise ValueError("a schema needs a fingerprint")
+        # write atomically, parallel jobs of the same device might read it
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(schema, f)
+            os.replace(tmp, self.path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        self._schema, self._loaded = schema, True
+
+    def invalidate(self) -> None:
+        """ Drop the cached schema. """
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+        self._schema, self._loaded = None, True
@@ -0,0 +1,215 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import csv
+import logging
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+from tsm_datastore_lib.AbstractDatastore import AbstractDatastore
+
+from Parser.AbstractParser import AbstractParser
+from RawDataSource.AbstractRawDataSource import AbstractRawDataSource
+
+"""
+A parser for binary table files in the Campbell Scientific TOB1 format.
+
+A TOB1 file starts with five ASCII header lines (comma separated, quoted):
+ 1. file format ("TOB1") and logger information
+ 2. field names
+ 3. field units
+ 4. field processing
+ 5. field data types (e.g. "ULONG", "IEEE4", "FP2")
+
+followed by fixed-length binary records. The records are mapped with
+`numpy.frombuffer` and a structured dtype, directly from the buffer of the
+raw data source, without parsing or copying them.
+
+The timestamp of a record is given by the fields `SECONDS` and `NANOSECONDS`,
+counted from the logger epoch 1990-01-01. All other fields are stored as
+observations, with the (0-based) index of the field as position, just like
+the columns of the `CsvParser`.
+
+All supported parser arguments are listed in `DEFAULT_SETTINGS`.
+"""
+
+# Optional arguments. If a `key` is not given in `AbstractDatastore.get_parser_parameters`,
+# the respective `value` is used.
+DEFAULT_SETTINGS = {
+    "seconds_field": "SECONDS",  # field holding the seconds since `epoch`
+    "nanoseconds_field": "NANOSECONDS",  # field holding the nanoseconds, or None
+    "epoch": "1990-01-01",  # origin of the timestamps
+}
+
+HEADER_LINES = 5
+
+# Upper bound of the size of the ASCII header, loggers with some hundred
+# fields have name and type lines of a few KiB each
+MAX_HEADER_SIZE = 1024 * 1024
+
+# TOB1 data type -> numpy dtype, FP2 needs an additional decoding step
+DTYPES = {
+    "IEEE4": "<f4",
+    "IEEE4L": "<f4",
+    "IEEE4B": ">f4",
+    "IEEE8": "<f8",
+    "IEEE8L": "<f8",
+    "IEEE8B": ">f8",
+    "FP2": ">u2",
+    "ULONG": "<u4",
+    "LONG": "<i4",
+    "UINT4": "<u4",
+    "INT4": "<i4",
+    "UINT2": "<u2",
+    "INT2": "<i2",
+    "BOOL": "<u1",
+    "BOOL2": "<u2",
+    "BOOL4": "<u4",
+}
+
+
+def decode_fp2(raw: np.ndarray) -> np.ndarray:
+    """
+    Decode the Campbell two byte floating point format.
+
+    Bit 15 is the sign, bits 14-13 the negative decimal exponent
+    and bits 12-0 the mantissa.
+    """
+    raw = raw.astype(np.uint16)
+    sign = np.where(raw & 0x8000, -1., 1.)
+    exponent = (raw >> 13) & 0x3
+    mantissa = raw & 0x1FFF
+    out = sign * mantissa / np.power(10., exponent)
+    out[raw == 0x1FFF] = np.inf
+    out[raw == 0x9FFF] = -np.inf
+    out[raw == 0x9FFE] = np.nan
+    return out
+
+
+class Tob1Parser(AbstractParser):
+    def __init__(
+        self, rawdata_source: AbstractRawDataSource, datastore: AbstractDatastore
+    ):
+        super().__init__(rawdata_source, datastore)
+        self._parsed = (pd.DatetimeIndex([]), {}, {})
+
+    @staticmethod
+    def _prep_parser_kwargs(parser_kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        if diff := parser_kwargs.keys() - DEFAULT_SETTINGS.keys():
+            raise TypeError(f"invalid argument(s): {diff}")
+        return {**DEFAULT_SETTINGS, **parser_kwargs}
+
+    @staticmethod
+    def _parse_header(buffer: memoryview) -> Tuple[List[str], List[str], int]:
+        """
+        Parse the ASCII header.
+
+        Returns
+        -------
+        field names, field data types and the offset of the first record
+        """
+        # only the header is copied, the records stay in the buffer
+        header = bytes(buffer[:MAX_HEADER_SIZE])
+        offset = 0
+        lines = []
+        for _ in range(HEADER_LINES):
+            end = header.find(b"\n", offset)
+            if end < 0:
+                raise ValueError(f"incomplete TOB1 header, no end of line in the first {len(header)} bytes")
+            lines.append(header[offset:end].decode("ascii").rstrip("\r"))
+            offset = end + 1
+        info, names, _, _, types = [next(csv.reader([line])) for line in lines]
+        if info[0] != "TOB1":
+            raise ValueError(f"not a TOB1 file, but {info[0]!r}")
+        if len(names) != len(types):
+            raise ValueError("number of field names and data types differ")
+        return names, types, offset
+
+    @staticmethod
+    def _make_dtype(names: List[str], types: List[str]) -> np.dtype:
+        fields = []
+        for name, t in zip(names, types):
+            if t.startswith("ASCII(") and t.endswith(")"):
+                fields.append((name, f"S{int(t[6:-1])}"))
+            elif t in DTYPES:
+                fields.append((name, DTYPES[t]))
+            else:
+                raise NotImplementedError(f"TOB1 data type {t!r} of field {name!r}")
+        return np.dtype(fields)
+
+    @classmethod
+    def _parse(
+        cls, buffer: memoryview, parser_kwargs: Dict[str, Any]
+    ) -> Tuple[pd.DatetimeIndex, Dict[int, np.ndarray], Dict[int, str]]:
+        """
+        Parse the TOB1 data in `buffer`.
+
+        The records are mapped zero-copy with `numpy.frombuffer`, so the
+        returned columns are views into `buffer`, except for fields, that
+        need decoding (FP2, ASCII).
+
+        Returns
+        -------
+        timestamps, the values and the names of all other fields by position
+        """
+        names, types, offset = cls._parse_header(buffer)
+        dtype = cls._make_dtype(names, types)
+        count, rest = divmod(len(buffer) - offset, dtype.itemsize)
+        if rest:
+            logging.warning(f"ignoring an incomplete record of {rest} bytes at the end of the file")
+        records = np.frombuffer(buffer, dtype=dtype, count=count, offset=offset)
+
+        seconds, nanoseconds = parser_kwargs["seconds_field"], parser_kwargs["nanoseconds_field"]
+        timestamps = pd.to_datetime(records[seconds], unit="s", origin=pd.Timestamp(parser_kwargs["epoch"]))
+        if nanoseconds is not None:
+            timestamps += pd.to_timedelta(records[nanoseconds], unit="ns")
+
+        columns, headers = {}, {}
+        for pos, (name, t) in enumerate(zip(names, types)):
+            if name in (seconds, nanoseconds):
+                continue
+            values = records[name]
+            if t == "FP2":
+                values = decode_fp2(values)
+            elif t.startswith("ASCII("):
+                values = np.char.decode(np.char.rstrip(values, b"\x00"), "ascii")
+            columns[pos], headers[pos] = values, name
+
+        return pd.DatetimeIndex(timestamps), columns, headers
+
+    def get_parsed_frame(self) -> pd.DataFrame:
+        timestamps, columns, _ = self._parsed
+        return pd.DataFrame(columns, index=timestamps)
+
+    def do_parse(self):
+        parser_kwargs = self._prep_parser_kwargs(
+            self.datastore.get_parser_parameters(self.name)
+        )
+        with self.stats.stage("parse") as stage:
+            timestamps, columns, headers = self._parsed = self._parse(
+                self.rawdata_source.getbuffer(), parser_kwargs
+            )
+            stage.rows += len(timestamps)
+
+        self.set_progress_length(len(timestamps))
+
+        # emit the values row by row, in chunks of whole records
+        positions = np.fromiter(columns, dtype=np.int64, count=len(columns))
+        names = np.array([headers[pos] for pos in positions], dtype=object)
+        store = self.stats.stage("store")
+        step = max(self.batch_size // max(len(positions), 1), 1)
+        for start in range(0, len(timestamps), step):
+            stop = min(start + step, len(timestamps))
+            values = pd.DataFrame({pos: values[start:stop] for pos, values in columns.items()})
+            take = values.notna().to_numpy()
+            rows, cols = np.nonzero(take)
+            self.emit(
+                timestamps=timestamps[start:stop].take(rows),
+                values=values.to_numpy(dtype=None if values.dtypes.nunique() <= 1 else object)[rows, cols],
+                positions=positions[cols],
+                headers=names[cols],
+            )
+            store.rows += stop - start
+            self.update_progress(stop - start)
+        self.flush()
@@ -4,6 +4,7 @@ from .AbstractParser import AbstractParser
 from .MyCustomParser import MyCustomParser
 from .AnotherCustomParser import AnotherCustomParser
 from .CsvParser import CsvParser
+from .Tob1Parser import Tob1Parser
 
 
 def get_parser(
@@ -1,5 +1,10 @@
+from __future__ import annotations
+
+import mmap
+import os
 import tempfile
 from abc import ABC, abstractmethod
+from typing import Iterator
 
 import humanfriendly
 
@@ -7,10 +12,20 @@ MAX_FILE_SIZE = 1000*1000*32  # Maximum file size is 32M
 
 
 class AbstractRawDataSource(ABC):
-    def __init__(self, src: str):
+    # Keep 32M in memory before writing to disk
+    SPOOL_MAX_SIZE = 1024*1024*32
+    max_file_size = MAX_FILE_SIZE
+    # Whether the content is kept on disk and memory-mapped, instead of being held
+    # in memory. Only those sources may be given a larger `max_file_size`.
+    mapped = False
+
+    def __init__(self, src: str, max_file_size: int | None = None):
         self.src: str = src
-        # Keep 32M in memory before writing to disk
-        self.temp_file: tempfile = tempfile.SpooledTemporaryFile(max_size=1024*1024*32)
+        if max_file_size is not None:
+            self.max_file_size = max_file_size
+        self.temp_file: tempfile = tempfile.SpooledTemporaryFile(max_size=self.SPOOL_MAX_SIZE)
+        self._view: memoryview | None = None
+        self._mmap: mmap.mmap | None = None
         self.fetch()
         self.check_max_file_size()
         # Rewind to the beginn of the file.
@@ -24,19 +39,68 @@ class AbstractRawDataSource(ABC):
     def check_max_file_size(self):
         """Check the fetched file for maximum file size nad raise exception when it is to large"""
         size = self.temp_file.tell()
-        if size > MAX_FILE_SIZE:
-            raise MaximumFileSizeError(size)
+        if size > self.max_file_size:
+            raise MaximumFileSizeError(size, self.max_file_size)
 
     def read(self):
         """Read the content of the raw data element"""
         return self.temp_file.read()
 
+    def members(self) -> Iterator[AbstractRawDataSource]:
+        """
+        Iterate over the raw data files of this source. Only archives
+        hold more than one file, all other sources just yield themselves.
+        """
+        yield self
+
+    def getbuffer(self) -> memoryview:
+        """
+        Get a read-only view of the content of the raw data element, without copying it.
+
+        If the content was rolled over to disk, the file is memory-mapped,
+        otherwise the view refers to the in-memory buffer. Use
+        `RawDataSource.open_buffer` to get a file object for the view.
+        The view stays valid until `close` is called.
+        """
+        if self._view is None:
+            self._view = self._getbuffer()
+        return self._view
+
+    def _getbuffer(self) -> memoryview:
+        # hint: SpooledTemporaryFile.fileno() would roll over to disk
+        file = self.temp_file._file
+        if not self.temp_file._rolled:
+            # BytesIO shares its buffer with the returned bytes, instead of
+            # copying it. Unlike BytesIO.getbuffer(), this doesn't lock the
+            # BytesIO, which then couldn't be closed while the view exists.
+            return memoryview(file.getvalue())
+        file.flush()
+        if os.fstat(file.fileno()).st_size == 0:
+            return memoryview(b"")  # empty files can't be mapped
+        self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        return memoryview(self._mmap)
+
+    def close(self):
+        """Release the buffer and remove the temporary file"""
+        try:
+            if self._view is not None:
+                self._view.release()
+                self._view = None
+            if self._mmap is not None:
+                self._mmap.close()
+                self._mmap = None
+            self.temp_file.close()
+        except BufferError:
+            # The buffer is still in use, e.g. by an array created from it.
+            # It is freed, when the last reference is gone.
+            pass
+
 
 class MaximumFileSizeError(Exception):
-    def __init__(self, size: int):
+    def __init__(self, size: int, limit: int = MAX_FILE_SIZE):
         self.size = size
         self.message = 'Maximum filesize ({}) exceeded: Current size is {}'.format(
-            humanfriendly.format_size(MAX_FILE_SIZE),
+            humanfriendly.format_size(limit),
             humanfriendly.format_size(self.size)
         )
         super().__init__(self.message)
\ No newline at end of file
@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import gzip
+import logging
+import tarfile
+import zipfile
+from typing import Dict, Iterator, List
+
+from RawDataSource.AbstractRawDataSource import AbstractRawDataSource, MAX_FILE_SIZE, MaximumFileSizeError
+from RawDataSource.BufferReader import open_buffer
+
+
+class BytesRawDataSource(AbstractRawDataSource):
+    """ Raw data, that is already in memory, e.g. a member of an archive. """
+
+    def __init__(self, src: str, data: bytes):
+        self.data = data
+        super().__init__(src)
+
+    def fetch(self):
+        pass
+
+    def check_max_file_size(self):
+        if len(self.data) > MAX_FILE_SIZE:
+            raise MaximumFileSizeError(len(self.data))
+
+    def read(self):
+        return self.data
+
+    def _getbuffer(self) -> memoryview:
+        return memoryview(self.data)
+
+
+class ArchiveRawDataSource(AbstractRawDataSource):
+    """
+    A zip or (compressed) tar archive of raw data files.
+
+    Wraps another raw data source, which holds the archive. The archive
+    itself is still available from `read` and `getbuffer`, the extracted
+    files are available from `members`, in the order of their names.
+
+    Use `ArchiveRawDataSource.wrap` to wrap a source only, if it holds an
+    archive.
+    """
+
+    def __init__(self, source: AbstractRawDataSource):
+        self.source = source
+        self.names: List[str] = []
+        # src of members, that couldn't be extracted -> error
+        self.failed: Dict[str, str] = {}
+        super().__init__(source.src)
+
+    @staticmethod
+    def may_be_archive(head: bytes) -> bool:
+        """ Whether the first 512 bytes `head` might belong to an archive. """
+        return head[:4] in (b"PK\x03\x04", b"PK\x05\x06") or head[257:262] == b"ustar" or head[:2] == b"\x1f\x8b"
+
+    @staticmethod
+    def is_archive(source: AbstractRawDataSource) -> bool:
+        head = bytes(source.getbuffer()[:512])
+        if head[:4] in (b"PK\x03\x04", b"PK\x05\x06"):
+            return True
+        if head[257:262] == b"ustar":
+            return True
+        if head[:2] == b"\x1f\x8b":
+            # a compressed tar, or just a single compressed file?
+            try:
+                with gzip.open(open_buffer(source.getbuffer())) as file:
+                    return file.read(512)[257:262] == b"ustar"
+            except (OSError, EOFError):
+                return False
+        return False
+
+    @classmethod
+    def wrap(cls, source: AbstractRawDataSource) -> AbstractRawDataSource:
+        return cls(source) if cls.is_archive(source) else source
+
+    def _open(self) -> zipfile.ZipFile | tarfile.TarFile:
+        fobj = open_buffer(self.source.getbuffer())
+        if zipfile.is_zipfile(fobj):
+            return zipfile.ZipFile(fobj)
+        fobj.seek(0)
+        return tarfile.open(fileobj=fobj, mode="r:*")
+
+    def fetch(self):
+        with self._open() as archive:
+            if isinstance(archive, zipfile.ZipFile):
+                names = [i.filename for i in archive.infolist() if not i.is_dir()]
+            else:
+                names = [i.name for i in archive.getmembers() if i.isfile()]
+        self.names = sorted(names)
+        logging.info(f'Found {len(self.names)} files in archive "{self.src}"')
+
+    def check_max_file_size(self):
+        self.source.check_max_file_size()
+
+    def read(self):
+        return self.source.read()
+
+    def _getbuffer(self) -> memoryview:
+        return self.source.getbuffer()
+
+    def members(self) -> Iterator[AbstractRawDataSource]:
+        """
+        Iterate over the files in the archive. Files, that can't be
+        extracted, are logged and skipped, see `failed`.
+        """
+        self.failed = {}
+        with self._open() as archive:
+            for name in self.names:
+                src = f"{self.src}#{name}"
+                try:
+                    data = self._extract(archive, name)
+                except (MaximumFileSizeError, zipfile.BadZipFile, tarfile.TarError, OSError, EOFError) as e:
+                    logging.error(f'Extracting "{src}" failed: {e!r}')
+                    self.failed[src] = repr(e)
+                    continue
+                yield BytesRawDataSource(src, data)
+
+    @staticmethod
+    def _extract(archive: zipfile.ZipFile | tarfile.TarFile, name: str) -> bytes:
+        if isinstance(archive, zipfile.ZipFile):
+            size = archive.getinfo(name).file_size
+        else:
+            size = archive.getmember(name).size
+        # check before extracting, to not blow up on zip-bombs
+        if size > MAX_FILE_SIZE:
+            raise MaximumFileSizeError(size)
+        if isinstance(archive, zipfile.ZipFile):
+            return archive.read(name)
+        return archive.extractfile(name).read()
+
+    def close(self):
+        super().close()
+        self.source.close()
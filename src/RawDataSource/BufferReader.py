@@ -0,0 +1,93 @@
+import io
+
+
+class BufferReader(io.RawIOBase):
+    """
+    Read-only file object over a buffer (e.g. a `memoryview` of a `mmap`).
+
+    Unlike ``io.BytesIO(buffer)``, this does not copy the buffer. Wrap
+    it in ``io.BufferedReader`` to pass it to functions expecting a
+    regular binary file, like `pandas.read_csv`.
+    """
+
+    def __init__(self, buffer):
+        super().__init__()
+        self._view = memoryview(buffer).cast("B")
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        n = min(len(b), len(self._view) - self._pos)
+        if n <= 0:
+            return 0
+        b[:n] = self._view[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        if offset < 0:
+            raise ValueError(f"negative seek position {offset}")
+        self._pos = offset
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+    def close(self) -> None:
+        self._view.release()
+        super().close()
+
+
+class ChunkReader(io.RawIOBase):
+    """
+    Read-only file object over an iterable of chunks of bytes (or buffers),
+    e.g. a download, that is still in progress.
+
+    The chunks are pulled from the iterable only, when they are read, so
+    the data is never held in memory as a whole.
+    """
+
+    def __init__(self, chunks):
+        super().__init__()
+        self._chunks = iter(chunks)
+        self._view = memoryview(b"")
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while not len(self._view):
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._view = memoryview(chunk).cast("B")
+        n = min(len(b), len(self._view))
+        b[:n] = self._view[:n]
+        self._view = self._view[n:]
+        return n
+
+
+def open_chunks(chunks) -> io.BufferedIOBase:
+    """
+    Get a binary file object for an iterable of chunks, see `ChunkReader`.
+    """
+    return io.BufferedReader(ChunkReader(chunks))
+
+
+def open_buffer(buffer) -> io.BufferedIOBase:
+    """
+    Get a binary file object for `buffer`, without copying it.
+    """
+    if isinstance(buffer, bytes):
+        # BytesIO shares the memory of immutable bytes
+        return io.BytesIO(buffer)
+    return io.BufferedReader(BufferReader(buffer))
@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import logging
+import mmap
+import os
+import urllib.parse
+import urllib.request
+
+import humanfriendly
+
+from RawDataSource.AbstractRawDataSource import AbstractRawDataSource, MaximumFileSizeError
+
+
+class FileRawDataSource(AbstractRawDataSource):
+    """
+    Raw data from a local file, given as path or `file://` URI.
+
+    The file is memory-mapped in place, instead of being copied
+    to a temporary file.
+    """
+    mapped = True
+
+    def __init__(self, src: str, max_file_size: int | None = None):
+        self.path: str = self.to_path(src)
+        self._file = None
+        super().__init__(src, max_file_size)
+
+    @staticmethod
+    def to_path(src: str) -> str:
+        parsed = urllib.parse.urlparse(src)
+        if parsed.scheme == "file":
+            return urllib.request.url2pathname(parsed.path)
+        return src
+
+    def fetch(self):
+        self._file = open(self.path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        if size:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        sz = humanfriendly.format_size(size)
+        logging.info(f'Mapped local raw data file "{self.path}". Size: {sz}')
+
+    def check_max_file_size(self):
+        size = 0 if self._mmap is None else len(self._mmap)
+        if size > self.max_file_size:
+            raise MaximumFileSizeError(size, self.max_file_size)
+
+    def read(self):
+        return bytes(self.getbuffer())
+
+    def _getbuffer(self) -> memoryview:
+        return memoryview(b"") if self._mmap is None else memoryview(self._mmap)
+
+    def close(self):
+        super().close()
+        if self._file is not None:
+            self._file.close()
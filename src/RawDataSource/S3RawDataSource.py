@@ -0,0 +1,161 @@
+import concurrent.futures
+import datetime
+import hashlib
+import hmac
+import logging
+import mmap
+import os
+import urllib.parse
+import urllib.request
+
+import humanfriendly
+
+from RawDataSource.AbstractRawDataSource import AbstractRawDataSource, MAX_FILE_SIZE, MaximumFileSizeError
+
+# Objects larger than this are fetched with parallel range requests
+RANGE_THRESHOLD = 1024*1024*8
+PART_SIZE = 1024*1024*4
+WORKERS = 8
+RETRIES = 3
+
+
+class S3RawDataSource(AbstractRawDataSource):
+    """
+    Raw data from an S3-compatible object store (e.g. MinIO), given as
+    ``s3://<bucket>/<key>``.
+
+    Large objects are fetched with parallel HTTP range requests directly
+    into a preallocated buffer.
+
+    The endpoint and the credentials are taken from the environment:
+
+     - ``S3_ENDPOINT_URL``: e.g. ``http://minio:9000``
+     - ``AWS_ACCESS_KEY_ID``, ``AWS_SECRET_ACCESS_KEY``: If not set,
+       the requests are sent unsigned.
+     - ``AWS_DEFAULT_REGION``: defaults to ``us-east-1``
+    """
+
+    def __init__(self, src: str, endpoint: str = None, part_size: int = PART_SIZE, workers: int = WORKERS):
+        parsed = urllib.parse.urlparse(src)
+        if parsed.scheme != "s3" or not parsed.netloc:
+            raise ValueError(f"expected an URI like 's3://<bucket>/<key>', not {src!r}")
+        endpoint = endpoint or os.environ.get("S3_ENDPOINT_URL", "https://s3.amazonaws.com")
+        # path-style addressing works with every S3-compatible store
+        path = urllib.parse.quote(f"/{parsed.netloc}/{parsed.path.lstrip('/')}", safe="/~")
+        self.url: str = endpoint.rstrip("/") + path
+        self.part_size = part_size
+        self.workers = workers
+        self.access_key = os.environ.get("AWS_ACCESS_KEY_ID")
+        self.secret_key = os.environ.get("AWS_SECRET_ACCESS_KEY")
+        self.region = os.environ.get("AWS_DEFAULT_REGION", "us-east-1")
+        self._size = 0
+        super().__init__(src)
+
+    def _request(self, method: str, headers: dict = None) -> urllib.request.Request:
+        headers = _sign(method, self.url, headers or {}, self.access_key, self.secret_key, self.region)
+        return urllib.request.Request(self.url, method=method, headers=headers)
+
+    def fetch(self):
+        with urllib.request.urlopen(self._request("HEAD")) as response:
+            self._size = int(response.headers["Content-Length"])
+            ranges = response.headers.get("Accept-Ranges") == "bytes"
+        if self._size > MAX_FILE_SIZE:
+            raise MaximumFileSizeError(self._size)
+        if not self._size:
+            return
+
+        self._mmap = mmap.mmap(-1, self._size)
+        view = memoryview(self._mmap)
+        if not ranges or self._size <= RANGE_THRESHOLD:
+            self._fetch_range(view, 0, self._size)
+        else:
+            parts = [(start, min(start + self.part_size, self._size))
+                     for start in range(0, self._size, self.part_size)]
+            with concurrent.futures.ThreadPoolExecutor(self.workers) as pool:
+                futures = [pool.submit(self._fetch_range, view, *part) for part in parts]
+                for future in concurrent.futures.as_completed(futures):
+                    # raise the first error
+                    future.result()
+        view.release()
+
+        sz = humanfriendly.format_size(self._size)
+        logging.info(f'Fetched object from "{self.src}". Size: {sz}')
+
+    def _fetch_range(self, view: memoryview, start: int, stop: int):
+        """ Fetch the bytes [start, stop) of the object into `view`. """
+        for attempt in range(1, RETRIES + 1):
+            pos = start
+            try:
+                request = self._request("GET", {"Range": f"bytes={start}-{stop - 1}"})
+                with urllib.request.urlopen(request) as response:
+                    if response.status != 206 and (start, stop) != (0, self._size):
+                        raise IOError(f"server ignored range request, status {response.status}")
+                    while pos < stop:
+                        n = response.readinto(view[pos:stop])
+                        if not n:
+                            raise IOError(f"incomplete read, got {pos - start} of {stop - start} bytes")
+                        pos += n
+                return
+            except IOError as e:
+                if attempt == RETRIES:
+                    raise
+                logging.warning(f"fetching bytes {start}-{stop - 1} of {self.src!r} failed ({e}), retrying")
+
+    def check_max_file_size(self):
+        if self._size > MAX_FILE_SIZE:
+            raise MaximumFileSizeError(self._size)
+
+    def read(self):
+        return bytes(self.getbuffer())
+
+    def _getbuffer(self) -> memoryview:
+        return memoryview(b"") if self._mmap is None else memoryview(self._mmap).toreadonly()
+
+
+def _hmac(key: bytes, msg: str) -> bytes:
+    return hmac.new(key, msg.encode(), hashlib.sha256).digest()
+
+
+def _sign(method: str, url: str, headers: dict, access_key: str, secret_key: str, region: str) -> dict:
+    """
+    Sign a request with AWS Signature Version 4, without signing the
+    payload. Iff no credentials are given, the headers are returned as is.
+    """
+    if not access_key or not secret_key:
+        return headers
+    parsed = urllib.parse.urlparse(url)
+    now = datetime.datetime.utcnow()
+    amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+    date = now.strftime("%Y%m%d")
+
+    headers = {
+        **{k.lower(): str(v).strip() for k, v in headers.items()},
+        "host": parsed.netloc,
+        "x-amz-content-sha256": "UNSIGNED-PAYLOAD",
+        "x-amz-date": amz_date,
+    }
+    signed_headers = ";".join(sorted(headers))
+    canonical_request = "\n".join([
+        method,
+        parsed.path or "/",
+        parsed.query,
+        "".join(f"{k}:{headers[k]}\n" for k in sorted(headers)),
+        signed_headers,
+        "UNSIGNED-PAYLOAD",
+    ])
+    scope = f"{date}/{region}/s3/aws4_request"
+    string_to_sign = "\n".join([
+        "AWS4-HMAC-SHA256",
+        amz_date,
+        scope,
+        hashlib.sha256(canonical_request.encode()).hexdigest(),
+    ])
+    key = _hmac(f"AWS4{secret_key}".encode(), date)
+    for part in [region, "s3", "aws4_request"]:
+        key = _hmac(key, part)
+    signature = hmac.new(key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+    headers["authorization"] = (
+        f"AWS4-HMAC-SHA256 Credential={access_key}/{scope}, "
+        f"SignedHeaders={signed_headers}, Signature={signature}"
+    )
+    return headers
@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import logging
+import urllib.request
+from typing import Iterator
+
+import humanfriendly
+
+from RawDataSource.AbstractRawDataSource import AbstractRawDataSource, MaximumFileSizeError
+
+CHUNK_SIZE = 1024*1024
+
+
+class StreamingRawDataSource(AbstractRawDataSource):
+    """
+    Raw data from an URL, that is downloaded while it is parsed.
+
+    Nothing is fetched on creation. `stream` yields the content in chunks
+    as it arrives, e.g. for a pipelined parser. `read` and `getbuffer`
+    still work for parsers, that need the whole content at once, they
+    download the rest of it first.
+    """
+    # the download is rolled over to disk and memory-mapped by `getbuffer`
+    mapped = True
+
+    def __init__(self, src: str, chunk_size: int = CHUNK_SIZE, max_file_size: int | None = None):
+        self.chunk_size = chunk_size
+        self._response = None
+        self._head = b""
+        self._streamed = False
+        self._downloaded = False
+        super().__init__(src, max_file_size)
+
+    def fetch(self):
+        # deferred until the content is requested
+        pass
+
+    def _open(self):
+        if self._response is None:
+            self._response = urllib.request.urlopen(self.src)
+        return self._response
+
+    def head(self, size: int = 512) -> bytes:
+        """ Peek at the first `size` bytes, without consuming them. """
+        if self._downloaded:
+            return bytes(self.getbuffer()[:size])
+        while len(self._head) < size:
+            chunk = self._open().read(size - len(self._head))
+            if not chunk:
+                break
+            self._head += chunk
+        return self._head[:size]
+
+    def stream(self) -> Iterator[bytes]:
+        """
+        Yield the content in chunks of up to `chunk_size` bytes. The
+        content can only be streamed once, unless it was downloaded
+        completely by `read` or `getbuffer` before.
+
+        Raises
+        ------
+        MaximumFileSizeError
+            as soon as more than the maximum file size was received
+        """
+        if self._downloaded:
+            view = self.getbuffer()
+            for pos in range(0, len(view), self.chunk_size):
+                yield view[pos:pos + self.chunk_size]
+            return
+        if self._streamed:
+            raise RuntimeError(f'"{self.src}" was already streamed')
+        self._streamed = True
+
+        size = 0
+        chunk, self._head = self._head, b""
+        response = self._open()
+        try:
+            while chunk or (chunk := response.read(self.chunk_size)):
+                size += len(chunk)
+                if size > self.max_file_size:
+                    raise MaximumFileSizeError(size, self.max_file_size)
+                yield chunk
+                chunk = b""
+        finally:
+            response.close()
+        logging.info(f'Streamed remote raw data file from "{self.src}". Size: {humanfriendly.format_size(size)}')
+
+    def _download(self):
+        if self._downloaded:
+            return
+        for chunk in self.stream():
+            self.temp_file.write(chunk)
+        self.check_max_file_size()
+        self.temp_file.seek(0)
+        self._downloaded = True
+
+    def read(self):
+        self._download()
+        return super().read()
+
+    def _getbuffer(self) -> memoryview:
+        self._download()
+        return super()._getbuffer()
+
+    def close(self):
+        super().close()
+        if self._response is not None:
+            self._response.close()
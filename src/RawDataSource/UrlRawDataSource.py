@@ -8,6 +8,8 @@ from RawDataSource.AbstractRawDataSource import AbstractRawDataSource
 
 
 class UrlRawDataSource(AbstractRawDataSource):
+    # the download is rolled over to disk and memory-mapped by `getbuffer`
+    mapped = True
 
     def fetch(self):
         with urllib.request.urlopen(self.src) as response:
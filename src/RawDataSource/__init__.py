@@ -1,2 +1,49 @@
+import urllib.parse
+from typing import Optional
+
 from .AbstractRawDataSource import AbstractRawDataSource
 from .UrlRawDataSource import UrlRawDataSource
+from .FileRawDataSource import FileRawDataSource
+from .S3RawDataSource import S3RawDataSource
+from .StreamingRawDataSource import StreamingRawDataSource
+from .ArchiveRawDataSource import ArchiveRawDataSource, BytesRawDataSource
+from .BufferReader import BufferReader, ChunkReader, open_buffer, open_chunks
+
+# URI scheme -> raw data source type, a plain path has no scheme
+SCHEMES = {
+    "http": UrlRawDataSource,
+    "https": UrlRawDataSource,
+    "ftp": UrlRawDataSource,
+    "file": FileRawDataSource,
+    "": FileRawDataSource,
+    "s3": S3RawDataSource,
+}
+
+
+def get_rawdata_source(
+        src: str, streaming: bool = False, max_mapped_size: Optional[int] = None
+) -> AbstractRawDataSource:
+    """
+    Get the raw data source for the URI `src`. Archives (zip, tar)
+    are detected by their content and wrapped in an `ArchiveRawDataSource`.
+
+    Iff `streaming` is set, URLs are not downloaded at once, but streamed
+    while they are parsed (see `StreamingRawDataSource`). Archives are
+    still downloaded completely.
+
+    Sources, that are kept on disk and memory-mapped (`mapped`), may be
+    up to `max_mapped_size`, if given, instead of `MAX_FILE_SIZE`.
+    """
+    scheme = urllib.parse.urlparse(src).scheme
+    try:
+        klass = SCHEMES[scheme]
+    except KeyError:
+        raise NotImplementedError(f"no raw data source for URI scheme {scheme!r}") from None
+    if streaming and klass is UrlRawDataSource:
+        source = StreamingRawDataSource(src, max_file_size=max_mapped_size)
+        if not ArchiveRawDataSource.may_be_archive(source.head(512)):
+            return source
+        return ArchiveRawDataSource.wrap(source)
+    if klass.mapped:
+        return ArchiveRawDataSource.wrap(klass(src, max_file_size=max_mapped_size))
+    return ArchiveRawDataSource.wrap(klass(src))
@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import annotations
+
+import dataclasses
+import json
+import logging
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Iterable, List, Set, Tuple
+
+import pandas as pd
+import tsm_datastore_lib
+
+import Datastore
+import metadata_cache
+import qaqc
+import qaqc_labels
+from instrumentation import JobStats
+from progress import LoggingProgressSink, ProgressReporter
+
+"""
+Run the QA/QC of many things again over a time range, e.g. after their
+QA/QC configuration changed.
+
+The range of every thing is split into slices, each slice of a thing is
+a `BackfillTask`. A task loads all observations of its slice plus the
+context window before it, runs the QA/QC configuration of the thing and
+uploads the quality labels of the slice only, so the slices of a thing
+are independent and are run concurrently by a pool of processes.
+
+Every finished task is appended to a checkpoint file (JSON lines). Tasks
+found in the checkpoint are skipped, so an interrupted backfill resumes
+where it stopped, when started again with the same things, range and
+slice length.
+"""
+
+
+@dataclasses.dataclass(frozen=True)
+class BackfillTask:
+    """ The QA/QC of the observations of a thing from `start` until `end`. """
+
+    thing: str
+    start: pd.Timestamp
+    end: pd.Timestamp
+
+    @property
+    def key(self) -> str:
+        return f"{self.thing}/{self.start.isoformat()}/{self.end.isoformat()}"
+
+
+def plan_tasks(things: Iterable[str], start: pd.Timestamp, end: pd.Timestamp, length: pd.Timedelta) -> List[BackfillTask]:
+    """
+    Split the range from `start` until `end` into slices of `length`
+    for every thing. The tasks are ordered by slice, then by thing, so
+    the things progress evenly.
+    """
+    if length <= pd.Timedelta(0):
+        raise ValueError("the slice length must be positive")
+    if end <= start:
+        raise ValueError(f"the end ({end}) must be after the start ({start})")
+    bounds = list(pd.date_range(start, end, freq=length))
+    if bounds[-1] < end:
+        bounds.append(end)
+    things = list(dict.fromkeys(things))
+    return [BackfillTask(thing, lo, hi) for lo, hi in zip(bounds[:-1], bounds[1:]) for thing in things]
+
+
+class Checkpoint:
+    """
+    Finished tasks, appended as JSON lines to `path`. Every line is
+    flushed to disk at once, a line cut off by a crash is ignored.
+    """
+
+    def __init__(self, path: str | None):
+        self.path = path
+        self.done: Set[str] = set()
+        if path and os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        self.done.add(json.loads(line)["task"])
+                    except (ValueError, KeyError):
+                        logging.warning(f"ignoring an invalid line of the checkpoint {path}")
+
+    def __contains__(self, task: BackfillTask) -> bool:
+        return task.key in self.done
+
+    def record(self, task: BackfillTask, result: dict) -> None:
+        self.done.add(task.key)
+        if not self.path:
+            return
+        with open(self.path, "a") as f:
+            f.write(json.dumps(dict(task=task.key, **result)) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def run_task(
+    target_uri: str, storage: str, task: BackfillTask,
+    metadata: Tuple[str | None, float] = (None, metadata_cache.DEFAULT_TTL),
+) -> dict:
+    """
+    Run a task, in a worker process. Returns its rows, labels, wall time and
+    the hits and misses of the metadata cache of the worker, which is shared
+    by all its tasks and configured by `metadata` (directory, ttl).
+    """
+    started = time.perf_counter()
+    cache = metadata_cache.shared(*metadata)
+    counts = dict(cache.counts)
+    datastore = Datastore.CachedDatastore(
+        tsm_datastore_lib.get_datastore(target_uri, uuid.UUID(task.thing)), cache, task.thing
+    )
+    try:
+        qaqc_labels.check_storage(datastore.session.bind, storage)
+        if not qaqc.has_qaqc_config(datastore):
+            logging.warning(f"Backfill: thing {task.thing} has no QA/QC configuration")
+            rows = labels = 0
+        else:
+            pipeline = qaqc.compile_qaqc_config(datastore)
+            config = pipeline.to_frame()
+            data = qaqc.get_range_data(datastore, config, task.start, task.end)
+            rows = qaqc.count_rows(data)
+            labels = 0
+            if rows:
+                result = qaqc.run_qaqc_config(data, pipeline)
+                labels = int(qaqc.upload_qc_labels(result, config, datastore, storage))
+    finally:
+        datastore.session.close()
+    return dict(
+        rows=rows, labels=labels, wall=time.perf_counter() - started,
+        metadata_hits=cache.counts["hits"] - counts["hits"],
+        metadata_misses=cache.counts["misses"] - counts["misses"],
+    )
+
+
+def run_backfill(
+    target_uri: str, tasks: List[BackfillTask], checkpoint: Checkpoint, stats: JobStats,
+    workers: int = 1, storage: str = "jsonb", progress_interval: float = 5.,
+    metadata: Tuple[str | None, float] = (None, metadata_cache.DEFAULT_TTL),
+) -> Dict[str, str]:
+    """
+    Run all `tasks`, that are not in the `checkpoint`, by `workers` processes
+    and record them in the checkpoint as they finish. Progress is reported
+    in tasks, the throughput in rows per second and the hit rate of the
+    metadata caches of the workers (see `run_task`) are part of the `stats`.
+
+    Returns the failed tasks: key -> error. They are not checkpointed, so
+    they are run again by the next backfill.
+    """
+    todo = [task for task in tasks if task not in checkpoint]
+    if len(todo) < len(tasks):
+        logging.info(f"Backfill: {len(tasks) - len(todo)} of {len(tasks)} tasks are done already")
+    progress = ProgressReporter("QA/QC backfill", LoggingProgressSink(unit="tasks"), progress_interval)
+    progress.set_length(len(todo))
+    summary = stats.info["backfill"] = dict(
+        tasks=len(tasks), skipped=len(tasks) - len(todo), done=0, failed=0, rows=0, labels=0,
+        metadata_hits=0, metadata_misses=0,
+    )
+    failed = {}
+    stage = stats.stage("backfill")
+    with stage, ProcessPoolExecutor(workers) as pool:
+        futures = {pool.submit(run_task, target_uri, storage, task, metadata): task for task in todo}
+        for future in as_completed(futures):
+            task = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                logging.error(f"Backfill: task {task.key} failed: {e!r}")
+                failed[task.key] = repr(e)
+                summary["failed"] += 1
+            else:
+                checkpoint.record(task, result)
+                summary["done"] += 1
+                summary["rows"] += result["rows"]
+                summary["labels"] += result["labels"]
+                summary["metadata_hits"] += result.get("metadata_hits", 0)
+                summary["metadata_misses"] += result.get("metadata_misses", 0)
+            progress.update()
+    progress.finish()
+    stage.rows += summary["rows"]
+    summary["rows_per_second"] = summary["rows"] / stage.wall if stage.wall else 0.
+    lookups = summary["metadata_hits"] + summary["metadata_misses"]
+    summary["metadata_hit_rate"] = round(summary["metadata_hits"] / lookups, 3) if lookups else 0.
+    return failed
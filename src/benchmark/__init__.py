@@ -0,0 +1,7 @@
+"""
+Benchmarks of the extractor.
+
+Run them from the `src` directory as modules, e.g.:
+
+    python -m benchmark.rawdata --help
+"""
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Measure the peak memory needed to access the content of a raw data source.
+
+Every case runs in a fresh process, so the peak RSS of one case doesn't
+influence the others. The reported `peak_rss` is the increase of the peak
+RSS over the baseline before fetching the source, `copies` relates it to
+the file size. So the data itself accounts for one copy.
+
+    python -m benchmark.rawdata --size 30M --spool 1M
+"""
+from __future__ import annotations
+
+import json
+import multiprocessing
+import sys
+
+import click
+import humanfriendly
+
+import RawDataSource
+from instrumentation import peak_rss
+from Parser.CsvParser import CsvParser
+
+CASES = ["read", "getbuffer", "parse-read", "parse-getbuffer"]
+PARSER_KWARGS = {
+    "header": 1,
+    "delimiter": ",",
+    "timestamp_column": 0,
+    "timestamp_format": "%Y-%m-%dT%H:%M:%S",
+    "engine": "c",
+}
+
+
+class SyntheticDataSource(RawDataSource.AbstractRawDataSource):
+    """ Write `size` bytes of CSV data, without holding them in memory. """
+
+    def __init__(self, size: int):
+        self.size = size
+        super().__init__(src="synthetic")
+
+    def fetch(self):
+        self.temp_file.write(b"timestamp,a,b,c\n")
+        line = b"2020-01-01T00:00:00,1.2345,2.3456,3.4567\n"
+        block = line * (1024 * 1024 // len(line))
+        while self.temp_file.tell() + len(block) <= self.size:
+            self.temp_file.write(block)
+        while self.temp_file.tell() + len(line) <= self.size:
+            self.temp_file.write(line)
+
+
+def _run(case: str, size: int, spool: int, queue: multiprocessing.Queue):
+    SyntheticDataSource.SPOOL_MAX_SIZE = spool
+    baseline = peak_rss()
+    source = SyntheticDataSource(size)
+
+    if case == "read":
+        # the former way: copy the content to bytes, then consume it
+        with RawDataSource.open_buffer(source.read()) as fobj:
+            while fobj.read(1024 * 1024):
+                pass
+    elif case == "getbuffer":
+        with RawDataSource.open_buffer(source.getbuffer()) as fobj:
+            while fobj.read(1024 * 1024):
+                pass
+    elif case == "parse-read":
+        CsvParser._parse(source.read(), PARSER_KWARGS)
+    elif case == "parse-getbuffer":
+        CsvParser._parse(source.getbuffer(), PARSER_KWARGS)
+
+    increase = peak_rss() - baseline
+    queue.put(dict(
+        case=case,
+        size=size,
+        rolled=source.temp_file._rolled,
+        peak_rss=increase,
+        copies=round(increase / size, 2),
+    ))
+    source.close()
+
+
+@click.command()
+@click.option("--size", default="30M", show_default=True, help="Size of the raw data file.")
+@click.option("--spool", default="32M", show_default=True,
+              help="Size up to which the raw data is kept in memory.")
+@click.option("--case", "cases", multiple=True, type=click.Choice(CASES), default=CASES,
+              show_default=True)
+def main(size, spool, cases):
+    """ Measure the peak memory of accessing raw data. """
+    size, spool = humanfriendly.parse_size(size), humanfriendly.parse_size(spool)
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+    for case in cases:
+        queue = ctx.Queue()
+        proc = ctx.Process(target=_run, args=(case, size, spool, queue))
+        proc.start()
+        results.append(queue.get())
+        proc.join()
+    json.dump(results, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import annotations
+
+import datetime
+import logging
+import struct
+from typing import List
+
+import numpy as np
+import pandas as pd
+import sqlalchemy
+from tsm_datastore_lib.SqlAlchemy.Model import Observation
+
+"""
+Read numeric observations from PostgreSQL with a binary COPY.
+
+`pandas.read_sql` builds a python tuple per row and a python object per
+value, before the frame is built. For numeric observations the result
+time, the result type and the number have a fixed width, so with
+``COPY (SELECT ...) TO STDOUT (FORMAT binary)`` every row of the output
+has the same layout. The output is decoded by numpy, as arrays of
+big-endian records, while it arrives: `CopyDecoder` collects it in
+chunks of `CHUNK_SIZE` bytes and keeps only the decoded columns.
+
+`read_numbers` returns None, whenever this doesn't apply: for other
+databases or drivers than PostgreSQL with psycopg2, queries with bound
+values, that can't be inlined safely, or observations with other values
+than numbers, which is checked by a query with ``EXISTS``, before the
+COPY. The callers fall back to `pandas.read_sql` then.
+"""
+
+SIGNATURE = b"PGCOPY\n\xff\r\n\x00"
+TRAILER = b"\xff\xff"
+
+# one row: number of fields, then length and value of every field
+ROW = np.dtype([
+    ("fields", ">i2"),
+    ("time_length", ">i4"), ("time", ">i8"),
+    ("type_length", ">i4"), ("type", ">i2"),
+    ("number_length", ">i4"), ("number", ">f8"),
+])
+FIELD_LENGTHS = {"time_length": 8, "type_length": 2, "number_length": 8}
+
+# the decoded columns of a row
+DECODED = np.dtype([("time", np.int64), ("type", np.int8), ("number", np.float64)])
+
+# bytes of the output, that are decoded at once
+CHUNK_SIZE = 1024 * 1024
+
+# postgres counts microseconds since 2000-01-01 UTC
+POSTGRES_EPOCH_US = 946684800 * 10**6
+
+# bound values of these types are inlined into the COPY statement
+INLINE_TYPES = (int, float, str, datetime.datetime, datetime.date)
+
+
+def _copy_statement(query):
+    """ The `query` selecting the fixed-width columns, NULL numbers become NaN. """
+    return query.with_entities(
+        sqlalchemy.cast(Observation.result_time, sqlalchemy.TIMESTAMP(timezone=True)),
+        sqlalchemy.cast(Observation.result_type, sqlalchemy.SmallInteger),
+        sqlalchemy.func.coalesce(
+            sqlalchemy.cast(Observation.result_number, sqlalchemy.Float(53)),
+            sqlalchemy.literal_column("'NaN'::float8"),
+        ),
+    ).statement
+
+
+def _has_other_types(query) -> bool:
+    """ Whether any observation of `query` holds another value than a number. """
+    observations = query.with_entities(Observation.result_type).subquery()
+    other = sqlalchemy.func.coalesce(observations.c.result_type, -1) != 0
+    return bool(query.session.query(sqlalchemy.exists().where(other)).scalar())
+
+
+class CopyDecoder:
+    """
+    File-like sink for ``cursor.copy_expert``, that decodes the output of
+    a binary COPY of `_copy_statement` in chunks of `chunk_size` bytes, as
+    it is written. Only the decoded columns (`DECODED`) are kept, get them
+    by `result`.
+    """
+
+    def __init__(self, chunk_size: int = CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self._pending = bytearray()
+        self._chunks: List[np.ndarray] = []
+        self._header = False
+        # set, when the output isn't a binary COPY or a row has another layout
+        self._error: str | None = None
+        self._other_layout = False
+
+    def write(self, data: bytes) -> int:
+        if self._error is None and not self._other_layout:
+            self._pending += data
+            if len(self._pending) >= self.chunk_size:
+                self._decode()
+        return len(data)
+
+    def _read_header(self) -> bool:
+        head = len(SIGNATURE) + 8
+        if len(self._pending) < head:
+            return False
+        if bytes(self._pending[:len(SIGNATURE)]) != SIGNATURE:
+            self._error = "not the output of a binary COPY"
+            return False
+        # flags, then the length of the header extension
+        extension, = struct.unpack(">i", self._pending[len(SIGNATURE) + 4:head])
+        if len(self._pending) < head + extension:
+            return False
+        del self._pending[:head + extension]
+        self._header = True
+        return True
+
+    def _decode(self) -> None:
+        if not self._header and not self._read_header():
+            return
+        count = len(self._pending) // ROW.itemsize
+        if not count:
+            return
+        rows = np.frombuffer(self._pending, dtype=ROW, count=count)
+        if (rows["fields"] != len(FIELD_LENGTHS)).any() or any(
+                (rows[name] != length).any() for name, length in FIELD_LENGTHS.items()):
+            # e.g. NULLs, the rest of the output can't be aligned anymore
+            self._other_layout = True
+        else:
+            chunk = np.empty(count, dtype=DECODED)
+            for name in DECODED.names:
+                chunk[name] = rows[name]
+            self._chunks.append(chunk)
+        # the view must be released, before the pending bytes can be dropped
+        del rows
+        if self._other_layout:
+            self._pending.clear()
+        else:
+            del self._pending[:count * ROW.itemsize]
+
+    def result(self) -> np.ndarray | None:
+        """
+        The decoded rows, or None, if a row has another layout (NULLs).
+
+        Raises
+        ------
+        ValueError
+            if the output isn't a complete binary COPY
+        """
+        if self._error is None and not self._other_layout:
+            self._decode()
+        if self._error is not None or not (self._header or self._other_layout):
+            raise ValueError(self._error or "not the output of a binary COPY")
+        if self._other_layout:
+            return None
+        if bytes(self._pending) != TRAILER:
+            if bytes(self._pending[-len(TRAILER):]) == TRAILER:
+                return None  # the last rows have another layout
+            raise ValueError("the output of the binary COPY is incomplete")
+        if not self._chunks:
+            return np.empty(0, dtype=DECODED)
+        return self._chunks[0] if len(self._chunks) == 1 else np.concatenate(self._chunks)
+
+
+def decode(buffer: bytes | memoryview) -> np.ndarray | None:
+    """
+    Decode the output of a binary COPY of `_copy_statement` to an array
+    of `DECODED` records, or None, if a row has another layout (NULLs).
+    """
+    decoder = CopyDecoder()
+    decoder.write(buffer)
+    return decoder.result()
+
+
+def to_frame(rows: np.ndarray) -> pd.DataFrame:
+    """ Frame of decoded rows, like `pandas.read_sql` returns it for numbers. """
+    index = pd.DatetimeIndex(
+        pd.to_datetime((rows["time"].astype(np.int64) + POSTGRES_EPOCH_US) * 1000, utc=True),
+        name="result_time",
+    )
+    return pd.DataFrame({
+        "result_type": rows["type"].astype(np.int8),
+        "result_number": rows["number"].astype(np.float64),
+    }, index=index)
+
+
+def read_numbers(query) -> pd.DataFrame | None:
+    """
+    Read the observations of `query` with a binary COPY, iff all of them
+    are numbers. Returns None, if the COPY can't be used, see the module.
+    """
+    session = query.session
+    dialect = session.bind.dialect
+    if dialect.name != "postgresql" or dialect.driver != "psycopg2":
+        return None
+    compiled = _copy_statement(query).compile(dialect=dialect, compile_kwargs={"render_postcompile": True})
+    params = compiled.params
+    if not all(v is None or isinstance(v, INLINE_TYPES) for v in params.values()):
+        return None
+    if _has_other_types(query):
+        logging.debug("not only numbers, reading the observations with read_sql")
+        return None
+
+    decoder = CopyDecoder()
+    cursor = session.connection().connection.cursor()
+    try:
+        select = cursor.mogrify(str(compiled), params).decode()
+        cursor.copy_expert(f"COPY ({select}) TO STDOUT (FORMAT binary)", decoder)
+    finally:
+        cursor.close()
+    rows = decoder.result()
+    # other values may have been written since the check
+    if rows is None or (rows["type"] != 0).any():
+        logging.debug("the binary COPY returned other values than numbers, reading the observations again")
+        return None
+    return to_frame(rows)
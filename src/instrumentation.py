@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import annotations
+
+import contextlib
+import cProfile
+import json
+import logging
+import resource
+import sys
+import time
+
+
+def peak_rss() -> int:
+    """ Peak resident set size of the current process in bytes. """
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes, macOS bytes
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+class Stage:
+    """
+    Accumulating timer for one stage of a job.
+
+    A stage can be entered multiple times, e.g. once per batch
+    in a loop, wall time and CPU time are summed up over all calls.
+    Rows are counted by the caller via ``stage.rows += n``.
+
+    The peak RSS of the process is sampled, when the stage is exited:
+    `peak_rss` is the peak reached until the end of the stage and
+    `rss_growth` the amount, by which the peak grew within the stage,
+    i.e. the memory, the stage needed beyond the earlier stages.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.wall = 0.
+        self.cpu = 0.
+        self.rows = 0
+        self.calls = 0
+        self.peak_rss = 0
+        self.rss_growth = 0
+        self._wall = self._cpu = 0.
+        self._rss = 0
+
+    def __enter__(self) -> Stage:
+        self._rss = peak_rss()
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.wall += time.perf_counter() - self._wall
+        self.cpu += time.process_time() - self._cpu
+        self.calls += 1
+        rss = peak_rss()
+        self.peak_rss = max(self.peak_rss, rss)
+        self.rss_growth += rss - self._rss
+
+    def add(self, other: Stage) -> None:
+        """
+        Add the times, rows and calls of `other`, e.g. of a stage timed
+        in a worker process. Its RSS is left out, it is another process.
+        """
+        self.wall += other.wall
+        self.cpu += other.cpu
+        self.rows += other.rows
+        self.calls += other.calls
+
+    def to_dict(self) -> dict:
+        return dict(
+            wall=self.wall,
+            cpu=self.cpu,
+            rows=self.rows,
+            calls=self.calls,
+            peak_rss=self.peak_rss,
+            rss_growth=self.rss_growth,
+        )
+
+
+class JobStats:
+    """
+    Collect per-stage wall time, CPU time, rows and peak RSS of a job.
+
+    Examples
+    --------
+    >>> stats = JobStats("parse", thing_uuid="...")
+    >>> with stats.stage("download"):
+    ...     source = UrlRawDataSource(uri)
+    >>> with stats.stage("parse") as stage:
+    ...     df = parse(source)
+    ...     stage.rows += len(df)
+    >>> stats.summary()
+    """
+
+    def __init__(self, job: str, **info):
+        self.job = job
+        self.info = info
+        self.stages: dict[str, Stage] = {}
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+
+    def stage(self, name: str) -> Stage:
+        """ Get (or create) the stage `name`. """
+        if (stage := self.stages.get(name)) is None:
+            stage = self.stages[name] = Stage(name)
+        return stage
+
+    def summary(self) -> dict:
+        """ Get the stats as json-serializable dict. """
+        return dict(
+            job=self.job,
+            **self.info,
+            wall=time.perf_counter() - self._wall,
+            cpu=time.process_time() - self._cpu,
+            peak_rss=peak_rss(),
+            stages={name: stage.to_dict() for name, stage in self.stages.items()},
+        )
+
+    def log(self, level: int = logging.INFO) -> dict:
+        """ Log the summary as one JSON-message and return it. """
+        summary = self.summary()
+        logging.log(level, json.dumps(summary))
+        return summary
+
+
+@contextlib.contextmanager
+def profiled(path: str | None):
+    """
+    Profile the enclosed block with cProfile and write
+    the stats to `path` (see `pstats`). Iff `path` is `None`,
+    do nothing.
+    """
+    if path is None:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+        logging.info(f"written profile to {path!r}")
@@ -4,18 +4,32 @@ import json
 import logging
 import os
 import sys
+import uuid
 import warnings
 
 import click
+import humanfriendly
+import pandas as pd
 import tsm_datastore_lib
 from sqlalchemy.exc import SAWarning
 
+import Datastore
 import Parser
+from Parser.SchemaCache import SchemaCache
 import RawDataSource
 from RawDataSource import AbstractRawDataSource
+from RawDataSource.AbstractRawDataSource import MAX_FILE_SIZE
 from tsm_datastore_lib.AbstractDatastore import AbstractDatastore
 import qaqc
+import qaqc_cache
+import qaqc_shards
+import qaqc_labels
 import mqtt_logging
+import progress
+import instrumentation
+import backfill
+import memory
+import metadata_cache
 import contextlib
 
 import paho.mqtt as mqtt
@@ -93,10 +107,116 @@ option_target_uri = click.option(
 )
 option_source_uri = click.option(
     '-s', '--source', 'source_uri',
-    help='URI of the raw data file to parse. Example: '
+    help='URI of the raw data file to parse. The scheme selects the raw data '
+         'source type: http(s)://, s3://<bucket>/<key>, file:// or a plain path. Example: '
          'https://example.com/minio/f8964b34-d38f-11eb-adae-125e5a40a845',
     required=True, type=str,
 )
+option_progress_interval = click.option(
+    '--progress-interval', 'progress_interval',
+    help='Minimum number of seconds between two progress reports.',
+    default=5., show_default=True, type=float,
+    show_envvar=True,
+    envvar='PROGRESS_INTERVAL',
+)
+option_profile = click.option(
+    '--profile', 'profile',
+    help='Profile the job with cProfile and write the stats to the given '
+         'file. Inspect it with the `pstats` module or e.g. snakeviz.',
+    default=None, type=click.Path(dir_okay=False, writable=True),
+)
+option_qaqc_cache = click.option(
+    '--qaqc-cache', 'qaqc_cache_dir',
+    help='Directory to cache the results of QA/QC tests on blocks of data. '
+         'Unchanged blocks are not tested again. Only the functions given '
+         'by --qaqc-cache-functions are cached.',
+    default=None, type=click.Path(file_okay=False, writable=True),
+    show_envvar=True,
+    envvar='QAQC_CACHE_DIR',
+)
+option_qaqc_cache_size = click.option(
+    '--qaqc-cache-size', 'qaqc_cache_size',
+    help='Maximum size of the QA/QC cache, e.g. 256M. The least recently '
+         'used results are evicted first.',
+    default='256M', show_default=True,
+    callback=lambda ctx, param, value: humanfriendly.parse_size(value),
+    show_envvar=True,
+    envvar='QAQC_CACHE_SIZE',
+)
+option_qaqc_shards = click.option(
+    '--qaqc-shards', 'qaqc_shards',
+    help='Number of processes to run a QA/QC test on a long series in '
+         'parallel, split into time ranges, that overlap by the window of '
+         'the test. Only the functions given by --qaqc-shard-functions are '
+         'sharded. 1 runs every test sequentially.',
+    default=1, show_default=True, type=click.IntRange(min=1),
+    show_envvar=True,
+    envvar='QAQC_SHARDS',
+)
+option_qaqc_shard_functions = click.option(
+    '--qaqc-shard-functions', 'qaqc_shard_functions',
+    help='Comma separated SaQC functions, that may run on shards, each with '
+         'its window as time offset or name of its window argument, like '
+         '--qaqc-cache-functions. Example: flagRange,flagMAD=window',
+    default='', show_envvar=True,
+    envvar='QAQC_SHARD_FUNCTIONS',
+)
+option_qaqc_shard_verify = click.option(
+    '--qaqc-shard-verify', 'qaqc_shard_verify',
+    help='Run every sharded test sequentially as well and compare the '
+         'flags. Differences are logged and the sequential flags are kept.',
+    is_flag=True,
+    show_envvar=True,
+    envvar='QAQC_SHARD_VERIFY',
+)
+option_metadata_cache = click.option(
+    '--metadata-cache', 'metadata_cache_dir',
+    help="Directory to cache the metadata of things (QA/QC configuration, "
+         "parser parameters, datastreams) in, so later jobs of a thing don't "
+         "query it again. Without it, the metadata is only cached per job.",
+    default=None, type=click.Path(file_okay=False, writable=True),
+    show_envvar=True,
+    envvar='METADATA_CACHE_DIR',
+)
+option_metadata_ttl = click.option(
+    '--metadata-ttl', 'metadata_ttl',
+    help="How long cached metadata is valid, e.g. '5min'. A message on the "
+         f"MQTT topic '{metadata_cache.CONFIG_CHANGED_TOPIC}' invalidates the "
+         "metadata of a thing earlier, as does a change of the thing in the database.",
+    default='5min', show_default=True, callback=lambda ctx, param, value: parse_timedelta(value),
+    show_envvar=True,
+    envvar='METADATA_TTL',
+)
+option_memory_budget = click.option(
+    '--memory-budget', 'memory_budget',
+    help="Bound the memory of the job's batches, e.g. 512M, or 'auto' for "
+         "75% of the memory limit of the container. Chunks of raw data, "
+         "buffered values, pages read from the database and QA/QC slices "
+         "are sized from the measured bytes per row to fit into it. Local "
+         "files and downloads may be as large as the budget.",
+    default=None, callback=lambda ctx, param, value: parse_memory_budget(value),
+    show_envvar=True,
+    envvar='MEMORY_BUDGET',
+)
+option_label_storage = click.option(
+    '--label-storage', 'label_storage',
+    help="Where to store the quality labels: 'jsonb' writes them to the "
+         "column observation.result_quality, 'normalized' stores every "
+         "distinct test once and a compact flag per observation (tables of "
+         "postgres/postgres-quality-labels.sql). PostgreSQL only.",
+    default='jsonb', show_default=True, type=click.Choice(qaqc_labels.LABEL_STORAGES),
+    show_envvar=True,
+    envvar='LABEL_STORAGE',
+)
+option_qaqc_cache_functions = click.option(
+    '--qaqc-cache-functions', 'qaqc_cache_functions',
+    help='Comma separated SaQC functions, whose results may be cached, each '
+         'with the margin of data it needs around a value, as time offset or '
+         'name of its window argument. Only for deterministic functions, that '
+         'are local to that margin. Example: flagRange,flagMAD=window,flagConstants=2h',
+    default='', show_envvar=True,
+    envvar='QAQC_CACHE_FUNCTIONS',
+)
 
 
 @cli.command()
@@ -111,31 +231,165 @@ option_source_uri = click.option(
 @option_mqtt_broker
 @option_mqtt_usr
 @option_mqtt_pwd
+@option_progress_interval
+@option_profile
+@option_qaqc_cache
+@option_qaqc_cache_size
+@option_qaqc_cache_functions
+@option_qaqc_shards
+@option_qaqc_shard_functions
+@option_qaqc_shard_verify
+@option_metadata_cache
+@option_metadata_ttl
+@option_memory_budget
+@option_label_storage
+@click.option(
+    '--run-qaqc', 'chain_qaqc',
+    help="Run the QA/QC configuration of the thing right after the data "
+         "was stored. The new data is taken from the parsed data, only the "
+         "context window and other unprocessed data are loaded from the datastore.",
+    is_flag=True,
+    show_envvar=True,
+    envvar='RUN_QAQC',
+)
+@click.option(
+    '--upsert', 'upsert',
+    help="Store the observations idempotently: observations, that already "
+         "exist for a datastream and result time, are updated instead of "
+         "inserted a second time. PostgreSQL only.",
+    is_flag=True,
+    show_envvar=True,
+    envvar='UPSERT',
+)
+@click.option(
+    '--spool-dir', 'spool_dir',
+    help="Directory to spool the parsed observations to, before they are "
+         "written to the datastore in the background. Parsing isn't slowed "
+         "down by the datastore then, and observations, that couldn't be "
+         "written, are written by the next job of the device. Implies --upsert.",
+    default=None, type=click.Path(file_okay=False, writable=True),
+    show_envvar=True,
+    envvar='SPOOL_DIR',
+)
+@click.option(
+    '-w', '--workers', 'workers',
+    help="Number of processes the parser may use, e.g. to parse the files "
+         "of an archive or the chunks of a large CSV file concurrently.",
+    default=1, show_default=True, type=click.IntRange(min=1),
+    show_envvar=True,
+    envvar='PARSER_WORKERS',
+)
+@click.option(
+    '--schema-cache', 'schema_cache',
+    help="Directory to persist the schema (column types, used columns) "
+         "of the raw data per device. Later runs reuse it instead of "
+         "inferring it again. Supported by the CsvParser.",
+    default=None, type=click.Path(file_okay=False, writable=True),
+    show_envvar=True,
+    envvar='SCHEMA_CACHE_DIR',
+)
+@click.option(
+    '--skip-stored', 'skip_stored',
+    help="Query the latest stored observation of every datastream first, "
+         "and skip all values, that are not newer. Cheap for loggers, that "
+         "resend overlapping data. Supported by the CsvParser.",
+    is_flag=True,
+    show_envvar=True,
+    envvar='SKIP_STORED',
+)
+@click.option(
+    '--late-tolerance', 'late_tolerance',
+    help="With --skip-stored, still store values, that are at most this "
+         "much older than the latest stored observation, e.g. '1h'.",
+    default='0s', show_default=True, callback=lambda ctx, param, value: parse_timedelta(value),
+    show_envvar=True,
+    envvar='LATE_TOLERANCE',
+)
+@click.option(
+    '--pipelined', 'pipelined',
+    help="Download, parse and store the data concurrently, connected by "
+         "bounded queues, instead of one after another. The utilization "
+         "of every stage is part of the job statistics. Supported by the "
+         "CsvParser for single files without a footer.",
+    is_flag=True,
+    show_envvar=True,
+    envvar='PIPELINED',
+)
 def parse(parser_type, target_uri, source_uri, device_id, mqtt_broker, mqtt_user,
-          mqtt_password):
+          mqtt_password, progress_interval, profile, qaqc_cache_dir, qaqc_cache_size,
+          qaqc_cache_functions, qaqc_shards, qaqc_shard_functions, qaqc_shard_verify, metadata_cache_dir,
+          metadata_ttl, memory_budget, label_storage, chain_qaqc, upsert, spool_dir, workers, schema_cache,
+          skip_stored, late_tolerance, pipelined):
     """Parse data of a raw data source to a data store."""
 
     if check_mqtt_params(mqtt_broker, mqtt_user, mqtt_password):
         mqtt_logging.setup('extractor', mqtt_broker, mqtt_user, mqtt_password, device_id)
         client = setup_mqtt_client(mqtt_broker, mqtt_user, mqtt_password)
+        progress_sink = progress.MqttProgressSink(client, topic=f"progress/{device_id}")
     else:
         client = _DummyClient()
-
-    with log_on_error(f"Parser: loading datastore failed"):
-        datastore = load_datastore(target_uri, device_id)
-    with log_on_error(f"Parser: loading source file failed"):
-        source = RawDataSource.UrlRawDataSource(source_uri)
-    with log_on_error(f"Parser: loading parser failed"):
-        parser = load_parser(parser_type, source, datastore)
-    with log_on_error(f"Parser: parsing with parser={parser_type!r} failed"):
-        parser.do_parse()
-        datastore.finalize()
-    logging.info("Parser: successfully parsed data")
-
-    # inform the broker, that parsing is done.
+        progress_sink = progress.LoggingProgressSink()
+
+    stats = instrumentation.JobStats('parse', thing_uuid=str(device_id), parser=parser_type)
+    with instrumentation.profiled(profile):
+        with log_on_error(f"Parser: loading datastore failed"):
+            metadata = load_metadata_cache(metadata_cache_dir, metadata_ttl, client)
+            datastore = Datastore.CachedDatastore(load_datastore(target_uri, device_id), metadata, device_id)
+            if spool_dir and not upsert:
+                # spooled segments may be written twice
+                logging.info("Parser: spooling the observations, so they are upserted")
+                upsert = True
+            if upsert:
+                datastore = Datastore.UpsertDatastore(datastore)
+                stats.info['upsert'] = datastore.counts
+            if spool_dir:
+                datastore = Datastore.SpoolDatastore(datastore, os.path.join(spool_dir, str(device_id)))
+                stats.info['spool'] = datastore.counts
+        with log_on_error(f"Parser: loading source file failed"), stats.stage('download'):
+            source = load_rawdata_source(source_uri, streaming=pipelined, budget=memory_budget)
+        with log_on_error(f"Parser: loading parser failed"):
+            parser = load_parser(parser_type, source, datastore)
+            parser.set_progress_sink(progress_sink, progress_interval)
+            parser.stats = stats
+            parser.workers = workers
+            parser.memory_budget = memory_budget
+            if pipelined and hasattr(parser, 'pipelined'):
+                parser.pipelined = True
+            if schema_cache and hasattr(parser, 'schema_cache'):
+                parser.schema_cache = SchemaCache(schema_cache, str(device_id))
+            if skip_stored and hasattr(parser, 'watermarks'):
+                with stats.stage('watermarks'):
+                    parser.watermarks = Datastore.get_watermarks(datastore)
+                parser.late_tolerance = late_tolerance
+        with log_on_error(f"Parser: parsing with parser={parser_type!r} failed"):
+            parser.do_parse()
+            parser.progress.finish()
+            with stats.stage('finalize'):
+                datastore.finalize()
+        logging.info("Parser: successfully parsed data")
+        qaqc_done = False
+        if chain_qaqc and qaqc.has_qaqc_config(datastore):
+            frame = parser.get_parsed_frame()
+            if frame is None:
+                logging.info(f"QA/QC: {parser_type} can't provide the parsed data, "
+                             f"loading it from the datastore")
+            cache = load_qaqc_cache(qaqc_cache_dir, qaqc_cache_size, qaqc_cache_functions)
+            shards = load_shard_pool(qaqc_shards, qaqc_shard_functions, qaqc_shard_verify)
+            with shards or contextlib.nullcontext():
+                qaqc_done = run_qaqc_job(datastore, stats, frame, cache, memory_budget, label_storage, shards)
+        if memory_budget is not None:
+            stats.info['memory_budget'] = memory_budget.report()
+        stats.info['metadata_cache'] = metadata.report()
+    summary = report_stats(client, device_id, stats)
+
+    # inform the broker, that parsing is done. If 'qaqc_done' is set,
+    # there is no need to schedule a QA/QC run: the chained QA/QC
+    # labelled all unprocessed data of the thing, not only the parsed.
     client.publish(
         topic='data_parsed',
-        payload=json.dumps(dict(thing_uuid=str(device_id), db_uri=target_uri)),
+        payload=json.dumps(dict(
+            thing_uuid=str(device_id), db_uri=target_uri, stats=summary, qaqc_done=qaqc_done
+        )),
     )
     client.loop_stop()
 
@@ -146,7 +400,20 @@ def parse(parser_type, target_uri, source_uri, device_id, mqtt_broker, mqtt_user
 @option_mqtt_broker
 @option_mqtt_usr
 @option_mqtt_pwd
-def run_qaqc(target_uri, device_id, mqtt_broker, mqtt_user, mqtt_password):
+@option_profile
+@option_qaqc_cache
+@option_qaqc_cache_size
+@option_qaqc_cache_functions
+@option_qaqc_shards
+@option_qaqc_shard_functions
+@option_qaqc_shard_verify
+@option_metadata_cache
+@option_metadata_ttl
+@option_memory_budget
+@option_label_storage
+def run_qaqc(target_uri, device_id, mqtt_broker, mqtt_user, mqtt_password, profile,
+             qaqc_cache_dir, qaqc_cache_size, qaqc_cache_functions, qaqc_shards, qaqc_shard_functions,
+             qaqc_shard_verify, metadata_cache_dir, metadata_ttl, memory_budget, label_storage):
     """ Run quality control pipeline on datastore data.
 
     Loads data and pipeline config from data store. Then run the
@@ -155,21 +422,248 @@ def run_qaqc(target_uri, device_id, mqtt_broker, mqtt_user, mqtt_password):
     """
     if check_mqtt_params(mqtt_broker, mqtt_user, mqtt_password):
         mqtt_logging.setup('extractor', mqtt_broker, mqtt_user, mqtt_password, device_id)
+        client = setup_mqtt_client(mqtt_broker, mqtt_user, mqtt_password)
+    else:
+        client = _DummyClient()
+
+    stats = instrumentation.JobStats('run-qaqc', thing_uuid=str(device_id))
+    with instrumentation.profiled(profile):
+        with log_on_error(f"QA/QC: loading datastore failed"):
+            metadata = load_metadata_cache(metadata_cache_dir, metadata_ttl, client)
+            datastore = Datastore.CachedDatastore(load_datastore(target_uri, device_id), metadata, device_id)
+        cache = load_qaqc_cache(qaqc_cache_dir, qaqc_cache_size, qaqc_cache_functions)
+        shards = load_shard_pool(qaqc_shards, qaqc_shard_functions, qaqc_shard_verify)
+        with shards or contextlib.nullcontext():
+            run_qaqc_job(datastore, stats, cache=cache, budget=memory_budget, storage=label_storage, shards=shards)
+        if memory_budget is not None:
+            stats.info['memory_budget'] = memory_budget.report()
+        stats.info['metadata_cache'] = metadata.report()
+    report_stats(client, device_id, stats)
+    client.loop_stop()
 
-    with log_on_error(f"QA/QC: loading datastore failed"):
-        datastore = load_datastore(target_uri, device_id)
-        logging.info("parse config")
+
+@cli.command(name='qaqc-backfill')
+@option_target_uri
+@click.option(
+    '--thing', 'things',
+    help='UUID of a thing to backfill, may be given multiple times.',
+    multiple=True, type=click.UUID,
+)
+@click.option(
+    '--things-file', 'things_file',
+    help='File with the UUIDs of the things to backfill, one per line.',
+    default=None, type=click.File(),
+)
+@click.option(
+    '--start', 'start',
+    help='Start of the time range to backfill (inclusive), e.g. 2023-01-01. Naive times are UTC.',
+    required=True, callback=lambda ctx, param, value: parse_timestamp(value),
+)
+@click.option(
+    '--end', 'end',
+    help='End of the time range to backfill (exclusive). Naive times are UTC.',
+    required=True, callback=lambda ctx, param, value: parse_timestamp(value),
+)
+@click.option(
+    '--slice', 'length',
+    help="Length of the slices, the range of every thing is split into, e.g. '7D'. "
+         "Every slice is quality-controlled on its own, with the context window before it.",
+    default='7D', show_default=True, callback=lambda ctx, param, value: parse_timedelta(value),
+)
+@click.option(
+    '-w', '--workers', 'workers',
+    help="Number of processes running the slices concurrently.",
+    default=1, show_default=True, type=click.IntRange(min=1),
+    show_envvar=True,
+    envvar='BACKFILL_WORKERS',
+)
+@click.option(
+    '--checkpoint', 'checkpoint',
+    help="File to record the finished slices in. Slices recorded there are "
+         "skipped, so an interrupted backfill resumes, when started again with "
+         "the same things, range and slice length.",
+    default=None, type=click.Path(dir_okay=False, writable=True),
+)
+@option_progress_interval
+@option_label_storage
+@option_metadata_cache
+@option_metadata_ttl
+def qaqc_backfill(target_uri, things, things_file, start, end, length, workers, checkpoint,
+                  progress_interval, label_storage, metadata_cache_dir, metadata_ttl):
+    """ Run the QA/QC of many things again over a time range.
+
+    All observations in the range are quality-controlled and labeled
+    again, whether they were before or not, e.g. after the QA/QC
+    configuration of the things changed.
+    """
+    things = [str(t) for t in things]
+    if things_file is not None:
+        try:
+            things += [str(uuid.UUID(line.strip())) for line in things_file if line.strip()]
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint='--things-file')
+    if not things:
+        raise click.UsageError("no things given, use --thing or --things-file")
+    try:
+        tasks = backfill.plan_tasks(things, start, end, length)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+
+    stats = instrumentation.JobStats('qaqc-backfill', things=len(set(things)))
+    failed = backfill.run_backfill(
+        target_uri, tasks, backfill.Checkpoint(checkpoint), stats,
+        workers=workers, storage=label_storage, progress_interval=progress_interval,
+        metadata=(metadata_cache_dir, metadata_ttl.total_seconds()),
+    )
+    summary = stats.info['backfill']
+    logging.info(
+        "Backfill: {done} of {tasks} slices done ({skipped} skipped, {failed} failed), "
+        "{rows} observations, {rows_per_second:.0f} observations/s".format(**summary)
+    )
+    stats.log()
+    if failed:
+        raise click.ClickException(f"{len(failed)} slices failed, run the backfill again to retry them")
+
+
+def run_qaqc_job(datastore, stats: instrumentation.JobStats, frame=None,
+                 cache: qaqc_cache.ResultCache | None = None,
+                 budget: memory.MemoryBudget | None = None, storage: str = 'jsonb',
+                 shards: qaqc_shards.ShardPool | None = None) -> bool:
+    """
+    Run the QA/QC configuration of the datastores thing and
+    upload the resulting quality labels.
+
+    Iff `frame` is given, it is used as the new data, instead of loading
+    all unprocessed data from the datastore (see `qaqc.get_data_from_frame`).
+    If there is unprocessed data left afterwards (e.g. values skipped by
+    `--skip-stored`, left unchanged by `--upsert` or of earlier failed
+    runs), it is loaded from the datastore as well. Iff `cache` is given, the results of allowed tests on unchanged
+    blocks of data are reused. Iff `budget` is given and there is no
+    `frame`, the unprocessed data is loaded and processed in slices,
+    that fit into the budget. The quality labels are written to the
+    label `storage`, see `qaqc_labels`. Iff `shards` is given, allowed
+    tests on long series run in parallel on time shards.
+
+    Returns whether all unprocessed data was quality-controlled.
+    """
+    logging.info("parse config")
     with log_on_error(f"QA/QC: parsing QA/QC-configuration failed"):
-        config = qaqc.parse_qaqc_config(datastore)
-    with log_on_error(f"QA/QC: loading data failed"):
-        data = qaqc.get_data(datastore, config)
-    with log_on_error(f"QA/QC: running QA/QC-configuration on data failed"):
-        result = qaqc.run_qaqc_config(data, config)
-    with log_on_error(f"QA/QC: uploading quality labels failed"):
-        n = qaqc.upload_qc_labels(result, config, datastore)
+        # fails on invalid configs, before any data is fetched
+        pipeline = qaqc.compile_qaqc_config(datastore)
+        config = pipeline.to_frame()
+    with log_on_error(f"QA/QC: the label storage {storage!r} is not available"):
+        qaqc_labels.check_storage(datastore.session.bind, storage)
+    if frame is not None:
+        with log_on_error(f"QA/QC: loading data failed"), stats.stage('get_data') as stage:
+            data = qaqc.get_data_from_frame(datastore, config, frame)
+            stage.rows += sum(len(data.data[c]) for c in data.data.columns)
+        _run_qaqc_slice(datastore, stats, data, pipeline, config, cache, storage, shards)
+        with stats.stage('get_data'):
+            unprocessed = qaqc.has_unprocessed(datastore, config, storage)
+        if not unprocessed:
+            logging.info("QA/QC: successfully run configuration")
+            return True
+        logging.info("QA/QC: there is unprocessed data besides the parsed data, loading it from the datastore")
+    if budget is not None:
+        slices = 0
+        while True:
+            with log_on_error(f"QA/QC: loading data failed"), stats.stage('get_data') as stage:
+                data = qaqc.get_data(datastore, config, budget, storage)
+                stage.rows += sum(len(data.data[c]) for c in data.data.columns)
+            if not qaqc.count_rows(data):
+                break
+            slices += 1
+            if not _run_qaqc_slice(datastore, stats, data, pipeline, config, cache, storage, shards):
+                logging.warning("QA/QC: no quality labels were uploaded for a slice, stopping")
+                stats.info['qaqc_slices'] = slices
+                return False
+        stats.info['qaqc_slices'] = slices
+        logging.info(f"QA/QC: successfully run configuration on {slices} slices")
+        return True
+    with log_on_error(f"QA/QC: loading data failed"), stats.stage('get_data') as stage:
+        data = qaqc.get_data(datastore, config, storage=storage)
+        stage.rows += sum(len(data.data[c]) for c in data.data.columns)
+    _run_qaqc_slice(datastore, stats, data, pipeline, config, cache, storage, shards)
+    logging.info("QA/QC: successfully run configuration")
+    return True
+
+
+def _run_qaqc_slice(datastore, stats: instrumentation.JobStats, data, pipeline, config,
+                    cache: qaqc_cache.ResultCache | None, storage: str = 'jsonb',
+                    shards: qaqc_shards.ShardPool | None = None) -> int:
+    """ Run the QA/QC on loaded `data` and upload the labels, return their number. """
+    with log_on_error(f"QA/QC: running QA/QC-configuration on data failed"), \
+            stats.stage('run_qaqc_config'):
+        result = qaqc.run_qaqc_config(data, pipeline, cache, shards)
+    if cache is not None:
+        stats.info['qaqc_cache'] = cache.counts
+    if shards is not None:
+        stats.info['qaqc_shards'] = shards.counts
+    with log_on_error(f"QA/QC: uploading quality labels failed"), \
+            stats.stage('upload_qc_labels') as stage:
+        n = qaqc.upload_qc_labels(result, config, datastore, storage)
+        stage.rows += n
         if n:
             logging.info(f"QA/QC: successfully uploaded {n} quality labels.")
-    logging.info("QA/QC: successfully run configuration")
+    return n
+
+
+def load_qaqc_cache(directory: str | None, max_size: int, functions: str) -> qaqc_cache.ResultCache | None:
+    if not directory:
+        return None
+    allowlist = qaqc_cache.parse_allowlist(functions)
+    if not allowlist:
+        logging.warning("QA/QC: a cache directory is given, but no functions to cache")
+        return None
+    return qaqc_cache.ResultCache(directory, allowlist, max_size=max_size)
+
+
+def load_metadata_cache(directory: str | None, ttl: pd.Timedelta, client) -> metadata_cache.MetadataCache:
+    cache = metadata_cache.shared(directory, ttl.total_seconds())
+    metadata_cache.subscribe(client, cache)
+    return cache
+
+
+def load_shard_pool(workers: int, functions: str, verify: bool) -> qaqc_shards.ShardPool | None:
+    if workers <= 1:
+        return None
+    allowlist = qaqc_cache.parse_allowlist(functions)
+    if not allowlist:
+        logging.warning("QA/QC: shards are requested, but no functions to shard")
+        return None
+    return qaqc_shards.ShardPool(allowlist, workers, verify=verify)
+
+
+def report_stats(client: mqtt.client.Client, device_id, stats: instrumentation.JobStats) -> dict:
+    """ Log the job stats and publish them to the topic `stats/<THING_ID>`. """
+    summary = stats.log()
+    client.publish(topic=f"stats/{device_id}", payload=json.dumps(summary))
+    return summary
+
+
+def parse_timedelta(value: str) -> pd.Timedelta:
+    try:
+        delta = pd.Timedelta(value)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    if delta < pd.Timedelta(0):
+        raise click.BadParameter("must not be negative")
+    return delta
+
+
+def parse_timestamp(value: str) -> pd.Timestamp:
+    try:
+        timestamp = pd.Timestamp(value)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    return timestamp.tz_localize('UTC') if timestamp.tz is None else timestamp
+
+
+def parse_memory_budget(value: str | None) -> memory.MemoryBudget | None:
+    try:
+        return memory.MemoryBudget.parse(value)
+    except (ValueError, humanfriendly.InvalidSize) as e:
+        raise click.BadParameter(str(e))
 
 
 def check_mqtt_params(mqtt_broker, mqtt_user, mqtt_password):
@@ -219,6 +713,24 @@ def load_datastore(target_uri: str,
     return datastore
 
 
+def load_rawdata_source(
+        source_uri: str, streaming: bool = False, budget: memory.MemoryBudget | None = None
+) -> AbstractRawDataSource:
+    """
+    Load the raw data source of `source_uri`. Sources, that are kept on
+    disk and memory-mapped, may be as large as the memory `budget`, the
+    parser keeps within it by parsing them in chunks.
+    """
+    max_mapped_size = None if budget is None else max(MAX_FILE_SIZE, budget.limit)
+    try:
+        source = RawDataSource.get_rawdata_source(source_uri, streaming, max_mapped_size)
+    except NotImplementedError as e:
+        msg = f'No matching raw data source type for URI "{source_uri}"'
+        logging.error(msg)
+        raise click.BadParameter(msg)
+    return source
+
+
 def load_parser(
         parser_type: str,
         datasource: AbstractRawDataSource, datastore:
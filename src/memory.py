@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import annotations
+
+import logging
+from typing import Dict
+
+import humanfriendly
+import pandas as pd
+
+"""
+A memory budget for a job, that sizes its batches from measured row sizes.
+
+The budget is split into shares for the consumers of a job, which don't hold
+their memory at the same time:
+
+ - `read`: frames of raw data, that are parsed at once
+ - `store`: values buffered by a parser, until they are written
+ - `fetch`: a page of observations read from the database
+ - `qaqc`: a slice of observations, that is quality controlled at once
+
+Every consumer reports the size of its batches in bytes per row (`observe`)
+and asks for the number of rows, that fit into its share (`rows`). Until
+anything was measured, conservative defaults are assumed. Larger rows
+shrink the next batches at once, smaller rows grow them gradually.
+"""
+
+SHARES = {"read": .25, "store": .1, "fetch": .1, "qaqc": .5}
+
+# assumed bytes per row, until something was measured
+DEFAULT_BYTES_PER_ROW = {"read": 1024, "store": 256, "fetch": 1024, "qaqc": 4096}
+
+# a slice of observations needs that much more memory while it is quality
+# controlled (flags, history, quality labels), than when it was fetched
+QAQC_OVERHEAD = 4
+
+MIN_ROWS = 100
+
+# use this much of the memory limit of the container, with '--memory-budget auto'
+AUTO_FRACTION = .75
+CGROUP_LIMITS = ["/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"]
+
+
+def frame_bytes(obj: pd.DataFrame | pd.Series) -> int:
+    """ Memory of a frame or series, including the objects it refers to. """
+    usage = obj.memory_usage(index=True, deep=True)
+    return int(usage.sum()) if isinstance(usage, pd.Series) else int(usage)
+
+
+def cgroup_limit() -> int | None:
+    """ The memory limit of the container (cgroup v2 or v1), or None. """
+    for path in CGROUP_LIMITS:
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        # 'max' or a huge number, if there is no limit
+        if value.isdigit() and int(value) < 2 ** 60:
+            return int(value)
+    return None
+
+
+class MemoryBudget:
+    """
+    Size batches from measured bytes per row, so they fit into `limit`.
+
+    Parameters
+    ----------
+    limit:
+        bytes, the batches of a job may use at most
+    """
+
+    def __init__(self, limit: int):
+        if limit <= 0:
+            raise ValueError(f"the memory budget must be positive, got {limit}")
+        self.limit = limit
+        self.bytes_per_row: Dict[str, float] = dict(DEFAULT_BYTES_PER_ROW)
+        # the last number of rows per consumer, for the job statistics
+        self.sizes: Dict[str, int] = {}
+
+    @classmethod
+    def parse(cls, value: str | None) -> MemoryBudget | None:
+        """
+        Parse a size like '512M', or 'auto' for a fraction of the memory
+        limit of the container. None or an empty string disable the budget.
+        """
+        if not value:
+            return None
+        if value.strip().lower() == "auto":
+            limit = cgroup_limit()
+            if limit is None:
+                logging.warning("no memory limit of the container found, running without a memory budget")
+                return None
+            return cls(int(limit * AUTO_FRACTION))
+        return cls(humanfriendly.parse_size(value, binary=True))
+
+    def share(self, kind: str) -> int:
+        """ Bytes available to the consumer `kind`. """
+        return int(self.limit * SHARES[kind])
+
+    def observe(self, kind: str, nbytes: int, rows: int) -> None:
+        """ Report, that a batch of `rows` rows of `kind` took `nbytes` bytes. """
+        if rows <= 0:
+            return
+        measured, current = nbytes / rows, self.bytes_per_row[kind]
+        # grow at once to prevent running out of memory, shrink slowly
+        self.bytes_per_row[kind] = measured if measured > current else .75 * current + .25 * measured
+
+    def rows(self, kind: str, parts: int = 1) -> int:
+        """
+        Number of rows of `kind`, that fit into its share, if it is
+        split into `parts` batches, which are held at the same time.
+        """
+        rows = max(int(self.share(kind) / parts / self.bytes_per_row[kind]), MIN_ROWS)
+        self.sizes[kind] = rows
+        return rows
+
+    def report(self) -> dict:
+        """ The budget as json-serializable dict, e.g. for the job statistics. """
+        return dict(
+            limit=self.limit,
+            bytes_per_row={k: round(v, 1) for k, v in self.bytes_per_row.items()},
+            rows=dict(self.sizes),
+        )
@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import annotations
+
+import copy
+import dataclasses
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, Tuple
+
+import sqlalchemy
+
+"""
+A cache of the metadata, that every job looks up: the properties of the
+thing, the parameters of the parser and the datastreams by position.
+
+The metadata of a thing is kept in memory and, iff a directory is given,
+in one JSON file per thing, so the next job of the thing finds it warm.
+An entry expires `ttl` seconds after it was loaded from the database. It
+is dropped earlier by `invalidate`, e.g. when a message on the MQTT topic
+`CONFIG_CHANGED_TOPIC` announces, that the configuration of the thing
+changed (see `subscribe`). Such messages only reach running jobs, so every
+job also checks the cached metadata of its thing against the version of
+the metadata in the database, a digest of the properties and datastreams
+of the thing (see `get_thing_version` and `MetadataCache.validate`).
+
+Datastreams are cached as `DatastreamInfo`, a plain record of the id,
+name and position, that doesn't depend on a database session. Missing
+datastreams are not cached, they might be created by the job.
+"""
+
+DEFAULT_TTL = 300.
+
+# Payload: {"thing_uuid": "..."}, without a thing uuid all things are invalidated
+CONFIG_CHANGED_TOPIC = "thing_config_changed"
+
+KINDS = ("properties", "parser_parameters", "datastreams")
+
+
+@dataclasses.dataclass(frozen=True)
+class DatastreamInfo:
+    """ The metadata of a datastream, that the extractor needs. """
+    id: int
+    name: str
+    position: str
+
+
+class MetadataCache:
+    """
+    Time-bounded cache of the metadata of things, see the module.
+
+    The number of hits, misses, expired entries and invalidations is
+    available from `counts`.
+
+    Parameters
+    ----------
+    directory:
+        directory of the cache files, created if missing.
+        Without a directory the metadata is only kept in memory.
+    ttl:
+        seconds, an entry is valid after it was loaded
+    """
+
+    def __init__(self, directory: str | None = None, ttl: float = DEFAULT_TTL):
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.ttl = ttl
+        self.counts = dict(hits=0, misses=0, expired=0, invalidated=0, stale=0)
+        # thing -> kind -> key -> (loaded at, value)
+        self._things: Dict[str, Dict[str, Dict[str, Tuple[float, Any]]]] = {}
+        # thing -> version of the metadata in the database, when it was cached
+        self._versions: Dict[str, str | None] = {}
+        # invalidations arrive on the thread of the MQTT client
+        self._lock = threading.RLock()
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.counts["hits"] + self.counts["misses"]
+        return self.counts["hits"] / lookups if lookups else 0.
+
+    def report(self) -> dict:
+        return dict(self.counts, hit_rate=round(self.hit_rate, 3))
+
+    def get(self, thing: str, kind: str, key: str, load: Callable[[], Any]) -> Any:
+        """
+        Get the metadata `kind` of the `thing` by `key`, or `load` it.
+        Values must be JSON serializable, except `DatastreamInfo`.
+        """
+        with self._lock:
+            entry = self._entries(thing)[kind].get(key)
+            if entry is not None:
+                loaded, value = entry
+                if time.time() - loaded < self.ttl:
+                    self.counts["hits"] += 1
+                    # callers must not change the cached value
+                    return copy.deepcopy(value)
+                self.counts["expired"] += 1
+            self.counts["misses"] += 1
+        value = load()
+        with self._lock:
+            self._entries(thing)[kind][key] = (time.time(), value)
+            self._save(thing)
+        return copy.deepcopy(value)
+
+    def validate(self, thing: str, version: str | None) -> None:
+        """
+        Drop the metadata of the `thing`, iff it was cached for another `version`
+        of its metadata in the database. Without a `version` nothing is checked.
+        """
+        if version is None:
+            return
+        with self._lock:
+            entries = self._entries(thing)
+            if self._versions.get(thing) == version:
+                return
+            if any(entries.values()):
+                # metadata of unknown versions (None) is dropped as well
+                logging.debug(f"Metadata cache: the metadata of {thing} changed in the database")
+                self.counts["stale"] += 1
+                self._things[thing] = {kind: {} for kind in KINDS}
+            self._versions[thing] = version
+            self._save(thing)
+
+    def invalidate(self, thing: str | None = None) -> None:
+        """ Drop the metadata of the `thing`, or of all things. """
+        with self._lock:
+            things = list(self._things) if thing is None else [thing]
+            if thing is None and self.directory:
+                things += [name[:-len(".json")] for name in os.listdir(self.directory) if name.endswith(".json")]
+            for thing in set(things):
+                self._things.pop(thing, None)
+                self._versions.pop(thing, None)
+                if self.directory:
+                    try:
+                        os.unlink(self._path(thing))
+                    except FileNotFoundError:
+                        pass
+                self.counts["invalidated"] += 1
+        logging.debug(f"Metadata cache: invalidated {things}")
+
+    def _path(self, thing: str) -> str:
+        return os.path.join(self.directory, f"{thing}.json")
+
+    def _entries(self, thing: str) -> Dict[str, Dict[str, Tuple[float, Any]]]:
+        if (entries := self._things.get(thing)) is None:
+            entries = self._things[thing] = self._load(thing)
+        return entries
+
+    def _load(self, thing: str) -> Dict[str, Dict[str, Tuple[float, Any]]]:
+        entries = {kind: {} for kind in KINDS}
+        if not self.directory:
+            return entries
+        try:
+            with open(self._path(thing)) as f:
+                stored = json.load(f)
+        except FileNotFoundError:
+            return entries
+        except ValueError:
+            logging.warning(f"Metadata cache: ignoring the invalid file {self._path(thing)}")
+            return entries
+        for kind in KINDS:
+            for key, (loaded, value) in stored.get(kind, {}).items():
+                if kind == "datastreams":
+                    value = DatastreamInfo(**value)
+                entries[kind][key] = (loaded, value)
+        self._versions[thing] = stored.get("version")
+        return entries
+
+    def _save(self, thing: str) -> None:
+        if not self.directory:
+            return
+        stored = {
+            kind: {
+                key: (loaded, dataclasses.asdict(value) if isinstance(value, DatastreamInfo) else value)
+                for key, (loaded, value) in entries.items()
+            }
+            for kind, entries in self._things[thing].items()
+        }
+        stored["version"] = self._versions.get(thing)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(stored, f, default=str)
+            os.replace(tmp, self._path(thing))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+
+def subscribe(client, cache: MetadataCache, topic: str = CONFIG_CHANGED_TOPIC) -> None:
+    """ Invalidate the metadata of a thing, whenever a message on `topic` announces a change. """
+
+    def on_message(client, userdata, message):
+        try:
+            thing = json.loads(message.payload or b"{}").get("thing_uuid")
+        except (ValueError, AttributeError):
+            logging.warning(f"Metadata cache: invalid message on {message.topic}, invalidating all things")
+            thing = None
+        cache.invalidate(thing)
+
+    client.message_callback_add(topic, on_message)
+    client.subscribe(topic, qos=1)
+
+
+# (directory, ttl) -> cache of this process
+_SHARED: Dict[tuple, MetadataCache] = {}
+
+
+def shared(directory: str | None = None, ttl: float = DEFAULT_TTL) -> MetadataCache:
+    """ The cache of this process, e.g. reused by all tasks of a worker process. """
+    if (cache := _SHARED.get((directory, ttl))) is None:
+        cache = _SHARED[directory, ttl] = MetadataCache(directory, ttl)
+    return cache
+
+
+# A digest of the properties and the datastreams of a thing (PostgreSQL)
+THING_VERSION_QUERY = sqlalchemy.text(
+    "SELECT md5(coalesce(t.properties::text, '') || coalesce(string_agg("
+    "d.id || ':' || d.position || ':' || d.name, ',' ORDER BY d.id), '')) "
+    "FROM thing t LEFT JOIN datastream d ON d.thing_id = t.id "
+    "WHERE t.uuid = CAST(:uuid AS uuid) GROUP BY t.id"
+)
+
+
+def get_thing_version(datastore, thing_uuid: str) -> str | None:
+    """
+    The version of the metadata of the thing in the database, that changes
+    with its properties and datastreams, or None, if it isn't available,
+    e.g. for other databases than PostgreSQL.
+    """
+    if (version := getattr(datastore, "thing_version", None)) is not None:
+        return version()
+    session = getattr(datastore, "session", None)
+    if session is None or session.bind.dialect.name != "postgresql":
+        return None
+    return session.execute(THING_VERSION_QUERY, dict(uuid=str(thing_uuid))).scalar()
+
+
+def get_thing_properties(datastore) -> dict:
+    """ The properties of the thing, from the metadata cache, iff the datastore has one. """
+    if (properties := getattr(datastore, "thing_properties", None)) is not None:
+        return properties
+    return datastore.sqla_thing.properties or {}
+
+
+def get_thing_uuid(datastore) -> str:
+    """ The uuid of the thing, without a query, iff the datastore has a metadata cache. """
+    if (thing_uuid := getattr(datastore, "thing_uuid", None)) is not None:
+        return thing_uuid
+    return str(datastore.sqla_thing.uuid)
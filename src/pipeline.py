@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import annotations
+
+import logging
+import queue
+import threading
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
+
+from instrumentation import JobStats
+
+"""
+Run the stages of a job concurrently, connected by bounded queues.
+
+The first stage produces items (e.g. downloads the raw data in chunks), every
+further stage is a function, that takes an iterator over the items of the
+previous stage and yields its own items (e.g. parses the chunks into frames,
+or stores them and yields nothing). Every stage runs in its own thread, at
+most `maxsize` items wait between two stages, so the memory stays bounded,
+no matter how large the input is.
+
+Threads only pay off for stages, that release the GIL, i.e. network and
+disk I/O or the database driver, which is the point: the CPU bound parsing
+runs, while the next chunk is downloaded and the last one is written.
+
+If a stage fails, all other stages are stopped and `Pipeline.run` raises the
+error. The busy time of every stage is reported, the stage with the highest
+utilization is the bottleneck.
+"""
+
+QUEUE_SIZE = 4
+# seconds between two checks, whether another stage failed, while waiting
+POLL_INTERVAL = .1
+
+_END = object()
+
+
+class _Aborted(Exception):
+    """ Another stage failed. """
+
+
+class _Timer:
+    def __init__(self):
+        self.wait_in = 0.
+        self.wait_out = 0.
+        self.items = 0
+
+
+class Pipeline:
+    """
+    Run concurrent stages, connected by bounded queues.
+
+    Examples
+    --------
+    >>> pipeline = Pipeline(stats)
+    >>> pipeline.run(
+    ...     ("download", source.stream()),
+    ...     ("parse", parse_chunks),
+    ...     ("store", store_frames),
+    ... )
+    >>> pipeline.report["bottleneck"]
+    'store'
+
+    Parameters
+    ----------
+    stats:
+        the busy wall and CPU time and the number of items of every
+        stage are added to the stage of the same name, the utilization
+        of all stages is added as `pipeline` to its info
+    maxsize:
+        maximum number of items between two stages
+    """
+
+    def __init__(self, stats: JobStats, maxsize: int = QUEUE_SIZE, poll: float = POLL_INTERVAL):
+        self.stats = stats
+        self.maxsize = maxsize
+        self.poll = poll
+        self.report: Dict = {}
+        self._abort = threading.Event()
+        self._errors: List[BaseException] = []
+        self._lock = threading.Lock()
+        self._timers: Dict[str, Tuple[_Timer, float, float]] = {}
+
+    def run(
+        self, source: Tuple[str, Iterable],
+        *stages: Tuple[str, Callable[[Iterator], Iterable]],
+    ) -> None:
+        """
+        Run the `source` stage and all further `stages` until all items
+        are processed, or raise the first error of any stage.
+
+        Parameters
+        ----------
+        source:
+            name and an iterable of the items, it is iterated in
+            its own thread
+        stages:
+            name and a function, that takes an iterator over the
+            items of the previous stage and yields its own items
+        """
+        names = [source[0]] + [name for name, _ in stages]
+        if len(set(names)) < len(names):
+            raise ValueError(f"stage names must be unique, got {names}")
+        queues = [queue.Queue(self.maxsize) for _ in stages]
+        self._abort.clear()
+        self._errors, self._timers = [], {}
+
+        name, items = source
+        threads = [threading.Thread(
+            target=self._run_stage, args=(name, lambda _: items, None, queues[0] if queues else None),
+            name=f"pipeline-{name}", daemon=True,
+        )]
+        for i, (name, func) in enumerate(stages):
+            outbox = queues[i + 1] if i + 1 < len(queues) else None
+            threads.append(threading.Thread(
+                target=self._run_stage, args=(name, func, queues[i], outbox),
+                name=f"pipeline-{name}", daemon=True,
+            ))
+
+        start = time.perf_counter()
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                # join with a timeout, so the main thread stays interruptible
+                while thread.is_alive():
+                    thread.join(self.poll)
+        except BaseException:
+            self._abort.set()
+            for thread in threads:
+                thread.join()
+            raise
+        finally:
+            self._report(names, time.perf_counter() - start)
+
+        if self._errors:
+            raise self._errors[0]
+
+    def _run_stage(self, name: str, func: Callable, inbox: queue.Queue, outbox: queue.Queue) -> None:
+        timer = _Timer()
+        wall, cpu = time.perf_counter(), time.thread_time()
+        items = None
+        try:
+            items = iter(func(None if inbox is None else self._get(inbox, timer)))
+            for item in items:
+                timer.items += 1
+                if outbox is not None:
+                    self._put(outbox, item, timer)
+            if outbox is not None:
+                self._put(outbox, _END, timer)
+        except _Aborted:
+            pass
+        except BaseException as e:
+            with self._lock:
+                self._errors.append(e)
+            if not self._abort.is_set():
+                logging.debug(f"pipeline stage {name!r} failed, stopping all stages")
+            self._abort.set()
+        finally:
+            if hasattr(items, "close"):
+                # e.g. close a download, that was stopped half way
+                items.close()
+            self._timers[name] = (timer, time.perf_counter() - wall, time.thread_time() - cpu)
+
+    def _get(self, inbox: queue.Queue, timer: _Timer) -> Iterator:
+        while True:
+            start = time.perf_counter()
+            while True:
+                if self._abort.is_set():
+                    raise _Aborted
+                try:
+                    item = inbox.get(timeout=self.poll)
+                    break
+                except queue.Empty:
+                    pass
+            timer.wait_in += time.perf_counter() - start
+            if item is _END:
+                return
+            yield item
+
+    def _put(self, outbox: queue.Queue, item, timer: _Timer) -> None:
+        start = time.perf_counter()
+        while True:
+            if self._abort.is_set():
+                raise _Aborted
+            try:
+                outbox.put(item, timeout=self.poll)
+                break
+            except queue.Full:
+                pass
+        timer.wait_out += time.perf_counter() - start
+
+    def _report(self, names: List[str], wall: float) -> None:
+        stages = {}
+        for name in names:
+            if name not in self._timers:
+                continue
+            timer, elapsed, cpu = self._timers[name]
+            busy = max(elapsed - timer.wait_in - timer.wait_out, 0.)
+            stage = self.stats.stage(name)
+            stage.wall += busy
+            stage.cpu += cpu
+            stage.calls += timer.items
+            stages[name] = dict(
+                busy=busy,
+                wait_in=timer.wait_in,
+                wait_out=timer.wait_out,
+                utilization=busy / wall if wall > 0 else 0.,
+            )
+        self.report = dict(
+            wall=wall,
+            stages=stages,
+            bottleneck=max(stages, key=lambda n: stages[n]["busy"]) if stages else None,
+        )
+        self.stats.info["pipeline"] = self.report
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import annotations
+
+import json
+import logging
+import time
+from abc import ABC, abstractmethod
+
+import paho.mqtt as mqtt
+import paho.mqtt.client
+
+
+class AbstractProgressSink(ABC):
+    """ Receives the throttled progress reports of a `ProgressReporter`. """
+
+    @abstractmethod
+    def emit(self, report: dict) -> None:
+        raise NotImplementedError
+
+
+class LoggingProgressSink(AbstractProgressSink):
+    """ Write progress reports to the log. """
+
+    def __init__(self, level: int = logging.INFO, unit: str = "rows"):
+        self.level = level
+        self.unit = unit
+
+    def emit(self, report: dict) -> None:
+        total = report["total"] or "?"
+        percent = "?" if report["percent"] is None else f"{report['percent']:.1f}"
+        eta = "?" if report["eta"] is None else f"{report['eta']:.0f}s"
+        logging.log(
+            self.level,
+            f"{report['label']}: {report['done']}/{total} ({percent}%), "
+            f"{report['rate']:.{2 if report['rate'] < 10 else 0}f} {self.unit}/s, ETA {eta}"
+        )
+
+
+class MqttProgressSink(AbstractProgressSink):
+    """ Publish progress reports as JSON to a (per-thing) MQTT topic. """
+
+    def __init__(self, client: mqtt.client.Client, topic: str, qos: int = 0):
+        self.client = client
+        self.topic = topic
+        self.qos = qos
+
+    def emit(self, report: dict) -> None:
+        self.client.publish(topic=self.topic, payload=json.dumps(report), qos=self.qos)
+
+
+class ProgressReporter:
+    """
+    Accumulate progress in a hot loop and report it at a throttled interval.
+
+    ``update`` only increments a counter and compares it to a threshold,
+    the clock is consulted only every so many steps. The number of steps
+    between two clock checks is adapted to the measured rate, so that the
+    clock is read a few times per `interval`.
+
+    Parameters
+    ----------
+    label : str
+        Name of the task, is part of every report.
+
+    sink : AbstractProgressSink or None, default None
+        Where to send the reports to. Iff `None`, reports are logged.
+
+    interval : float, default 5.
+        Minimum number of seconds between two reports.
+    """
+
+    def __init__(self, label: str, sink: AbstractProgressSink | None = None, interval: float = 5.):
+        self.label = label
+        self.sink = sink or LoggingProgressSink()
+        self.interval = interval
+        self.total = 0
+        self.done = 0
+        self._start = time.monotonic()
+        self._last_report = self._start
+        self._check_steps = 1
+        self._next_check = 1
+
+    def set_length(self, length: int) -> None:
+        self.total = int(length)
+
+    def update(self, steps: int = 1) -> None:
+        self.done += steps
+        if self.done >= self._next_check:
+            self._check()
+
+    def _check(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._start
+        if elapsed > 0:
+            # aim for about four clock checks per interval
+            self._check_steps = max(1, int(self.done / elapsed * self.interval / 4))
+        self._next_check = self.done + self._check_steps
+        if now - self._last_report >= self.interval:
+            self._report(now)
+
+    def _report(self, now: float) -> None:
+        self._last_report = now
+        self.sink.emit(self.report(now))
+
+    def report(self, now: float | None = None) -> dict:
+        """ Get the current state as a json-serializable dict. """
+        if now is None:
+            now = time.monotonic()
+        elapsed = now - self._start
+        rate = self.done / elapsed if elapsed > 0 else 0.
+        percent = eta = None
+        if self.total:
+            percent = min(100., 100. * self.done / self.total)
+            if rate > 0:
+                eta = max(0., (self.total - self.done) / rate)
+        return dict(
+            label=self.label,
+            done=self.done,
+            total=self.total,
+            percent=percent,
+            elapsed=elapsed,
+            rate=rate,
+            eta=eta,
+        )
+
+    def finish(self) -> None:
+        """ Send a final report, regardless of the interval. """
+        self._report(time.monotonic())
@@ -3,9 +3,16 @@
 
 from __future__ import annotations
 
+import collections
+import copy
+import dataclasses
+import hashlib
+import inspect
 import json
+import types
 import typing
 import warnings
+from types import MappingProxyType
 
 import numpy as np
 from tsm_datastore_lib import SqlAlchemyDatastore
@@ -15,12 +22,21 @@ import logging
 import sqlalchemy
 
 import pandas as pd
-from pandas.api.types import is_integer
+from pandas.api.types import is_bool_dtype, is_integer, is_numeric_dtype
 import saqc
 from saqc.core.history import History
 from saqc.core.core import DictOfSeries
+from saqc.constants import UNFLAGGED
 from tsm_datastore_lib.SqlAlchemyDatastore import DatastreamNotFoundError
 
+from memory import MemoryBudget, QAQC_OVERHEAD, MIN_ROWS, frame_bytes
+from qaqc_cache import ResultCache, split_blocks
+from qaqc_shards import ShardPool
+import qaqc_labels
+import copy_reader
+from Datastore.UpsertDatastore import result_columns
+from metadata_cache import get_thing_properties, get_thing_uuid
+
 
 def parse_qaqc_config(datastore):
     """
@@ -55,20 +71,224 @@ def parse_qaqc_config(datastore):
     -------
     config: pd.DataFrame
     """
-    thing = datastore.sqla_thing
-    idx = thing.properties["QAQC"]["default"]
-    config = thing.properties["QAQC"]["configs"][idx]
+    return compile_qaqc_config(datastore).to_frame()
+
+
+class InvalidQaqcConfigError(ValueError):
+    pass
+
+
+@dataclasses.dataclass(frozen=True)
+class QaqcStep:
+    """
+    One test of a QA/QC configuration, with the resolved SaQC method.
+    The `kwargs` are a read-only copy of the configured ones, use
+    `call_kwargs` to get arguments, that may be changed.
+    """
+    position: int
+    function: str
+    method: typing.Callable
+    kwargs: typing.Mapping[str, typing.Any]
+
+    @property
+    def var_name(self) -> str:
+        return position_to_varname(self.position)
+
+    def call_kwargs(self) -> dict:
+        return copy.deepcopy(dict(self.kwargs))
+
+
+@dataclasses.dataclass(frozen=True)
+class QaqcPipeline:
+    """
+    A validated QA/QC configuration, see `compile_qaqc_config`.
+    """
+    steps: typing.Tuple[QaqcStep, ...]
+    window: pd.Timedelta | int
+
+    def to_frame(self) -> pd.DataFrame:
+        """ The configuration as returned by `parse_qaqc_config`. """
+        config = pd.DataFrame(
+            [dict(function=s.function, kwargs=s.call_kwargs(), position=s.position) for s in self.steps],
+            columns=["function", "kwargs", "position"],
+        )
+        config["window"] = [self.window] * len(config.index)
+        return config
 
-    if config["type"] != "SaQC":
+
+# (thing uuid, hash of the QAQC properties) -> pipeline
+_PIPELINES: collections.OrderedDict[tuple, QaqcPipeline] = collections.OrderedDict()
+PIPELINE_CACHE_SIZE = 128
+
+
+def compile_qaqc_config(datastore) -> QaqcPipeline:
+    """
+    Compile the QA/QC config of the thing of the datastore into a pipeline.
+
+    All tests are validated, before any data is fetched: the function
+    must be a method of `saqc.SaQC` and the kwargs must match its
+    signature. Numbers, booleans and time offsets are checked against
+    the annotations of the parameters and numbers given as strings are
+    converted (see `_coerce_kwargs`). The pipeline is cached per thing by a hash of its QAQC
+    properties, so an unchanged config is only compiled once per process.
+
+    Raises
+    ------
+    InvalidQaqcConfigError
+        If the config is incomplete or a test is invalid.
+    NotImplementedError
+        If the config is not of type 'SaQC'.
+    """
+    thing_uuid = get_thing_uuid(datastore)
+    properties = get_thing_properties(datastore).get("QAQC")
+    if properties is None:
+        raise InvalidQaqcConfigError(f"thing {thing_uuid} has no QA/QC configuration")
+    digest = hashlib.sha256(json.dumps(properties, sort_keys=True, default=str).encode()).hexdigest()
+    key = (thing_uuid, digest)
+    if (pipeline := _PIPELINES.get(key)) is not None:
+        _PIPELINES.move_to_end(key)
+        return pipeline
+
+    pipeline = _compile(properties)
+    _PIPELINES[key] = pipeline
+    if len(_PIPELINES) > PIPELINE_CACHE_SIZE:
+        _PIPELINES.popitem(last=False)
+    return pipeline
+
+
+def _compile(properties: dict) -> QaqcPipeline:
+    try:
+        config = properties["configs"][properties["default"]]
+        config_type = config["type"]
+        tests = config["tests"]
+        window = config["context_window"]
+    except (KeyError, IndexError, TypeError) as e:
+        raise InvalidQaqcConfigError(f"incomplete QA/QC configuration, missing {e}") from e
+    if config_type != "SaQC":
         raise NotImplementedError("only QA/QC configurations of type "
                                   "'SaQC' are currently supported")
-    else:
-        logging.debug(f"raw-config: {config}")
+    try:
+        window = parse_window(window)
+    except ValueError as e:
+        raise InvalidQaqcConfigError(f"invalid context_window {window!r}: {e}") from e
+    return QaqcPipeline(steps=tuple(_compile_step(i, test) for i, test in enumerate(tests)), window=window)
+
+
+def _compile_step(i: int, test: dict) -> QaqcStep:
+    try:
+        function = test["function"]
+        position = int(test["position"])
+    except (KeyError, ValueError, TypeError) as e:
+        raise InvalidQaqcConfigError(f"test {i}: needs a function and an integer position ({e!r})") from e
+    kwargs = test.get("kwargs") or {}
+    if not isinstance(kwargs, dict):
+        raise InvalidQaqcConfigError(f"test {i}: kwargs must be a mapping, not {kwargs!r}")
+
+    method = getattr(saqc.SaQC, function, None) if isinstance(function, str) else None
+    if not callable(method) or function.startswith("_"):
+        raise InvalidQaqcConfigError(f"test {i}: unknown SaQC function {function!r}")
+    try:
+        signature = inspect.signature(method)
+    except ValueError:
+        # no signature available, e.g. for some builtins
+        signature = None
+    if signature is not None:
+        try:
+            # self and field are given, when the pipeline runs
+            signature.bind(None, position_to_varname(position), **kwargs)
+        except TypeError as e:
+            raise InvalidQaqcConfigError(f"test {i}: invalid arguments for {function}: {e}") from e
+        kwargs = _coerce_kwargs(i, function, method, signature, kwargs)
+    # the step is shared by all jobs of the thing, see `compile_qaqc_config`
+    kwargs = MappingProxyType(copy.deepcopy(kwargs))
+    return QaqcStep(position=position, function=function, method=method, kwargs=kwargs)
+
+
+# Names of the annotations of time offsets (e.g. '1h', '10min'), like the `saqc.lib.types`
+OFFSET_ANNOTATIONS = {"FreqString", "OffsetStr", "OffsetLike", "Timedelta", "DateOffset"}
+# The type of `X | Y` annotations, Python < 3.10 has none
+UnionType = getattr(types, "UnionType", None)
 
-    config_df = pd.DataFrame(config["tests"])
-    config_df["window"] = parse_window(config["context_window"])
 
-    return config_df
+def _kinds(annotation) -> typing.Set[str] | None:
+    """
+    The kinds of values ('bool', 'int', 'float', 'str', 'offset', 'none'),
+    that `annotation` accepts, or None, if it isn't checked.
+    """
+    origin = typing.get_origin(annotation)
+    if origin is typing.Annotated:
+        return _kinds(typing.get_args(annotation)[0])
+    if origin is typing.Union or (UnionType is not None and origin is UnionType):
+        kinds = set()
+        for arg in typing.get_args(annotation):
+            if (k := _kinds(arg)) is None:
+                return None
+            kinds |= k
+        return kinds
+    if getattr(annotation, "__name__", None) in OFFSET_ANNOTATIONS:
+        return {"offset"}
+    if hasattr(annotation, "__supertype__"):  # typing.NewType
+        return _kinds(annotation.__supertype__)
+    return {bool: {"bool"}, int: {"int"}, float: {"float"}, str: {"str"}, type(None): {"none"}}.get(annotation)
+
+
+def _coerce(value, kinds: typing.Set[str]):
+    """ Convert `value` to one of the `kinds`, raises a ValueError, if it can't be. """
+    if value is None and "none" in kinds:
+        return value
+    if isinstance(value, bool):
+        if "bool" in kinds:
+            return value
+    elif isinstance(value, (int, float)):
+        if isinstance(value, int) and "int" in kinds:
+            return value
+        if "float" in kinds:
+            return float(value)
+        if "int" in kinds and float(value).is_integer():
+            return int(value)
+    elif isinstance(value, str):
+        if "offset" in kinds:
+            try:
+                pd.tseries.frequencies.to_offset(value)
+                return value
+            except ValueError:
+                pass
+        if "str" in kinds:
+            return value
+        for kind, convert in (("int", int), ("float", float)):
+            if kind in kinds:
+                try:
+                    return convert(value)
+                except ValueError:
+                    pass
+    raise ValueError(f"expected {' or '.join(sorted(kinds))}")
+
+
+def _coerce_kwargs(
+        i: int, function: str, method: typing.Callable, signature: inspect.Signature, kwargs: dict
+) -> dict:
+    """
+    Check the `kwargs` of test `i` against the annotations of the parameters
+    of `method` and convert numbers given as strings. Parameters annotated
+    with other types (e.g. callables, series) are passed unchanged.
+    """
+    try:
+        hints = typing.get_type_hints(inspect.unwrap(method), include_extras=True)
+    except Exception:
+        # annotations, that can't be resolved, aren't checked
+        hints = {}
+    coerced = {}
+    for name, value in kwargs.items():
+        param = signature.parameters.get(name)
+        kinds = None if param is None else _kinds(hints.get(name, param.annotation))
+        if kinds is None:
+            coerced[name] = value
+            continue
+        try:
+            coerced[name] = _coerce(value, kinds)
+        except ValueError as e:
+            raise InvalidQaqcConfigError(f"test {i}: invalid argument {name}={value!r} for {function}: {e}") from e
+    return coerced
 
 
 def parse_window(window) -> pd.Timedelta | int:
@@ -84,11 +304,74 @@ def parse_window(window) -> pd.Timedelta | int:
     return window
 
 
+# The `result_type` is the index of the column, that holds the value
+RESULT_COLUMNS = ["result_number", "result_string", "result_json", "result_boolean"]
+
+# Columns read for the QA/QC, all others aren't used
+FETCH_COLUMNS = ["result_time", "result_type", *RESULT_COLUMNS]
+
+# Read numeric observations with a binary COPY, if possible, see `copy_reader`
+FAST_READS = True
+
+
+def _query_observations(datastore: SqlAlchemyDatastore, *criteria):
+    """ Query the `FETCH_COLUMNS` of the observations matching `criteria`. """
+    columns = [getattr(Observation, c) for c in FETCH_COLUMNS]
+    return datastore.session.query(*columns).filter(*criteria)
+
+
+def _compact(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Shrink a frame of observations: the `result_type` fits into a byte and
+    the result columns without any value are dropped, mostly all but one.
+    """
+    if "result_type" in df.columns:
+        df["result_type"] = df["result_type"].astype(np.int8)
+    empty = [c for c in RESULT_COLUMNS if c in df.columns and df[c].isna().all()]
+    return df.drop(columns=empty)
+
+
+def _read_observations(query, budget: MemoryBudget | None = None) -> pd.DataFrame:
+    """
+    Read the observations of `query` indexed by their result time, see
+    `_compact`. Numbers are read with a binary COPY from PostgreSQL, iff
+    `FAST_READS`, everything else with `pandas.read_sql`.
+
+    Iff a `budget` is given, they are read in pages of rows, that fit into
+    its `fetch` share, ordered by (and continued after) the result time.
+    The query must not be ordered or limited then.
+    """
+    def read(q) -> pd.DataFrame:
+        df = copy_reader.read_numbers(q) if FAST_READS else None
+        if df is None:
+            df = pd.read_sql(q.statement, q.session.bind, parse_dates=True, index_col="result_time")
+        return _compact(df)
+
+    if budget is None:
+        return read(query)
+    pages, last = [], None
+    while True:
+        page_query = query if last is None else query.filter(Observation.result_time > last)
+        rows = budget.rows("fetch")
+        page = read(page_query.order_by(sqlalchemy.asc(Observation.result_time)).limit(rows))
+        if page.empty:
+            break
+        budget.observe("fetch", frame_bytes(page), len(page.index))
+        pages.append(page)
+        if len(page.index) < rows:
+            break
+        last = page.index[-1]
+    if not pages:
+        return page
+    return pages[0] if len(pages) == 1 else pd.concat(pages, copy=False)
+
+
 def get_context_window_data(
         datastore: SqlAlchemyDatastore,
         datastream: Datastream,
         timestamp: pd.Timestamp,
         window: int | pd.Timedelta,
+        budget: MemoryBudget | None = None,
 ) -> pd.DataFrame:
     """
     Get a window of data before a given timestamp.
@@ -112,6 +395,9 @@ def get_context_window_data(
         fetch, if a Timedelta, it defines an offset-window to fetch additionally
         before the timestamp.
 
+    budget : MemoryBudget, optional
+        Iff given, an offset-window is read in pages, see `_read_observations`.
+
     Notes
     -----
     The timestamp is excluded from the result.
@@ -121,29 +407,31 @@ def get_context_window_data(
     data: pd.DataFrame
     """
     if is_integer(window):  # detect numpy.int64
-        query = datastore.session.query(Observation).filter(
-            Observation.datastream == datastream,
+        query = _query_observations(
+            datastore,
+            Observation.datastream_id == datastream.id,
             Observation.result_time < timestamp,
         ).order_by(sqlalchemy.desc(Observation.result_time)).limit(window)
+        # the window already limits the number of rows
+        budget = None
     else:
-        query = datastore.session.query(Observation).filter(
-            Observation.datastream == datastream,
+        query = _query_observations(
+            datastore,
+            Observation.datastream_id == datastream.id,
             Observation.result_time < timestamp,
             Observation.result_time >= timestamp - window,
         )
 
-    df: pd.DataFrame = pd.read_sql(
-        query.statement,
-        query.session.bind,
-        parse_dates=True,
-        index_col="result_time",
-    )
+    df = _read_observations(query, budget)
     return df.sort_index()
 
 
 def get_unprocessed_data(
     datastore: SqlAlchemyDatastore,
     datastream: Datastream,
+    limit: int | None = None,
+    budget: MemoryBudget | None = None,
+    storage: str = "jsonb",
 ) -> pd.DataFrame | None:
     """
     Get data that has no quality flags yet.
@@ -156,13 +444,24 @@ def get_unprocessed_data(
     datastream : Datastream
         Datastream to fetch the data from
 
+    limit : int, optional
+        Iff given, only the first `limit` observations from the earliest
+        unprocessed one on are fetched. The rest is left for the next call,
+        after the quality labels of these were uploaded.
+
+    budget : MemoryBudget, optional
+        Iff given, the data is read in pages, see `_read_observations`.
+
+    storage : str
+        Where the quality labels are stored, see `qaqc_labels`.
+
     Returns
     -------
     data: pd.DataFrame or None
     """
     query = datastore.session.query(Observation.result_time).filter(
-        Observation.datastream == datastream,
-        Observation.result_quality == sqlalchemy.JSON.NULL,
+        Observation.datastream_id == datastream.id,
+        qaqc_labels.unprocessed(storage),
     )
     more_recent = query.order_by(sqlalchemy.desc(Observation.result_time)).first()
     less_recent = query.order_by(sqlalchemy.asc(Observation.result_time)).first()
@@ -170,17 +469,17 @@ def get_unprocessed_data(
     if more_recent is None:
         return None  # no new observations
 
-    query = datastore.session.query(Observation).filter(
-        Observation.datastream == datastream,
+    query = _query_observations(
+        datastore,
+        Observation.datastream_id == datastream.id,
         Observation.result_time <= more_recent[0],
         Observation.result_time >= less_recent[0],
     )
-    data: pd.DataFrame = pd.read_sql(
-        query.statement,
-        query.session.bind,
-        parse_dates=True,
-        index_col="result_time",
-    )
+    if limit is not None:
+        # the pages of `_read_observations` can't be limited in total
+        query = query.order_by(sqlalchemy.asc(Observation.result_time)).limit(limit)
+        budget = None
+    data = _read_observations(query, budget)
     return data.sort_index()
 
 
@@ -207,16 +506,45 @@ def varname_to_position(name: str) -> int:
 
 
 def _extract_by_result_type(df: pd.DataFrame) -> pd.Series:
-    """ Selects the column, specified as integer in the column 'result_type'. """
-    def select(arr: np.ndarray): return arr[1+arr[0]]
-    columns = pd.Index(['result_type', 'result_number', 'result_string', 'result_json', 'result_boolean'])
-    return df[columns].apply(select, axis=1, raw=True)
+    """
+    Selects the column, specified as integer in the column 'result_type'.
+    Missing result columns hold no values (see `_compact`). Numbers stay
+    floats, mixed types become objects.
+    """
+    types = df['result_type'].to_numpy()
+    if len(types) and (types.min() < 0 or types.max() >= len(RESULT_COLUMNS)):
+        raise IndexError(f"invalid result_type, expected 0 to {len(RESULT_COLUMNS) - 1}")
+
+    def column(i: int) -> np.ndarray:
+        name = RESULT_COLUMNS[i]
+        if name not in df.columns:
+            return np.full(len(types), np.nan)
+        return df[name].to_numpy()
+
+    if not (types != 0).any():
+        values = column(0).astype(float)
+    else:
+        values = np.select(
+            [types == i for i in range(len(RESULT_COLUMNS))],
+            [column(i).astype(object) for i in range(len(RESULT_COLUMNS))],
+            default=np.nan,
+        )
+    return pd.Series(values, index=df.index)
 
 
-def get_data(datastore: SqlAlchemyDatastore, config: pd.DataFrame) -> saqc.SaQC:
+def get_data(
+        datastore: SqlAlchemyDatastore, config: pd.DataFrame, budget: MemoryBudget | None = None,
+        storage: str = "jsonb",
+) -> saqc.SaQC:
     """
     Load data from datastore and wrap it in an SaQC object.
 
+    Iff a `budget` is given, only a slice of the unprocessed data is loaded,
+    that fits into its `qaqc` share, split evenly between the datastreams.
+    Call it again after uploading the quality labels, to get the next slice,
+    until the number of new rows (`count_rows`) is zero. The `storage`
+    of the quality labels decides, which data is unprocessed.
+
     Notes
     -----
     The window in config is defined as int or pandas.Timedelta
@@ -231,6 +559,47 @@ def get_data(datastore: SqlAlchemyDatastore, config: pd.DataFrame) -> saqc.SaQC:
     The first unprocessed observation is the earliest observation
     which never was quality-controlled before.
     """
+    limit = None
+    if budget is not None:
+        limit = max(budget.rows("qaqc") // len(get_unique_positions(config)), MIN_ROWS)
+
+    def fetch(datastream: Datastream) -> pd.DataFrame | None:
+        return get_unprocessed_data(datastore, datastream, limit, budget, storage)
+
+    return _load_data(datastore, config, fetch, budget)
+
+
+def get_range_data(
+        datastore: SqlAlchemyDatastore, config: pd.DataFrame, start: pd.Timestamp, end: pd.Timestamp,
+        budget: MemoryBudget | None = None,
+) -> saqc.SaQC:
+    """
+    Like `get_data`, but load all data from `start` (inclusive) to `end`
+    (exclusive), whether it was quality-controlled before or not, e.g.
+    to label it again after the QA/QC configuration changed. The context
+    window is fetched before the first observation in the range.
+    """
+    def fetch(datastream: Datastream) -> pd.DataFrame:
+        query = _query_observations(
+            datastore,
+            Observation.datastream_id == datastream.id,
+            Observation.result_time >= start,
+            Observation.result_time < end,
+        )
+        return _read_observations(query, budget).sort_index()
+
+    return _load_data(datastore, config, fetch, budget)
+
+
+def _load_data(
+        datastore: SqlAlchemyDatastore, config: pd.DataFrame,
+        fetch: typing.Callable[[Datastream], pd.DataFrame | None], budget: MemoryBudget | None = None,
+) -> saqc.SaQC:
+    """
+    Wrap the data returned by `fetch` for the datastream of every position
+    of the `config` and its context window in an SaQC object. The
+    timestamps are normalized to UTC.
+    """
     unique_pos = get_unique_positions(config)
     data = DictOfSeries(columns=unique_pos.map(position_to_varname))
     attrs = dict.fromkeys(data.columns, {})
@@ -239,6 +608,7 @@ def get_data(datastore: SqlAlchemyDatastore, config: pd.DataFrame) -> saqc.SaQC:
     window = config.loc[0, "window"]
 
     dummy = pd.Series([], dtype=float, index=pd.DatetimeIndex([]), name='dummy')
+    nbytes = rows = 0
 
     for pos, var_name in zip(unique_pos, data.columns):
         try:
@@ -251,30 +621,130 @@ def get_data(datastore: SqlAlchemyDatastore, config: pd.DataFrame) -> saqc.SaQC:
             # keep track of the source datastream for debugging etc.
             config.loc[config["position"] == pos, "datastream_name"] = datastream.name
 
-        raw = get_unprocessed_data(datastore, datastream)
+        raw = fetch(datastream)
         if raw is None or raw.empty:
             logging.info(f"no data for {datastream.name=}")
             data[var_name] = dummy.copy()
             continue
 
-        context = get_context_window_data(datastore, datastream, raw.index[0], window)
+        raw.index = _to_utc(raw.index)
+        context = get_context_window_data(datastore, datastream, raw.index[0], window, budget)
+        context.index = _to_utc(context.index)
         c, d = len(context.index), len(raw.index)
         logging.debug(f'fetched {d+c} ({d} data + {c} context) data points from {datastream.name=}')
         raw = pd.concat([raw, context], copy=False).sort_index()
 
         try:
             data[var_name] = _extract_by_result_type(raw)
-            attrs[var_name] = dict(context_index=context.index)
+            attrs[var_name] = dict(context_index=context.index, rows=d)
         except IndexError:
             logging.exception(f"extraction of data failed for {datastream.name=}")
             continue
+        nbytes += frame_bytes(raw)
+        rows += c + d
+
+    if budget is not None:
+        budget.observe("qaqc", nbytes * QAQC_OVERHEAD, rows)
 
     qc = saqc.SaQC(data)
     qc.attrs = attrs
     return qc
 
 
-def run_qaqc_config(data: saqc.SaQC, config: pd.DataFrame):
+def count_rows(data: saqc.SaQC) -> int:
+    """ Number of new (not context) observations loaded by `get_data`. """
+    return sum(attrs.get("rows", 0) for attrs in data.attrs.values())
+
+
+def has_unprocessed(datastore: SqlAlchemyDatastore, config: pd.DataFrame, storage: str = "jsonb") -> bool:
+    """
+    Check if the datastream of any position of the `config` has observations,
+    that were not quality-controlled yet, see `qaqc_labels.unprocessed`.
+    """
+    ids = []
+    for pos in get_unique_positions(config):
+        try:
+            ids.append(datastore.get_datastream(pos).id)
+        except DatastreamNotFoundError:
+            continue
+    if not ids:
+        return False
+    query = datastore.session.query(Observation.id).filter(
+        Observation.datastream_id.in_(ids), qaqc_labels.unprocessed(storage)
+    )
+    return bool(datastore.session.query(query.exists()).scalar())
+
+
+def has_qaqc_config(datastore: SqlAlchemyDatastore) -> bool:
+    """ Check if the thing of the datastore has a QA/QC configuration at all. """
+    return "QAQC" in get_thing_properties(datastore)
+
+
+def _to_utc(index: pd.DatetimeIndex) -> pd.DatetimeIndex:
+    """
+    Normalize `index` to UTC.
+
+    Parsed timestamps are usually naive, while timestamps read back
+    from the datastore are timezone aware. Naive timestamps are stored
+    as UTC, so we interpret them as such.
+    """
+    return index.tz_localize("UTC") if index.tz is None else index.tz_convert("UTC")
+
+
+def _as_observations(values: pd.Series) -> pd.DataFrame:
+    """
+    Lay out parsed `values` like the observations read by `_read_observations`,
+    each value in the result column of its type (see `result_columns`).
+    """
+    index = pd.DatetimeIndex(values.index, name="result_time")
+    if is_numeric_dtype(values) and not is_bool_dtype(values):
+        df = pd.DataFrame(
+            {"result_type": np.zeros(len(values), dtype=np.int8), "result_number": values.to_numpy(float)},
+            index=index,
+        )
+    else:
+        df = pd.DataFrame.from_records([result_columns(v) for v in values], index=index)
+    return _compact(df)
+
+
+def get_data_from_frame(
+        datastore: SqlAlchemyDatastore, config: pd.DataFrame, frame: pd.DataFrame
+) -> saqc.SaQC:
+    """
+    Wrap freshly parsed data in an SaQC object, without reading it back
+    from the datastore.
+
+    Like `get_data`, but the new (unprocessed) data is taken from `frame`,
+    only the context window is fetched from the datastore.
+
+    Parameters
+    ----------
+    datastore : SqlAlchemyDatastore
+        Datastore to fetch the context window from. The data
+        in `frame` must already be stored there.
+
+    config : pd.DataFrame
+        The QA/QC config, see `parse_qaqc_config`.
+
+    frame : pd.DataFrame
+        The parsed data, with a `DatetimeIndex` and the datastream
+        positions as columns (see `AbstractParser.get_parsed_frame`).
+    """
+    columns = {str(c): c for c in frame.columns}
+
+    def fetch(datastream: Datastream) -> pd.DataFrame | None:
+        if (column := columns.get(str(datastream.position))) is None:
+            return None
+        # NaNs are never stored, so they aren't part of the data either
+        return _as_observations(frame[column].dropna()).sort_index()
+
+    return _load_data(datastore, config, fetch)
+
+
+def run_qaqc_config(
+        data: saqc.SaQC, config: pd.DataFrame | QaqcPipeline, cache: ResultCache | None = None,
+        shards: ShardPool | None = None,
+):
     """
     Run a qc-tests from config on given data.
 
@@ -283,33 +753,166 @@ def run_qaqc_config(data: saqc.SaQC, config: pd.DataFrame):
     data : saqc.SaQC
         Hold data and quality labels (aka. flags).
 
-    config : pd.dataFrame
-        Collection of tests to run on data.
+    config : pd.dataFrame or QaqcPipeline
+        Collection of tests to run on data. A compiled pipeline
+        calls the resolved methods directly.
+
+    cache : ResultCache, optional
+        Reuse the flags of allowed tests on unchanged blocks
+        of data, see `qaqc_cache`.
+
+    shards : ShardPool, optional
+        Run allowed tests on long series in parallel, split
+        by time, see `qaqc_shards`.
 
     Returns
     -------
     processed : saqc.SaQC
         Hold data and quality labels (aka. flags).
     """
+    if isinstance(config, QaqcPipeline):
+        for step in config.steps:
+            kwargs = step.call_kwargs()
+            info = dict(position=step.position, function=step.function, kwargs=kwargs)
+            data = _run_saqc_function(
+                data, step.var_name, step.function, kwargs, info, cache, step.method, shards
+            )
+        return data
+
     for idx, row in config.iterrows():
         var = position_to_varname(row["position"])
         func = row["function"]
         kwargs = row["kwargs"]
         info = row.to_dict()
-        data = _run_saqc_function(data, var, func, kwargs, info)
+        data = _run_saqc_function(data, var, func, kwargs, info, cache, shards=shards)
 
     return data
 
 
 def _run_saqc_function(
-        qc_obj: saqc.SaQC, var_name: str, func_name: str, kwargs: dict, info: dict
+        qc_obj: saqc.SaQC, var_name: str, func_name: str, kwargs: dict, info: dict,
+        cache: ResultCache | None = None, method: typing.Callable | None = None,
+        shards: ShardPool | None = None,
 ):
-    method = getattr(qc_obj, func_name, None)
+    if cache is not None and (margin := cache.margin(func_name, kwargs)) is not None:
+        if (cached := _run_cached(qc_obj, var_name, func_name, kwargs, cache, margin)) is not None:
+            return cached
+    if shards is not None and (sharded := _run_sharded(qc_obj, var_name, func_name, kwargs, shards)) is not None:
+        return sharded
     logging.debug(f"running SaQC with {info=}")
+    if method is not None:
+        # resolved by `compile_qaqc_config`
+        return method(qc_obj, var_name, **kwargs)
+    method = getattr(qc_obj, func_name, None)
     qc_obj = method(var_name, **kwargs)
     return qc_obj
 
 
+def _run_block(
+        qc_obj: saqc.SaQC, var_name: str, func_name: str, kwargs: dict,
+        lo: int, hi: int, start: int, stop: int,
+) -> np.ndarray:
+    """
+    Run a test on the values [lo, hi) of a variable (a block including its
+    margin) and get the new flags of the values [start, stop) (the block).
+    The current flags of the values are respected.
+    """
+    return _test_block(
+        qc_obj.data[var_name].iloc[lo:hi], qc_obj._flags[var_name].iloc[lo:hi], qc_obj._scheme,
+        var_name, func_name, kwargs, start - lo, stop - lo,
+    )
+
+
+def _test_block(
+        data: pd.Series, flags: pd.Series, scheme, var_name: str, func_name: str, kwargs: dict,
+        start: int, stop: int,
+) -> np.ndarray:
+    """
+    Run a test on the values and current flags of a block of a variable
+    and get the new flags of the values [start, stop). Runs in a worker
+    process for sharded tests, so it only gets picklable arguments.
+    """
+    block = saqc.SaQC(data.to_frame(var_name), scheme=scheme)
+    if (flags > UNFLAGGED).any():
+        block._flags[var_name] = flags
+    block = getattr(block, func_name)(var_name, **kwargs)
+    column = block._flags.history[var_name].hist.iloc[:, -1]
+    return column.iloc[start:stop].to_numpy(dtype=float)
+
+
+def _append_flags(qc_obj: saqc.SaQC, var_name: str, func_name: str, kwargs: dict, flags: pd.Series):
+    """ Add the flags of a test to the history of a variable, like SaQC does. """
+    meta = dict(func=func_name, args=(var_name,), kwargs=kwargs)
+    qc_obj._flags.history[var_name].append(flags, meta)
+
+
+def _run_cached(
+        qc_obj: saqc.SaQC, var_name: str, func_name: str, kwargs: dict,
+        cache: ResultCache, margin: pd.Timedelta,
+) -> saqc.SaQC | None:
+    """
+    Run a test block-wise and reuse the cached flags of unchanged blocks.
+    Returns None, if the test can't run block-wise on the variable.
+    """
+    if var_name not in qc_obj.data.columns or {"field", "target"} & kwargs.keys():
+        return None
+    data = qc_obj.data[var_name]
+    if not isinstance(data.index, pd.DatetimeIndex):
+        return None
+    flags = qc_obj._flags[var_name]
+
+    result = np.full(len(data.index), np.nan)
+    for block_start, block_stop, start, stop in split_blocks(data.index, cache.block):
+        lo = data.index.searchsorted(block_start - margin, side="left")
+        hi = data.index.searchsorted(block_stop + margin, side="left")
+        key = cache.key(
+            func_name, kwargs, data.iloc[lo:hi], flags.iloc[lo:hi], salt=getattr(saqc, "__version__", "")
+        )
+        if (block := cache.get(key, stop - start)) is None:
+            block = _run_block(qc_obj, var_name, func_name, kwargs, lo, hi, start, stop)
+            cache.put(key, block)
+        result[start:stop] = block
+
+    _append_flags(qc_obj, var_name, func_name, kwargs, pd.Series(result, index=data.index))
+    logging.debug(f"QA/QC: {func_name} on {var_name}, cache {cache.counts}")
+    return qc_obj
+
+
+def _run_sharded(
+        qc_obj: saqc.SaQC, var_name: str, func_name: str, kwargs: dict, shards: ShardPool,
+) -> saqc.SaQC | None:
+    """
+    Run a test on shards of a long variable in parallel and stitch the
+    flags together. Returns None, if the test can't run on shards.
+    """
+    if var_name not in qc_obj.data.columns or {"field", "target"} & kwargs.keys():
+        return None
+    data = qc_obj.data[var_name]
+    if not isinstance(data.index, pd.DatetimeIndex):
+        return None
+    if (margin := shards.margin(func_name, kwargs, len(data.index))) is None:
+        return None
+    flags = qc_obj._flags[var_name]
+
+    plan = shards.plan(data.index, margin)
+    blocks = shards.map(_test_block, [
+        (data.iloc[lo:hi], flags.iloc[lo:hi], qc_obj._scheme, var_name, func_name, kwargs, start - lo, stop - lo)
+        for lo, hi, start, stop in plan
+    ])
+    result = np.full(len(data.index), np.nan)
+    for (_, _, start, stop), block in zip(plan, blocks):
+        result[start:stop] = block
+
+    if shards.verify:
+        sequential = _test_block(data, flags, qc_obj._scheme, var_name, func_name, kwargs, 0, len(data.index))
+        if not shards.compare(f"{func_name} on {var_name}", result, sequential):
+            result = sequential
+
+    _append_flags(qc_obj, var_name, func_name, kwargs, pd.Series(result, index=data.index))
+    logging.debug(f"QA/QC: {func_name} on {var_name} in {len(plan)} shards, {shards.counts}")
+    return qc_obj
+
+
 def _last_valid_test(history: History) -> pd.Series:
     """
     todo: add this to saqc.History().
@@ -354,12 +957,13 @@ def _remove_context_window(df: pd.DataFrame, idx: pd.Index | None = None) -> pd.
     return df if idx is None else df.drop(idx, errors='ignore')
 
 
-def upload_qc_labels(data: saqc.SaQC, config: pd.DataFrame, datastore: SqlAlchemyDatastore):
+def upload_qc_labels(data: saqc.SaQC, config: pd.DataFrame, datastore: SqlAlchemyDatastore, storage: str = "jsonb"):
     # we don't want data-derivates to be uploaded.
     # So we can't use all columns from data.
     # see also: #GL25
     # https://git.ufz.de/rdm-software/timeseries-management/tsm-extractor/-/issues/25
     positions = get_unique_positions(config)
+    label_ids = {}
     N = 0
     for pos in positions:
         var = position_to_varname(pos)
@@ -367,7 +971,10 @@ def upload_qc_labels(data: saqc.SaQC, config: pd.DataFrame, datastore: SqlAlchem
         df = _remove_context_window(df, data.attrs[var].get('context_index'))
         if df.empty:
             continue
-        n = _upload_qc_labels(datastore, pos, df)
+        if storage == "normalized":
+            n = _upload_normalized_labels(datastore, pos, df, label_ids)
+        else:
+            n = _upload_qc_labels(datastore, pos, df)
         logging.debug(f"QA/QC: uploaded {n} quality labels to {config.loc[pos, 'datastream_name']}")
         N += n
     return N
@@ -379,7 +986,7 @@ def _update_observation(datastore: SqlAlchemyDatastore, datastream, result_time:
     if not isinstance(result_time, pd.Timestamp):
         raise TypeError(type(result_time).__name__)
     return datastore.session.query(Observation).filter(
-        Observation.datastream == datastream,
+        Observation.datastream_id == datastream.id,
         Observation.result_time == result_time
     ).update(to_update)
 
@@ -416,3 +1023,30 @@ def _upload_qc_labels(datastore, position: int, df: pd.DataFrame):
     rowcounts = df.apply(update, axis=1)
     datastore.session.commit()
     return rowcounts.sum()
+
+
+def _upload_normalized_labels(datastore, position: int, df: pd.DataFrame, label_ids: dict) -> int:
+    """
+    Like `_upload_qc_labels`, but store the labels in the tables of
+    `qaqc_labels`. The ids of the labels are cached in `label_ids`.
+    """
+    if df.empty:
+        return 0
+    stream = datastore.get_datastream(position)
+    flags = df['flag'].to_numpy(dtype=float)
+    flagged = ~np.isnan(flags)
+
+    # the arguments of a test are the same objects for all of its rows,
+    # so every test is converted to json once
+    metas, by_test = [], {}
+    for func, args, kwargs in df.loc[flagged, ['func', 'args', 'kwargs']].itertuples(index=False):
+        key = (str(func), id(args), id(kwargs))
+        if (meta := by_test.get(key)) is None:
+            meta = by_test[key] = json.dumps(to_jsonb(dict(func=func, args=args, kwargs=kwargs)), sort_keys=True)
+        metas.append(meta)
+
+    ids = np.full(len(flags), np.nan)
+    ids[flagged] = qaqc_labels.get_label_ids(datastore.session, metas, label_ids)
+    n = qaqc_labels.write_flags(datastore.session, stream.id, df.index, ids, flags)
+    datastore.session.commit()
+    return n
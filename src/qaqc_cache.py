@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import annotations
+
+import datetime
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+"""
+A disk-backed cache of the flags, that a QA/QC test produced on a slice of data.
+
+The data of a variable is split into blocks of a fixed length (e.g. days), which
+are aligned to the epoch and therefore stay the same across runs. A test is run on
+every block, extended by a symmetric `margin` of data on both sides, and only the
+flags within the block are kept. The flags of a block are cached by a hash of the
+function name, its arguments and the data and flags of the extended block, so an
+unchanged block is never tested again. Only the new blocks are computed.
+
+This is only correct for tests, that are deterministic and local to a window of at
+most `margin`, i.e. the flag of a value depends on the data at most `margin` before
+and after it. Tests need to be allowed explicitly with their margin, see
+`parse_allowlist`.
+"""
+
+DEFAULT_BLOCK = "1D"
+DEFAULT_MAX_SIZE = 1024*1024*256
+
+
+def parse_allowlist(spec: str) -> Dict[str, str]:
+    """
+    Parse the functions, whose results may be cached.
+
+    Parameters
+    ----------
+    spec:
+        comma separated function names, each optionally followed by
+        ``=<margin>``. The margin is either a time offset (e.g. '1h'),
+        or the name of an argument of the function, that holds the
+        window, e.g. 'flagRange,flagMAD=window,flagConstants=2h'.
+        Defaults to no margin.
+
+    Returns
+    -------
+    function name -> margin
+    """
+    allowlist = {}
+    for item in filter(None, (s.strip() for s in (spec or "").split(","))):
+        func, _, margin = item.partition("=")
+        allowlist[func.strip()] = margin.strip() or "0s"
+    return allowlist
+
+
+def get_margin(allowlist: Dict[str, str], func_name: str, kwargs: dict) -> pd.Timedelta | None:
+    """
+    The margin of `func_name` called with `kwargs`, see `parse_allowlist`,
+    or None, if the function isn't allowed or has no time margin.
+    """
+    if (margin := allowlist.get(func_name)) is None:
+        return None
+    try:
+        return pd.Timedelta(margin)
+    except ValueError:
+        pass
+    # the name of the window argument
+    window = kwargs.get(margin)
+    try:
+        # a number is a window of a number of values, not of a time span
+        if isinstance(window, (str, datetime.timedelta)):
+            return pd.Timedelta(window)
+    except ValueError:
+        pass
+    logging.debug(f"no time margin for {func_name} in {margin}={window!r}")
+    return None
+
+
+def split_blocks(index: pd.DatetimeIndex, block: str | pd.Timedelta) -> List[Tuple[pd.Timestamp, pd.Timestamp, int, int]]:
+    """
+    Split the sorted `index` into blocks of length `block`, aligned to the epoch.
+
+    Returns
+    -------
+    start, stop (exclusive), and the integer positions of the first
+    and behind the last index value of every non-empty block
+    """
+    if index.empty:
+        return []
+    block = pd.Timedelta(block)
+    starts = index.floor(block).unique()
+    bounds = index.searchsorted(starts.append(starts[-1:] + block))
+    return [
+        (start, start + block, int(bounds[i]), int(bounds[i + 1]))
+        for i, start in enumerate(starts)
+    ]
+
+
+class ResultCache:
+    """
+    Size-bounded disk cache of the flags of QA/QC tests on blocks of data.
+
+    Every entry is one `.npy` file in `directory`. Iff the total size
+    exceeds `max_size`, the least recently used entries are deleted.
+
+    Parameters
+    ----------
+    directory:
+        directory of the cache files, created if missing
+    allowlist:
+        function name -> margin, see `parse_allowlist`
+    max_size:
+        maximum size of all cache files in bytes
+    block:
+        length of the blocks, the data is split into
+    """
+
+    def __init__(
+        self, directory: str, allowlist: Dict[str, str],
+        max_size: int = DEFAULT_MAX_SIZE, block: str | pd.Timedelta = DEFAULT_BLOCK,
+    ):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.allowlist = allowlist
+        self.max_size = max_size
+        self.block = pd.Timedelta(block)
+        self.counts = dict(hits=0, misses=0, evicted=0)
+        self._sizes = {
+            entry.path: entry.stat().st_size
+            for entry in os.scandir(directory) if entry.name.endswith(".npy")
+        }
+
+    def margin(self, func_name: str, kwargs: dict) -> pd.Timedelta | None:
+        """
+        The margin of `func_name` called with `kwargs`, or None, if its
+        results must not be cached.
+        """
+        return get_margin(self.allowlist, func_name, kwargs)
+
+    @staticmethod
+    def key(func_name: str, kwargs: dict, data: pd.Series, flags: pd.Series, salt: str = "") -> str:
+        """
+        Hash the function call and the data and flags of an extended block.
+        `salt` should change, whenever the results might change otherwise,
+        e.g. with the version of the QA/QC library.
+        """
+        digest = hashlib.sha256(
+            json.dumps([salt, func_name, kwargs], sort_keys=True, default=str).encode()
+        )
+        digest.update(pd.util.hash_pandas_object(data, index=True).values.tobytes())
+        digest.update(pd.util.hash_pandas_object(flags, index=False).values.tobytes())
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.npy")
+
+    def get(self, key: str, length: int) -> np.ndarray | None:
+        """ Get the cached flags of `length` values, or None. """
+        path = self._path(key)
+        try:
+            flags = np.load(path, allow_pickle=False)
+        except (OSError, ValueError):
+            self.counts["misses"] += 1
+            return None
+        if flags.shape != (length,):
+            self.counts["misses"] += 1
+            return None
+        # mark as recently used
+        os.utime(path)
+        self.counts["hits"] += 1
+        return flags
+
+    def put(self, key: str, flags: np.ndarray) -> None:
+        path = self._path(key)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, np.asarray(flags, dtype=float), allow_pickle=False)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        self._sizes[path] = os.path.getsize(path)
+        if sum(self._sizes.values()) > self.max_size:
+            self._evict()
+
+    def _evict(self) -> None:
+        """ Delete the least recently used entries, until the cache fits into `max_size`. """
+        entries = []
+        for path in self._sizes:
+            try:
+                entries.append((os.stat(path).st_mtime, path))
+            except FileNotFoundError:
+                # deleted by another process
+                pass
+        self._sizes = {path: self._sizes[path] for _, path in entries}
+        total = sum(self._sizes.values())
+        for _, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            total -= self._sizes.pop(path)
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            self.counts["evicted"] += 1
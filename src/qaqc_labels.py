@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import annotations
+
+import hashlib
+import json
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+import sqlalchemy
+from sqlalchemy.dialects import postgresql
+from tsm_datastore_lib.SqlAlchemy.Model import Observation
+
+"""
+Storage of the quality labels, that the QA/QC assigns to observations.
+
+ - `jsonb`: the label, i.e. the function, its arguments and the flag of the
+   test, that flagged an observation last, is written to the json column
+   `observation.result_quality`, one update of the observation per label.
+ - `normalized`: the function and arguments of every distinct test are stored
+   once in the table `quality_label`, an observation only gets a row of its
+   id, the id of the label and the flag in the table `observation_quality`.
+   The view `observation_labeled` shows the observations with their
+   `result_quality` as if stored as `jsonb`.
+
+The tables and the view are created by `postgres/postgres-quality-labels.sql`.
+Observations, that are labeled in either storage, are not quality controlled
+again by the other one.
+"""
+
+LABEL_STORAGES = ("jsonb", "normalized")
+
+# Number of flags written by one statement
+UPLOAD_BATCH_SIZE = 5000
+
+metadata = sqlalchemy.MetaData()
+
+quality_label = sqlalchemy.Table(
+    "quality_label", metadata,
+    sqlalchemy.Column("id", sqlalchemy.BigInteger, primary_key=True),
+    sqlalchemy.Column("hash", sqlalchemy.CHAR(32), nullable=False, unique=True),
+    sqlalchemy.Column("meta", postgresql.JSONB, nullable=False),
+)
+
+observation_quality = sqlalchemy.Table(
+    "observation_quality", metadata,
+    sqlalchemy.Column("observation_id", sqlalchemy.BigInteger, primary_key=True),
+    sqlalchemy.Column("label_id", sqlalchemy.BigInteger, nullable=True),
+    sqlalchemy.Column("flag", sqlalchemy.Float, nullable=True),
+)
+
+
+class MissingLabelTablesError(Exception):
+    def __init__(self, tables: List[str]):
+        self.message = (
+            f'Normalized quality labels need the tables {", ".join(tables)}. '
+            f'Create them with postgres/postgres-quality-labels.sql'
+        )
+        super().__init__(self.message)
+
+
+def check_storage(bind, storage: str) -> None:
+    """ Fail early, if the database doesn't support the label `storage`. """
+    if storage not in LABEL_STORAGES:
+        raise ValueError(f"unknown label storage {storage!r}, expected one of {LABEL_STORAGES}")
+    if storage == "jsonb":
+        return
+    if bind.dialect.name != "postgresql":
+        raise NotImplementedError("normalized quality labels are only supported for PostgreSQL")
+    inspector = sqlalchemy.inspect(bind)
+    missing = [t.name for t in metadata.sorted_tables if not inspector.has_table(t.name)]
+    if missing:
+        raise MissingLabelTablesError(missing)
+
+
+def unprocessed(storage: str):
+    """ Filter clause of the observations, that have no quality labels yet. """
+    # a json 'null' marks observations, which are not quality controlled yet
+    clause = Observation.result_quality == sqlalchemy.JSON.NULL
+    if storage == "normalized":
+        labeled = sqlalchemy.exists().where(observation_quality.c.observation_id == Observation.id)
+        clause = sqlalchemy.and_(clause, ~labeled)
+    return clause
+
+
+def get_label_ids(session, metas: List[str], cache: Dict[str, int]) -> List[int]:
+    """
+    Ids of the labels with the metadata `metas` (json documents), missing
+    labels are created. Known ids are taken from (and added to) `cache`.
+    """
+    hashes = {meta: hashlib.md5(meta.encode()).hexdigest() for meta in set(metas) if meta not in cache}
+    if hashes:
+        stmt = postgresql.insert(quality_label).values([
+            dict(hash=h, meta=json.loads(meta)) for meta, h in hashes.items()
+        ]).on_conflict_do_nothing(index_elements=["hash"])
+        session.execute(stmt)
+        ids = dict(session.execute(
+            sqlalchemy.select(quality_label.c.hash, quality_label.c.id)
+            .where(quality_label.c.hash.in_(list(hashes.values())))
+        ).all())
+        cache.update({meta: ids[h] for meta, h in hashes.items()})
+    return [cache[meta] for meta in metas]
+
+
+def _utc(index: pd.DatetimeIndex) -> pd.DatetimeIndex:
+    # naive timestamps are stored as UTC
+    return index.tz_localize("UTC") if index.tz is None else index.tz_convert("UTC")
+
+
+def write_flags(
+    session, datastream_id: int, result_times: pd.DatetimeIndex, label_ids: np.ndarray, flags: np.ndarray,
+) -> int:
+    """
+    Write the normalized labels of the observations of a datastream at
+    `result_times`. A missing label id or flag is written as NULL.
+    Returns the number of written rows.
+    """
+    if result_times.empty:
+        return 0
+    result_times = _utc(pd.DatetimeIndex(result_times))
+    ids = pd.read_sql(
+        sqlalchemy.select(Observation.id, Observation.result_time).where(
+            Observation.datastream_id == datastream_id,
+            Observation.result_time >= result_times.min().to_pydatetime(),
+            Observation.result_time <= result_times.max().to_pydatetime(),
+        ),
+        session.connection(),
+        parse_dates=["result_time"],
+    )
+    found = pd.Index(_utc(pd.DatetimeIndex(ids["result_time"]))).get_indexer(result_times)
+    keep = found >= 0
+    observation_ids = ids["id"].to_numpy()[found[keep]]
+    label_ids, flags = np.asarray(label_ids, dtype=float)[keep], np.asarray(flags, dtype=float)[keep]
+
+    rows = [
+        dict(
+            observation_id=int(observation_id),
+            label_id=None if np.isnan(label_id) else int(label_id),
+            flag=None if np.isnan(flag) else flag,
+        )
+        for observation_id, label_id, flag in zip(observation_ids.tolist(), label_ids.tolist(), flags.tolist())
+    ]
+    for start in range(0, len(rows), UPLOAD_BATCH_SIZE):
+        stmt = postgresql.insert(observation_quality).values(rows[start:start + UPLOAD_BATCH_SIZE])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["observation_id"],
+            set_=dict(label_id=stmt.excluded.label_id, flag=stmt.excluded.flag),
+        )
+        session.execute(stmt)
+    return len(rows)
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import annotations
+
+import concurrent.futures
+import logging
+from typing import Callable, Dict, Iterable, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from qaqc_cache import get_margin
+
+"""
+Run a QA/QC test on one long series in parallel, split by time.
+
+A long, dense series (e.g. 1 Hz data over months) is split into shards of
+the same number of values, one or a few per worker process. Every shard
+is extended by the `margin` of the test, i.e. its window, on both sides,
+the test runs on the extended shard and only the flags within the shard
+are kept. The flags of all shards are stitched together and added to the
+history of the variable as one test, like a sequential run does.
+
+Like the result cache (see `qaqc_cache`), this is only correct for tests,
+that are deterministic and local to a window of at most `margin`. They
+need to be allowed explicitly with their margin, see
+`qaqc_cache.parse_allowlist`. With `verify`, every sharded test is run
+sequentially as well, and the sequential flags are kept, if they differ.
+"""
+
+# Series with less values are tested sequentially
+DEFAULT_MIN_ROWS = 100000
+# Shards per worker, more shards balance uneven tests better
+SHARDS_PER_WORKER = 2
+
+
+def plan_shards(index: pd.DatetimeIndex, shards: int, margin: pd.Timedelta) -> List[Tuple[int, int, int, int]]:
+    """
+    Split the sorted `index` into `shards` shards of about the same number
+    of values, extended by `margin` on both sides.
+
+    Returns
+    -------
+    the integer positions lo, hi (exclusive) of the extended shard and
+    start, stop (exclusive) of the shard itself, for every shard
+    """
+    bounds = np.unique(np.linspace(0, len(index), max(1, shards) + 1).astype(int))
+    plan = []
+    for start, stop in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+        lo = int(index.searchsorted(index[start] - margin, side="left"))
+        hi = int(index.searchsorted(index[stop - 1] + margin, side="right"))
+        plan.append((lo, hi, start, stop))
+    return plan
+
+
+class ShardPool:
+    """
+    A pool of processes, that run allowed QA/QC tests on shards of a series.
+
+    The processes are started on the first sharded test and reused for
+    all later ones, until `close`. The number of sharded and sequential
+    tests, shards and of differences found by `verify` are available
+    from `counts`.
+
+    Parameters
+    ----------
+    allowlist:
+        function name -> margin, see `qaqc_cache.parse_allowlist`
+    workers:
+        number of processes
+    min_rows:
+        series with less values are tested sequentially
+    verify:
+        run every sharded test sequentially as well and compare the flags
+    """
+
+    def __init__(
+        self, allowlist: Dict[str, str], workers: int,
+        min_rows: int = DEFAULT_MIN_ROWS, verify: bool = False,
+    ):
+        self.allowlist = allowlist
+        self.workers = workers
+        self.min_rows = min_rows
+        self.verify = verify
+        self.counts = dict(sharded=0, sequential=0, shards=0, mismatches=0)
+        self._executor = None
+
+    def margin(self, func_name: str, kwargs: dict, rows: int) -> pd.Timedelta | None:
+        """
+        The margin of `func_name` called with `kwargs` on a series of
+        `rows` values, or None, if it must be tested sequentially.
+        """
+        if rows < max(self.min_rows, 2) or (margin := get_margin(self.allowlist, func_name, kwargs)) is None:
+            self.counts["sequential"] += 1
+            return None
+        return margin
+
+    def plan(self, index: pd.DatetimeIndex, margin: pd.Timedelta) -> List[Tuple[int, int, int, int]]:
+        return plan_shards(index, self.workers * SHARDS_PER_WORKER, margin)
+
+    def map(self, func: Callable, tasks: Iterable[tuple]) -> List:
+        """ Run `func` with the arguments of every task in the pool, in order. """
+        if self._executor is None:
+            self._executor = concurrent.futures.ProcessPoolExecutor(self.workers)
+        futures = [self._executor.submit(func, *args) for args in tasks]
+        self.counts["sharded"] += 1
+        self.counts["shards"] += len(futures)
+        return [future.result() for future in futures]
+
+    def compare(self, name: str, sharded: np.ndarray, sequential: np.ndarray) -> bool:
+        """ Compare the flags of a sharded and a sequential run of a test. """
+        if np.array_equal(sharded, sequential, equal_nan=True):
+            return True
+        self.counts["mismatches"] += 1
+        differ = ~((sharded == sequential) | (np.isnan(sharded) & np.isnan(sequential)))
+        logging.warning(
+            f"QA/QC: {name} flagged {int(differ.sum())} values differently, when run on shards. "
+            f"Is its margin too small? Keeping the sequential flags."
+        )
+        return False
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self) -> ShardPool:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,120 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from Datastore.ObservationBatch import ObservationBatch, store_batch
+from MockDatasource import MockDataSource
+from MockDatastore import MockDatastore
+from Parser.AbstractParser import AbstractParser
+
+
+class BatchDatastore(MockDatastore):
+    def __init__(self):
+        super().__init__()
+        self.batches = []
+
+    def store_observation_batch(self, batch: ObservationBatch) -> None:
+        self.batches.append(batch)
+
+
+class EmittingParser(AbstractParser):
+    def do_parse(self):
+        pass
+
+
+class TestObservationBatch(unittest.TestCase):
+
+    FRAME = pd.DataFrame({
+        "a": [1., np.nan, 3.],
+        "time": pd.date_range("2020-01-01", periods=3, freq="1h"),
+        "b": ["x", "y", None],
+    })
+
+    def test_from_frame(self):
+        """
+        test, that a wide frame is flattened row by row and missing values are left out
+        """
+        batch = ObservationBatch.from_frame(self.FRAME, 1, "/src")
+        self.assertEqual(len(batch), 4)
+        self.assertListEqual(batch.positions.tolist(), [0, 2, 2, 0])
+        self.assertListEqual(batch.values.tolist(), [1., "x", "y", 3.])
+        self.assertListEqual(batch.headers.tolist(), ["a", "b", "b", "a"])
+        self.assertListEqual(batch.timestamps.tolist(), self.FRAME.time.iloc[[0, 0, 1, 2]].tolist())
+
+        keep = np.ones((3, 3), dtype=bool)
+        keep[0, 0] = False
+        batch = ObservationBatch.from_frame(self.FRAME, 1, "/src", keep)
+        self.assertListEqual(batch.positions.tolist(), [2, 2, 0])
+
+        # a common numeric type is kept
+        batch = ObservationBatch.from_frame(self.FRAME.iloc[:, :2], 1, "/src")
+        self.assertEqual(batch.values.dtype, np.float64)
+
+    def test_observations(self):
+        """
+        test, that a batch converts into the same observations, the parsers built before
+        """
+        batch = ObservationBatch.from_frame(self.FRAME, 1, "/src")
+        observations = batch.to_observations()
+        self.assertListEqual(
+            [(o.timestamp, o.value, o.position, o.origin, o.header) for o in observations],
+            [(t, v, p, "/src", h) for t, v, p, h in zip(batch.timestamps, batch.values, batch.positions, batch.headers)],
+        )
+        self.assertIsInstance(observations[0].timestamp, pd.Timestamp)
+
+        with self.assertRaises(ValueError):
+            ObservationBatch(self.FRAME.time, [1, 2], [0, 0, 0], "/src")
+
+    def test_store(self):
+        """
+        test, that batches are passed as they are, if the datastore supports it
+        """
+        batch = ObservationBatch.from_frame(self.FRAME, 1, "/src")
+        datastore = BatchDatastore()
+        store_batch(datastore, batch)
+        self.assertListEqual(datastore.batches, [batch])
+        self.assertListEqual(datastore.observations, [])
+
+        datastore = MockDatastore()
+        store_batch(datastore, batch)
+        self.assertEqual(len(datastore.observations), 4)
+
+    def test_emit(self):
+        """
+        test, that emitted values are buffered and flushed by size and time
+        """
+        datastore = BatchDatastore()
+        parser = EmittingParser(MockDataSource(), datastore)
+        parser.batch_size = 10
+        times = pd.date_range("2020-01-01", periods=4, freq="1h")
+
+        parser.emit(times, np.arange(4.), np.zeros(4))
+        parser.emit(times, np.arange(4.), np.ones(4))
+        self.assertListEqual(datastore.batches, [])
+        parser.emit(times, np.arange(4.), np.full(4, 2))
+        self.assertEqual(len(datastore.batches), 1)
+        self.assertEqual(len(datastore.batches[0]), 12)
+        self.assertListEqual(datastore.batches[0].positions.tolist(), [0] * 4 + [1] * 4 + [2] * 4)
+
+        # a new origin, or the oldest value waited too long
+        parser.emit(times, np.arange(4.), np.zeros(4), origin="/other")
+        parser.emit(times, np.arange(4.), np.zeros(4))
+        self.assertEqual(len(datastore.batches), 2)
+        self.assertEqual(datastore.batches[1].origin, "/other")
+        with mock.patch("Parser.AbstractParser.time.monotonic", return_value=1e12):
+            parser.emit(times, np.arange(4.), np.zeros(4))
+        self.assertEqual(len(datastore.batches), 3)
+        self.assertEqual(len(datastore.batches[2]), 8)
+
+        parser.flush()
+        self.assertEqual(len(datastore.batches), 3)
+        self.assertEqual(parser.stats.stages["store"].calls, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,194 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from Datastore.ObservationBatch import ObservationBatch
+from Datastore.SpoolDatastore import (
+    SpoolDatastore, SpoolLockedError, SpoolNotDrainedError, _read_segment, _write_segment,
+)
+from MockDatastore import MockDatastore
+
+
+class BatchDatastore(MockDatastore):
+    """ Stores batches, fails the first `failures` commits. """
+
+    def __init__(self, failures: int = 0):
+        super().__init__()
+        self.batches = []
+        self.pending = []
+        self.failures = failures
+        self.rollbacks = 0
+
+    def store_observation_batch(self, batch: ObservationBatch) -> None:
+        self.pending.append(batch)
+
+    def flush(self) -> None:
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("database is gone")
+        self.batches.extend(self.pending)
+        self.pending.clear()
+
+    def rollback(self) -> None:
+        self.rollbacks += 1
+        self.pending.clear()
+
+
+def _batch(values, tz=None) -> ObservationBatch:
+    return ObservationBatch(
+        timestamps=pd.date_range("2020-01-01", periods=len(values), freq="1min", tz=tz),
+        values=values,
+        positions=np.arange(len(values)) % 2,
+        origin="/data.csv",
+        headers=[f"h{i}" for i in range(len(values))],
+    )
+
+
+class TestSpool(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.directory = os.path.join(self.tmp.name, "spool")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def assertBatchEqual(self, got: ObservationBatch, expected: ObservationBatch):
+        # the same instants, a timezone comes back as UTC
+        self.assertListEqual(got.timestamps.asi8.tolist(), expected.timestamps.asi8.tolist())
+        np.testing.assert_array_equal(got.values, expected.values)
+        self.assertEqual(got.values.dtype, expected.values.dtype)
+        self.assertListEqual(got.positions.tolist(), expected.positions.tolist())
+        self.assertListEqual(got.headers.tolist(), expected.headers.tolist())
+        self.assertEqual(got.origin, expected.origin)
+
+    def test_segment(self):
+        """
+        test, that numbers, mixed values and timezones survive a segment
+        """
+        values = np.empty(4, dtype=object)
+        values[:] = [1.5, "text", {"a": [1, 2]}, True]
+        path = os.path.join(self.tmp.name, "segment.npz")
+        for batch in [_batch(np.array([1., np.nan, 3.])), _batch(values, tz="Europe/Berlin")]:
+            _write_segment(path, batch)
+            self.assertFalse(os.path.exists(path + ".tmp"))
+            got = _read_segment(path)
+            self.assertBatchEqual(got, batch)
+            self.assertEqual(str(got.timestamps.tz), "None" if batch.timestamps.tz is None else "UTC")
+
+    def test_finalize(self):
+        """
+        test, that all spooled batches are written in order by `finalize`
+        """
+        datastore = BatchDatastore()
+        spool = SpoolDatastore(datastore, self.directory, flush_rows=2)
+        batches = [_batch(np.arange(3.) + i) for i in range(5)]
+        for batch in batches:
+            spool.store_observation_batch(batch)
+        spool.finalize()
+        self.assertEqual(len(datastore.batches), 5)
+        for got, expected in zip(datastore.batches, batches):
+            self.assertBatchEqual(got, expected)
+        self.assertListEqual(os.listdir(self.directory), [])
+        self.assertEqual(spool.counts["spooled_rows"], 15)
+        self.assertEqual(spool.counts["flushed_rows"], 15)
+
+    def test_replay(self):
+        """
+        test, that segments of an interrupted job are written on init, partial ones are dropped
+        """
+        os.makedirs(self.directory)
+        _write_segment(os.path.join(self.directory, "000000000007.npz"), _batch(np.arange(2.)))
+        with open(os.path.join(self.directory, "000000000008.npz.tmp"), "wb") as f:
+            f.write(b"cut off")
+        datastore = BatchDatastore()
+        spool = SpoolDatastore(datastore, self.directory)
+        self.assertEqual(len(datastore.batches), 1)
+        self.assertEqual(spool.counts["replayed_segments"], 1)
+        self.assertListEqual(os.listdir(self.directory), [])
+
+        # new segments don't reuse the names
+        with mock.patch("Datastore.SpoolDatastore.os.remove"):
+            spool.store_observation_batch(_batch(np.arange(2.)))
+            spool.finalize()
+        self.assertListEqual(os.listdir(self.directory), ["000000000008.npz"])
+
+    def test_retry(self):
+        """
+        test, that failed transactions are rolled back and retried
+        """
+        datastore = BatchDatastore(failures=2)
+        with mock.patch("Datastore.SpoolDatastore.RETRY_INTERVAL", 0.01):
+            spool = SpoolDatastore(datastore, self.directory)
+            spool.store_observation_batch(_batch(np.arange(3.)))
+            spool.finalize()
+        self.assertEqual(len(datastore.batches), 1)
+        self.assertEqual(datastore.rollbacks, 2)
+        self.assertEqual(spool.counts["retries"], 2)
+
+    def test_not_drained(self):
+        """
+        test, that `finalize` gives up after the drain timeout and keeps the segments
+        """
+        datastore = BatchDatastore(failures=10**6)
+        with mock.patch("Datastore.SpoolDatastore.RETRY_INTERVAL", 0.01):
+            spool = SpoolDatastore(datastore, self.directory, drain_timeout=0.1)
+            spool.store_observation_batch(_batch(np.arange(3.)))
+            with self.assertRaises(SpoolNotDrainedError) as e:
+                spool.finalize()
+        self.assertIn("database is gone", e.exception.message)
+        self.assertEqual(len(os.listdir(self.directory)), 1)
+
+        datastore = BatchDatastore()
+        SpoolDatastore(datastore, self.directory)
+        self.assertEqual(len(datastore.batches), 1)
+
+    def test_concurrent_jobs(self):
+        """
+        test, that a second job of the same spool waits, until the first one finalized
+        """
+        first_store = BatchDatastore()
+        first = SpoolDatastore(first_store, self.directory)
+        for i in range(3):
+            first.store_observation_batch(_batch(np.arange(3.) + i))
+
+        with self.assertRaises(SpoolLockedError):
+            SpoolDatastore(BatchDatastore(), self.directory, lock_timeout=0.2)
+
+        second_store = BatchDatastore()
+        started = threading.Event()
+        jobs = []
+
+        def second_job():
+            started.set()
+            jobs.append(SpoolDatastore(second_store, self.directory, lock_timeout=10))
+
+        thread = threading.Thread(target=second_job)
+        thread.start()
+        started.wait()
+        thread.join(0.3)
+        self.assertTrue(thread.is_alive())
+        first.store_observation_batch(_batch(np.arange(3.) + 3))
+        first.finalize()
+        thread.join()
+
+        second, = jobs
+        second.store_observation_batch(_batch(np.arange(3.) + 4))
+        second.finalize()
+        # every batch is written once, by its own job
+        self.assertEqual(len(first_store.batches), 4)
+        self.assertEqual(len(second_store.batches), 1)
+        self.assertEqual(second.counts["replayed_segments"], 0)
+        self.assertListEqual(os.listdir(self.directory), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
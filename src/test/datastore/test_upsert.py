@@ -0,0 +1,66 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from Datastore.ObservationBatch import ObservationBatch
+from Datastore.UpsertDatastore import RESULT_COLUMNS, UpsertDatastore, result_columns
+
+
+class TestResultColumns(unittest.TestCase):
+
+    def test_result_type(self):
+        """
+        test, that values are mapped to the matching `result_*` column
+        """
+        cases = [
+            (1.5, 0, 1.5),
+            (np.int64(3), 0, 3.),
+            ("text", 1, "text"),
+            ({"a": 1}, 2, {"a": 1}),
+            (np.bool_(True), 3, True),
+            (False, 3, False),
+        ]
+        for value, result_type, expected in cases:
+            row = result_columns(value)
+            self.assertEqual(row["result_type"], result_type)
+            self.assertEqual(row[RESULT_COLUMNS[result_type]], expected)
+            self.assertEqual(type(row[RESULT_COLUMNS[result_type]]), type(expected))
+            others = [row[c] for i, c in enumerate(RESULT_COLUMNS) if i != result_type]
+            self.assertTrue(all(v is None for v in others))
+
+
+class TestUpsertBatch(unittest.TestCase):
+
+    @staticmethod
+    def _datastore() -> UpsertDatastore:
+        # no database needed to build the rows
+        datastore = UpsertDatastore.__new__(UpsertDatastore)
+        datastore.batch_size = 10**6
+        datastore._rows = {}
+        datastore._datastream_ids = {0: 10, 2: 12}
+        return datastore
+
+    def test_rows(self):
+        """
+        test, that a batch is buffered as the same rows as its observations
+        """
+        frames = [
+            pd.DataFrame({"t": pd.date_range("2020-01-01", periods=3, tz="UTC"), "a": [1., np.nan, 2.], "b": [3, 4, 5]}),
+            pd.DataFrame({"t": pd.date_range("2020-01-01", periods=3), "a": ["x", None, 1.5], "b": [True, False, True]}),
+            pd.DataFrame({"t": pd.date_range("2020-01-01", periods=2), "a": [True, False], "b": [False, True]}),
+        ]
+        for frame in frames:
+            batch = ObservationBatch.from_frame(frame, 0, "/src")
+            batch.positions = np.where(batch.positions == 1, 0, 2)
+            expected, got = self._datastore(), self._datastore()
+            expected.store_observations(batch.to_observations())
+            got.store_observation_batch(batch)
+            self.assertDictEqual(got._rows, expected._rows)
+
+
+if __name__ == "__main__":
+    unittest.main()
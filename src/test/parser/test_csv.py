@@ -3,7 +3,10 @@
 
 import unittest
 import itertools
+import tempfile
+import zipfile
 from io import BytesIO
+from unittest import mock
 from typing import Any, Dict, Sequence, Tuple, Type
 
 import numpy as np
@@ -13,6 +16,9 @@ from MockDatasource import MockDataSource
 from MockDatastore import MockDatastore
 from tsm_datastore_lib.Observation import Observation
 from Parser.CsvParser import REQUIRED_SETTINGS, CsvParser
+from Parser.SchemaCache import SchemaCache
+from memory import MemoryBudget
+from RawDataSource import ArchiveRawDataSource
 
 
 RANDOM_SEED = 999
@@ -127,6 +133,56 @@ class TestCSVParser(unittest.TestCase):
             got = parser._parse(content, kwargs)
             self._assert_df_equality(expected, got)
 
+    def test_parallel(self):
+        """
+        test, that parsing a file in chunks gives the same result as parsing it serially
+        """
+        parser = CsvParser(MockDataSource(), MockDatastore())
+        parser.workers = 3
+
+        def check(content: bytes, kwargs: Dict[str, Any]):
+            kwargs = parser._prep_parser_kwargs(kwargs)
+            expected = parser._parse(content, kwargs)
+            got, _ = parser._parse_parallel(memoryview(content), kwargs, None)
+            pd.testing.assert_frame_equal(expected, got)
+
+        for dtype, shape, parameters in itertools.product(
+            self.TYPES, self.SHAPES, self.PARAMETERS
+        ):
+            data = self._generate_data(dtype, shape, parameters["timestamp_column"])
+            content = self._to_bytes(data, parameters)
+            kwargs = {"header": 1, **parameters}
+            with self.subTest(dtype=dtype, shape=shape, parameters=parameters):
+                check(content, kwargs)
+
+                # comments and blank lines, before the header and within the data
+                lines = content.splitlines(keepends=True)
+                lines = [b"# logger v1\n", b"\n", *lines[:3], b"# restart\n", b"\n", *lines[3:]]
+                check(b"".join(lines), kwargs)
+
+                # a footer, which isn't parsed
+                check(content + b"end of file\n", {**kwargs, "skipfooter": 1})
+
+        # line breaks within quoted fields
+        content = b"time,note\n" + b"".join(
+            f'2020-01-01T00:{i:02d}:00,"line\nbreak {i}"\n'.encode() for i in range(30)
+        )
+        check(content, {"header": 1, "timestamp_column": 0, "delimiter": ",",
+                        "timestamp_format": "%Y-%m-%dT%H:%M:%S"})
+
+        # the observations are stored in order
+        kwargs = {"header": 1, **self.PARAMETERS[1]}
+        expected = self._generate_data(float, (25, 5), kwargs["timestamp_column"])
+        datastore = MockDatastore(None, None, kwargs)
+        parser = CsvParser(MockDataSource(self._to_bytes(expected, kwargs)), datastore)
+        parser.workers = 4
+        with mock.patch("Parser.CsvParser.PARALLEL_THRESHOLD", 0):
+            parser.do_parse()
+        timestamps = [o.timestamp for o in datastore.get_observations()]
+        self.assertListEqual(timestamps, sorted(timestamps))
+        got = self._to_frame(datastore.get_observations(), kwargs["timestamp_column"])
+        self._assert_df_equality(expected, got)
+
     def test_integration(self):
         """
         test the system integration
@@ -150,6 +206,340 @@ class TestCSVParser(unittest.TestCase):
         got = self._to_frame(datastore.get_observations(), kwargs["timestamp_column"])
         self._assert_df_equality(expected, got)
 
+    def test_parsed_frame(self):
+        """
+        test, that the parsed frame is indexed by time and has the positions as columns
+        """
+        kwargs = {
+            "header": 1,
+            "timestamp_column": 1,
+            "delimiter": ",",
+            "timestamp_format": "%Y-%m-%dT%H:%M:%S",
+        }
+        expected = self._generate_data(
+            float, (12, 4), timestamp_column=kwargs["timestamp_column"]
+        )
+        datastore = MockDatastore(None, None, kwargs)
+        datasource = MockDataSource(self._to_bytes(expected, kwargs))
+        parser = CsvParser(datasource, datastore)
+
+        parser.do_parse()
+
+        got = parser.get_parsed_frame()
+        self.assertListEqual(list(got.columns), [0, 2, 3, 4])
+        self.assertTrue((got.index == expected["index"]).all())
+        self.assertTrue(np.array_equal(got.values, expected.drop(columns="index").values))
+
+    def test_schema_cache(self):
+        """
+        test, that the learned schema is reused and re-learned, if the data changes
+        """
+        kwargs = {
+            "header": 1,
+            "timestamp_column": 1,
+            "delimiter": ",",
+            "timestamp_format": "%Y-%m-%dT%H:%M:%S",
+        }
+        expected = self._generate_data(float, (12, 4), timestamp_column=kwargs["timestamp_column"])
+        expected[4] = np.nan
+        content = self._to_bytes(expected, kwargs)
+
+        def parse(data: bytes) -> CsvParser:
+            parser = CsvParser(MockDataSource(data), MockDatastore(None, None, kwargs))
+            parser.schema_cache = SchemaCache(directory, "device")
+            parser.do_parse()
+            self.assertListEqual(list(parser.get_parsed_frame().columns), [0, 2, 3, 4, 5])
+            return parser
+
+        def check(parser: CsvParser, expected: pd.DataFrame):
+            got = self._to_frame(parser.datastore.get_observations(), kwargs["timestamp_column"])
+            self._assert_df_equality(expected.drop(columns=4), got)
+
+        with tempfile.TemporaryDirectory() as directory:
+            parser = parse(content)
+            check(parser, expected)
+            self.assertDictEqual(parser.schema_counts, dict(hits=0, misses=1))
+            fingerprint = parser._fingerprint(content, parser._prep_parser_kwargs(kwargs))
+            schema = parser.schema_cache.get(fingerprint)
+            # the empty column is still inferred
+            self.assertNotIn("4", dict(schema["dtype"]))
+            self.assertListEqual([t for _, t in schema["dtype"]], ["float64"] * 4)
+
+            parser = parse(content)
+            check(parser, expected)
+            self.assertDictEqual(parser.schema_counts, dict(hits=1, misses=0))
+
+            # a string doesn't fit the float dtype
+            changed = expected.astype({0: object})
+            changed.iloc[3, 0] = "error"
+            parser = parse(self._to_bytes(changed, kwargs))
+            self.assertDictEqual(parser.schema_counts, dict(hits=0, misses=1))
+            self.assertIn("error", [o.value for o in parser.datastore.get_observations()])
+            self.assertEqual(dict(parser.schema_cache.get(fingerprint)["dtype"])["0"], "object")
+
+            # a changed header invalidates the schema
+            expected.columns = [*expected.columns[:-1], "new"]
+            parser = parse(self._to_bytes(expected, kwargs))
+            check(parser, expected.rename(columns={"new": 4}))
+            self.assertDictEqual(parser.schema_counts, dict(hits=0, misses=1))
+
+    def test_schema_cache_empty_column(self):
+        """
+        test, that a column, that was empty when the schema was learned, is stored once it holds values
+        """
+        kwargs = {
+            "header": 1,
+            "timestamp_column": 0,
+            "delimiter": ",",
+            "timestamp_format": "%Y-%m-%dT%H:%M:%S",
+        }
+        first = b"time,a,b\n2022-01-01T00:00:00,1.0,\n2022-01-01T00:01:00,2.0,\n"
+        later = b"time,a,b\n2022-01-01T00:02:00,3.0,x\n2022-01-01T00:03:00,4.0,y\n"
+
+        with tempfile.TemporaryDirectory() as directory:
+            stored = []
+            for content in (first, later):
+                parser = CsvParser(MockDataSource(content), MockDatastore(None, None, kwargs))
+                parser.schema_cache = SchemaCache(directory, "device")
+                parser.do_parse()
+                stored.append([o.value for o in parser.datastore.get_observations()])
+            self.assertDictEqual(parser.schema_counts, dict(hits=1, misses=0))
+        self.assertListEqual(stored, [[1., 2.], [3., "x", 4., "y"]])
+
+    def test_schema_cache_usecols(self):
+        """
+        test, that empty columns without a datastream are skipped, until a datastream is added
+        """
+        kwargs = {
+            "header": 1,
+            "timestamp_column": 0,
+            "delimiter": ",",
+            "timestamp_format": "%Y-%m-%dT%H:%M:%S",
+        }
+        first = b"time,a,b,c\n2022-01-01T00:00:00,1.0,,5\n2022-01-01T00:01:00,2.0,,6\n"
+        later = b"time,a,b,c\n2022-01-01T00:02:00,3.0,x,7\n2022-01-01T00:03:00,4.0,y,8\n"
+
+        def parse(content: bytes, positions: set) -> CsvParser:
+            datastore = MockDatastore(None, None, kwargs)
+            datastore.datastream_positions = lambda: positions
+            parser = CsvParser(MockDataSource(content), datastore)
+            parser.schema_cache = SchemaCache(directory, "device")
+            parser.do_parse()
+            return parser
+
+        with tempfile.TemporaryDirectory() as directory:
+            # c holds values, but has no datastream yet
+            parser = parse(first, {1})
+            fingerprint = parser._fingerprint(first, parser._prep_parser_kwargs(kwargs), {1})
+            self.assertListEqual(parser.schema_cache.get(fingerprint)["usecols"], [0, 1, 3])
+
+            with mock.patch("Parser.CsvParser.pd.read_csv", wraps=pd.read_csv) as read_csv:
+                parser = parse(later, {1})
+            self.assertListEqual(read_csv.call_args.kwargs["usecols"], [0, 1, 3])
+            self.assertDictEqual(parser.schema_counts, dict(hits=1, misses=0))
+            self.assertListEqual([o.value for o in parser.datastore.get_observations()], [3., 7, 4., 8])
+            self.assertListEqual(list(parser.get_parsed_frame().columns), [1, 2, 3])
+
+            # a datastream for the empty column invalidates the schema
+            parser = parse(later, {1, 2, 3})
+            self.assertDictEqual(parser.schema_counts, dict(hits=0, misses=1))
+            self.assertIn("x", [o.value for o in parser.datastore.get_observations()])
+
+    def test_skip_stored(self):
+        """
+        test, that values not newer than the latest stored ones are skipped
+        """
+        kwargs = {"header": 1, **self.PARAMETERS[1]}
+        data = self._generate_data(float, (10, 3), kwargs["timestamp_column"])
+        content = self._to_bytes(data, kwargs)
+        times = data["index"]
+
+        def parse(watermarks, tolerance="0s", pipelined=False) -> Tuple[CsvParser, pd.DataFrame]:
+            datastore = MockDatastore(None, None, kwargs)
+            parser = CsvParser(MockDataSource(content), datastore)
+            parser.pipelined = pipelined
+            parser.watermarks = watermarks
+            parser.late_tolerance = pd.Timedelta(tolerance)
+            parser.do_parse()
+            got = pd.DataFrame(
+                [(o.timestamp, o.position) for o in datastore.get_observations()],
+                columns=["time", "position"],
+            )
+            return parser, got
+
+        # position 1 is the timestamp column, position 3 has no stored data yet
+        parser, got = parse({0: times[5], 2: times[7]})
+        self.assertEqual(parser.stats.info["skipped_rows"], 0)
+        self.assertTrue((got[got.position == 0].time > times[5]).all())
+        self.assertTrue((got[got.position == 2].time > times[7]).all())
+        self.assertListEqual(got.groupby("position").size().tolist(), [4, 2, 10])
+        # the parsed frame, e.g. for the QA/QC, holds only the stored values
+        for pipelined in (False, True):
+            parser, _ = parse({0: times[5], 2: times[7]}, pipelined=pipelined)
+            self.assertListEqual(parser.get_parsed_frame().count().tolist(), [4, 2, 10])
+
+        parser, got = parse({0: times[5], 2: times[7], 3: times[9]}, tolerance="2min")
+        self.assertEqual(parser.stats.info["skipped_rows"], 4)
+        self.assertListEqual(got.groupby("position").size().tolist(), [6, 4, 2])
+        self.assertEqual(len(parser.get_parsed_frame().index), 6)
+
+        parser, got = parse({0: times[9], 2: times[9], 3: times[9]})
+        self.assertEqual(parser.stats.info["skipped_rows"], 10)
+        self.assertEqual(len(got.index), 0)
+
+    def test_pipelined(self):
+        """
+        test, that reading, parsing and storing concurrently stores the same observations
+        """
+
+        def parse(content: bytes, kwargs: Dict[str, Any], pipelined: bool) -> Tuple[CsvParser, list]:
+            datastore = MockDatastore(None, None, kwargs)
+            parser = CsvParser(MockDataSource(content), datastore)
+            parser.pipelined = pipelined
+            parser.do_parse()
+            return parser, [(o.timestamp, o.position, o.value) for o in datastore.get_observations()]
+
+        with mock.patch("Parser.CsvParser.PIPELINE_CHUNK_ROWS", 4), \
+                mock.patch("Parser.CsvParser.SCAN_SIZE", 64):
+            for dtype, shape, parameters in itertools.product(
+                self.TYPES, self.SHAPES, self.PARAMETERS
+            ):
+                data = self._generate_data(dtype, shape, parameters["timestamp_column"])
+                content = self._to_bytes(data, parameters)
+                kwargs = {"header": 1, **parameters}
+                with self.subTest(dtype=dtype, shape=shape, parameters=parameters):
+                    _, expected = parse(content, kwargs, False)
+                    parser, got = parse(content, kwargs, True)
+                    self.assertListEqual(got, expected)
+                    pd.testing.assert_frame_equal(
+                        parser.get_parsed_frame(), parse(content, kwargs, False)[0].get_parsed_frame(),
+                        check_dtype=False, check_index_type=False,
+                    )
+
+            kwargs = {"header": 1, **self.PARAMETERS[0]}
+            data = self._generate_data(float, (25, 25), kwargs["timestamp_column"])
+            parser, _ = parse(self._to_bytes(data, kwargs), kwargs, True)
+            report = parser.stats.info["pipeline"]
+            self.assertListEqual(list(report["stages"]), ["read", "parse", "store"])
+            self.assertEqual(parser.stats.stages["parse"].rows, 25)
+
+            # numbers in the first rows, text later on
+            content = b"time,x\n" + b"".join(
+                f"2020-01-01T00:{i:02d}:00,{i if i < 10 else 'x'}\n".encode() for i in range(20)
+            )
+            with self.assertRaises(ValueError):
+                parse(content, kwargs, True)
+            # but an empty column is no conflict
+            content = b"time,x\n" + b"".join(
+                f"2020-01-01T00:{i:02d}:00,{'' if i < 10 else 'x'}\n".encode() for i in range(20)
+            )
+            self.assertListEqual(parse(content, kwargs, True)[1], parse(content, kwargs, False)[1])
+
+            # files with a footer aren't pipelined
+            content = self._to_bytes(data, kwargs) + b"end of file\n"
+            parser, got = parse(content, {**kwargs, "skipfooter": 1}, True)
+            self.assertNotIn("pipeline", parser.stats.info)
+            self.assertEqual(len(got), 25 * 25)
+
+    def test_memory_budget(self):
+        """
+        test, that data exceeding the memory budget is parsed in chunks to the same observations
+        """
+
+        def parse(content: bytes, kwargs: Dict[str, Any], budget: MemoryBudget = None) -> Tuple[CsvParser, list]:
+            datastore = MockDatastore(None, None, kwargs)
+            parser = CsvParser(MockDataSource(content), datastore)
+            parser.memory_budget = budget
+            parser.do_parse()
+            return parser, [(o.timestamp, o.position, o.value) for o in datastore.get_observations()]
+
+        kwargs = {"header": 1, **self.PARAMETERS[0]}
+        data = self._generate_data(float, (25, 25), kwargs["timestamp_column"])
+        content = self._to_bytes(data, kwargs)
+        with mock.patch("memory.MIN_ROWS", 1), mock.patch("Parser.CsvParser.SCAN_SIZE", 64):
+            _, expected = parse(content, kwargs)
+            parser, got = parse(content, kwargs, MemoryBudget(32 * 1024))
+        self.assertListEqual(got, expected)
+        self.assertGreater(parser.stats.stages["parse"].calls, 1)
+        self.assertEqual(parser.stats.stages["parse"].rows, 25)
+        # the chunks are not kept
+        self.assertIsNone(parser.get_parsed_frame())
+
+        # small data is parsed at once
+        parser, got = parse(content, kwargs, MemoryBudget(1024 ** 3))
+        self.assertListEqual(got, expected)
+        self.assertIsNotNone(parser.get_parsed_frame())
+
+    def test_archive(self):
+        """
+        test, that all members of an archive are parsed and failures are skipped
+        """
+        kwargs = {
+            "header": 1,
+            "timestamp_column": 0,
+            "delimiter": ",",
+            "timestamp_format": "%Y-%m-%dT%H:%M:%S",
+        }
+        expected = self._generate_data(float, (30, 5), timestamp_column=0)
+        files = {
+            f"{i:02d}.csv": self._to_bytes(expected.iloc[i * 10:(i + 1) * 10], kwargs)
+            for i in range(3)
+        }
+        files["99.csv"] = b"time,x\nnot-a-date,1\n"
+        content = BytesIO()
+        with zipfile.ZipFile(content, "w") as archive:
+            for name, data in files.items():
+                archive.writestr(name, data)
+
+        for workers in [1, 2]:
+            datastore = MockDatastore(None, None, kwargs)
+            datasource = ArchiveRawDataSource(MockDataSource(content.getvalue()))
+            parser = CsvParser(datasource, datastore)
+            parser.workers = workers
+
+            parser.do_parse()
+
+            got = self._to_frame(datastore.get_observations(), kwargs["timestamp_column"])
+            self._assert_df_equality(expected, got)
+            self.assertListEqual(list(parser.failed_members), ["/mock/source#99.csv"])
+            self.assertEqual(len(parser.get_parsed_frame().index), 30)
+
+    def test_archive_pending(self):
+        """
+        test, that only a few members of an archive are extracted ahead of the parsed ones
+        """
+        kwargs = {
+            "header": 1,
+            "timestamp_column": 0,
+            "delimiter": ",",
+            "timestamp_format": "%Y-%m-%dT%H:%M:%S",
+        }
+        expected = self._generate_data(float, (80, 2), timestamp_column=0)
+        content = BytesIO()
+        with zipfile.ZipFile(content, "w") as archive:
+            for i in range(8):
+                archive.writestr(f"{i:02d}.csv", self._to_bytes(expected.iloc[i * 10:(i + 1) * 10], kwargs))
+
+        datasource = ArchiveRawDataSource(MockDataSource(content.getvalue()))
+        members, extracted = datasource.members, []
+
+        def count():
+            for member in members():
+                extracted.append(member.src)
+                yield member
+
+        datasource.members = count
+        parser = CsvParser(datasource, MockDatastore(None, None, kwargs))
+        parser.workers = 2
+        ahead = []
+        with mock.patch("Parser.CsvParser.PENDING_MEMBERS", 1):
+            for parsed, (src, data) in enumerate(parser._parse_members(parser._prep_parser_kwargs(kwargs)), 1):
+                ahead.append(len(extracted) - parsed)
+        self.assertEqual(len(extracted), 8)
+        self.assertLessEqual(max(ahead), 1)
+        self.assertEqual(parser.stats.stage("parse").calls, 8)
+        self.assertEqual(parser.stats.stage("parse_wait").calls, 8)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,113 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from MockDatasource import MockDataSource
+from MockDatastore import MockDatastore
+from Parser.Tob1Parser import Tob1Parser, decode_fp2
+
+HEADER = (
+    b'"TOB1","station","CR1000","1234","CR1000.Std.32","CPU:prog.CR1","1234","table"\r\n'
+    b'"SECONDS","NANOSECONDS","RECORD","batt_volt","temp","label"\r\n'
+    b'"SECONDS","NANOSECONDS","RN","Volts","Deg C",""\r\n'
+    b'"","","","Smp","Avg","Smp"\r\n'
+    b'"ULONG","ULONG","ULONG","FP2","IEEE4","ASCII(4)"\r\n'
+)
+DTYPE = np.dtype([
+    ("SECONDS", "<u4"), ("NANOSECONDS", "<u4"), ("RECORD", "<u4"),
+    ("batt_volt", ">u2"), ("temp", "<f4"), ("label", "S4"),
+])
+
+
+def fp2(mantissa: int, exponent: int, negative: bool = False) -> int:
+    return (negative << 15) | (exponent << 13) | mantissa
+
+
+class TestTob1Parser(unittest.TestCase):
+
+    def _records(self, n: int) -> np.ndarray:
+        records = np.zeros(n, dtype=DTYPE)
+        records["SECONDS"] = 946684800 + 60 * np.arange(n)  # 2020-01-01 since 1990-01-01
+        records["NANOSECONDS"] = 500_000_000
+        records["RECORD"] = np.arange(n)
+        records["batt_volt"] = fp2(1234, 2)
+        records["temp"] = np.arange(n) / 4
+        records["temp"][1] = np.nan
+        records["label"] = b"ok"
+        return records
+
+    def test_decode_fp2(self):
+        raw = np.array([fp2(1234, 2), fp2(15, 1, True), fp2(7, 0), 0x1FFF, 0x9FFF], dtype=">u2")
+        np.testing.assert_array_equal(decode_fp2(raw), [12.34, -1.5, 7., np.inf, -np.inf])
+        self.assertTrue(np.isnan(decode_fp2(np.array([0x9FFE], dtype=">u2"))[0]))
+
+    def test_integration(self):
+        """
+        test, that the records are stored like the columns of a CSV file
+        """
+        records = self._records(10)
+        datastore = MockDatastore(None, None, {})
+        parser = Tob1Parser(MockDataSource(HEADER + records.tobytes() + b"\x00\x01"), datastore)
+
+        parser.do_parse()
+
+        observations = datastore.get_observations()
+        # one NaN in 'temp' is not stored
+        self.assertEqual(len(observations), 10 * 4 - 1)
+        first = observations[:4]
+        expected_time = pd.Timestamp("2020-01-01 00:00:00.5")
+        self.assertTrue(all(o.timestamp == expected_time for o in first))
+        self.assertListEqual([o.position for o in first], [2, 3, 4, 5])
+        self.assertListEqual([o.header for o in first], ["RECORD", "batt_volt", "temp", "label"])
+        self.assertListEqual([o.value for o in first], [0, 12.34, 0., "ok"])
+        self.assertEqual(observations[-1].timestamp, expected_time + pd.Timedelta(minutes=9))
+
+        frame = parser.get_parsed_frame()
+        self.assertListEqual(list(frame.columns), [2, 3, 4, 5])
+        self.assertEqual(len(frame.index), 10)
+
+    def test_zero_copy(self):
+        """
+        test, that plain numeric fields are views into the source buffer
+        """
+        source = MockDataSource(HEADER + self._records(3).tobytes())
+        _, columns, _ = Tob1Parser._parse(source.getbuffer(), Tob1Parser._prep_parser_kwargs({}))
+        self.assertFalse(columns[4].flags.owndata)
+        self.assertFalse(columns[4].flags.writeable)
+
+    def test_wide_header(self):
+        """
+        test, that header lines longer than a few KiB are read, e.g. of loggers with hundreds of fields
+        """
+        fields = [f"temperature_sensor_{i:04d}" for i in range(500)]
+        header = (
+            b'"TOB1","station","CR1000","1234","CR1000.Std.32","CPU:prog.CR1","1234","table"\r\n'
+            + ",".join(f'"{n}"' for n in ["SECONDS", "NANOSECONDS", *fields]).encode() + b"\r\n"
+            + ",".join(['""'] * 502).encode() + b"\r\n"
+            + ",".join(['""'] * 502).encode() + b"\r\n"
+            + ",".join(['"ULONG"'] * 2 + ['"IEEE4"'] * 500).encode() + b"\r\n"
+        )
+        self.assertGreater(len(header), 4096 * 3)
+        dtype = np.dtype([("SECONDS", "<u4"), ("NANOSECONDS", "<u4")] + [(n, "<f4") for n in fields])
+        records = np.zeros(2, dtype=dtype)
+        records[fields[-1]] = [1., 2.]
+
+        source = MockDataSource(header + records.tobytes())
+        names, types, offset = Tob1Parser._parse_header(source.getbuffer())
+        self.assertEqual(len(names), 502)
+        self.assertEqual(offset, len(header))
+        _, columns, _ = Tob1Parser._parse(source.getbuffer(), Tob1Parser._prep_parser_kwargs({}))
+        np.testing.assert_array_equal(columns[501], [1., 2.])
+
+    def test_not_tob1(self):
+        source = MockDataSource(HEADER.replace(b"TOB1", b"TOA5"))
+        with self.assertRaises(ValueError):
+            Tob1Parser._parse(source.getbuffer(), Tob1Parser._prep_parser_kwargs({}))
+
+
+if __name__ == "__main__":
+    unittest.main()
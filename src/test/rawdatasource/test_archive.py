@@ -0,0 +1,63 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import io
+import tarfile
+import unittest
+import zipfile
+
+from MockDatasource import MockDataSource
+from RawDataSource import ArchiveRawDataSource
+
+FILES = {
+    "b.csv": b"time,x\n2020-01-01T00:00:00,2\n",
+    "a.csv": b"time,x\n2020-01-01T00:00:00,1\n",
+    "sub/c.csv": b"time,x\n2020-01-01T00:00:00,3\n",
+}
+
+
+def make_zip(files) -> bytes:
+    fobj = io.BytesIO()
+    with zipfile.ZipFile(fobj, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, data in files.items():
+            archive.writestr(name, data)
+    return fobj.getvalue()
+
+
+def make_tar(files, mode="w:gz") -> bytes:
+    fobj = io.BytesIO()
+    with tarfile.open(fileobj=fobj, mode=mode) as archive:
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    return fobj.getvalue()
+
+
+class TestArchiveRawDataSource(unittest.TestCase):
+
+    def test_members(self):
+        """
+        test, that zip and tar archives are detected and their members are sorted by name
+        """
+        for data in [make_zip(FILES), make_tar(FILES), make_tar(FILES, "w")]:
+            source = ArchiveRawDataSource.wrap(MockDataSource(data))
+            self.assertIsInstance(source, ArchiveRawDataSource)
+            members = list(source.members())
+            self.assertListEqual([m.src for m in members],
+                                 [f"/mock/source#{n}" for n in sorted(FILES)])
+            self.assertListEqual([m.read() for m in members], [FILES[n] for n in sorted(FILES)])
+            self.assertEqual(bytes(source.getbuffer()), data)
+
+    def test_no_archive(self):
+        """
+        test, that other data (even if compressed) is not wrapped
+        """
+        import gzip
+        for data in [b"", b"time,x\n", gzip.compress(b"time,x\n")]:
+            source = MockDataSource(data)
+            self.assertIs(ArchiveRawDataSource.wrap(source), source)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from MockDatasource import MockDataSource
+from RawDataSource import open_buffer
+
+
+class SmallSpoolDataSource(MockDataSource):
+    SPOOL_MAX_SIZE = 16
+
+
+class TestGetBuffer(unittest.TestCase):
+
+    DATA = b"".join(b"2020-01-01T00:00:%02d,%d\n" % (i, i) for i in range(60))
+
+    def _check(self, source):
+        view = source.getbuffer()
+        self.assertTrue(view.readonly)
+        self.assertEqual(bytes(view), self.DATA)
+        with open_buffer(view) as fobj:
+            self.assertEqual(fobj.readline(), self.DATA.split(b"\n")[0] + b"\n")
+            fobj.seek(0)
+            self.assertEqual(fobj.read(), self.DATA)
+        source.close()
+
+    def test_in_memory(self):
+        """
+        test the view of a source, that was not rolled over to disk
+        """
+        source = MockDataSource(self.DATA)
+        self.assertFalse(source.temp_file._rolled)
+        self._check(source)
+
+    def test_on_disk(self):
+        """
+        test the view of a source, that was rolled over to disk (mmap)
+        """
+        source = SmallSpoolDataSource(self.DATA)
+        self.assertTrue(source.temp_file._rolled)
+        self._check(source)
+        self.assertIsNone(source._mmap)
+
+    def test_empty(self):
+        """
+        test, that empty sources give an empty view
+        """
+        for klass in [MockDataSource, SmallSpoolDataSource]:
+            self.assertEqual(bytes(klass(b"").getbuffer()), b"")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,183 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import io
+import os
+import re
+import tempfile
+import threading
+import unittest
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import numpy as np
+
+import RawDataSource
+from RawDataSource.AbstractRawDataSource import MAX_FILE_SIZE, MaximumFileSizeError
+from RawDataSource import ArchiveRawDataSource, FileRawDataSource, S3RawDataSource, StreamingRawDataSource, UrlRawDataSource
+
+
+class RangeRequestHandler(BaseHTTPRequestHandler):
+    """ Serve `server.objects` and support single HTTP range requests. """
+
+    def log_message(self, *args):
+        pass
+
+    def _object(self):
+        data = self.server.objects.get(self.path)
+        if data is None:
+            self.send_error(404)
+        return data
+
+    def do_HEAD(self):
+        if (data := self._object()) is None:
+            return
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+
+    def do_GET(self):
+        if (data := self._object()) is None:
+            return
+        self.server.requests.append(dict(self.headers))
+        if match := re.fullmatch(r"bytes=(\d+)-(\d+)", self.headers.get("Range", "")):
+            start, stop = int(match[1]), int(match[2]) + 1
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{stop - 1}/{len(data)}")
+        else:
+            start, stop = 0, len(data)
+            self.send_response(200)
+        self.send_header("Content-Length", str(stop - start))
+        self.end_headers()
+        self.wfile.write(data[start:stop])
+
+
+class TestSources(unittest.TestCase):
+
+    DATA = np.random.default_rng(999).bytes(1024 * 1024 * 10 + 123)
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), RangeRequestHandler)
+        cls.server.objects = {"/bucket/path/to/object.csv": cls.DATA, "/bucket/empty": b""}
+        cls.server.requests = []
+        cls.endpoint = f"http://127.0.0.1:{cls.server.server_port}"
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.server.requests.clear()
+
+    def test_s3_ranges(self):
+        """
+        test, that large objects are fetched in parallel range requests
+        """
+        source = S3RawDataSource("s3://bucket/path/to/object.csv", endpoint=self.endpoint,
+                                 part_size=1024 * 1024, workers=4)
+        self.assertEqual(bytes(source.getbuffer()), self.DATA)
+        self.assertEqual(source.read(), self.DATA)
+        self.assertEqual(len(self.server.requests), 11)
+        self.assertTrue(all("Range" in r for r in self.server.requests))
+        source.close()
+
+    def test_s3_signed(self):
+        """
+        test, that requests are signed, if credentials are given
+        """
+        env = {"AWS_ACCESS_KEY_ID": "minio", "AWS_SECRET_ACCESS_KEY": "secret"}
+        with mock.patch.dict(os.environ, env):
+            source = S3RawDataSource("s3://bucket/path/to/object.csv", endpoint=self.endpoint)
+        self.assertEqual(source.read(), self.DATA)
+        auth = self.server.requests[0]["Authorization"]
+        self.assertTrue(auth.startswith("AWS4-HMAC-SHA256 Credential=minio/"))
+
+    def test_s3_empty(self):
+        source = S3RawDataSource("s3://bucket/empty", endpoint=self.endpoint)
+        self.assertEqual(source.read(), b"")
+        self.assertListEqual(self.server.requests, [])
+
+    def test_file(self):
+        """
+        test, that local files are read in place
+        """
+        with tempfile.NamedTemporaryFile() as file:
+            file.write(self.DATA)
+            file.flush()
+            for src in [file.name, f"file://{file.name}"]:
+                source = FileRawDataSource(src)
+                self.assertEqual(bytes(source.getbuffer()), self.DATA)
+                # nothing was copied to the temporary file
+                self.assertEqual(source.temp_file.tell(), 0)
+                source.close()
+
+    def test_file_size(self):
+        """
+        test, that mapped local files may exceed the size limit of in-memory sources, only if allowed
+        """
+        with tempfile.NamedTemporaryFile() as file:
+            # sparse, nothing is written to disk
+            file.truncate(MAX_FILE_SIZE + 1)
+            with self.assertRaises(MaximumFileSizeError):
+                RawDataSource.get_rawdata_source(file.name)
+            source = RawDataSource.get_rawdata_source(file.name, max_mapped_size=MAX_FILE_SIZE + 1)
+            self.assertEqual(len(source.getbuffer()), MAX_FILE_SIZE + 1)
+            source.close()
+            with self.assertRaises(MaximumFileSizeError):
+                FileRawDataSource(file.name, max_file_size=1024)
+
+    def test_url(self):
+        source = UrlRawDataSource(f"{self.endpoint}/bucket/path/to/object.csv")
+        self.assertEqual(bytes(source.getbuffer()), self.DATA)
+
+    def test_stream(self):
+        """
+        test, that URLs are streamed in chunks and archives are still downloaded at once
+        """
+        url = f"{self.endpoint}/bucket/path/to/object.csv"
+        source = RawDataSource.get_rawdata_source(url, streaming=True)
+        self.assertIsInstance(source, StreamingRawDataSource)
+        source.chunk_size = 1024 * 1024
+        chunks = list(source.stream())
+        self.assertEqual(len(chunks), 11)
+        self.assertEqual(b"".join(chunks), self.DATA)
+        with self.assertRaises(RuntimeError):
+            next(source.stream())
+        source.close()
+
+        # read the whole content, and stream it from memory
+        source = StreamingRawDataSource(url)
+        self.assertEqual(source.head(4), self.DATA[:4])
+        self.assertEqual(source.read(), self.DATA)
+        self.assertEqual(b"".join(source.stream()), self.DATA)
+        source.close()
+
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w") as zf:
+            zf.writestr("data.csv", b"time,x\n")
+        self.server.objects["/bucket/archive.zip"] = archive.getvalue()
+        source = RawDataSource.get_rawdata_source(f"{self.endpoint}/bucket/archive.zip", streaming=True)
+        self.assertIsInstance(source, ArchiveRawDataSource)
+
+    def test_scheme(self):
+        """
+        test, that the raw data source type is selected by the URI scheme
+        """
+        with tempfile.NamedTemporaryFile() as file:
+            self.assertIsInstance(RawDataSource.get_rawdata_source(file.name), FileRawDataSource)
+        with mock.patch.dict(os.environ, {"S3_ENDPOINT_URL": self.endpoint}):
+            source = RawDataSource.get_rawdata_source("s3://bucket/path/to/object.csv")
+        self.assertIsInstance(source, S3RawDataSource)
+        source = RawDataSource.get_rawdata_source(f"{self.endpoint}/bucket/empty")
+        self.assertIsInstance(source, UrlRawDataSource)
+        with self.assertRaises(NotImplementedError):
+            RawDataSource.get_rawdata_source("gopher://example.com/file")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import pandas as pd
+
+import backfill
+from backfill import BackfillTask, Checkpoint, plan_tasks
+from instrumentation import JobStats
+
+
+class TestBackfill(unittest.TestCase):
+
+    START = pd.Timestamp("2020-01-01", tz="UTC")
+
+    def test_plan(self):
+        """
+        test, that the range is split into slices for every thing, the last one may be shorter
+        """
+        tasks = plan_tasks(["a", "b", "a"], self.START, self.START + pd.Timedelta("10D"), pd.Timedelta("4D"))
+        self.assertListEqual([t.thing for t in tasks], ["a", "b"] * 3)
+        self.assertListEqual(
+            [(t.end - t.start).days for t in tasks[::2]], [4, 4, 2],
+        )
+        self.assertEqual(tasks[0].end, tasks[2].start)
+        with self.assertRaises(ValueError):
+            plan_tasks(["a"], self.START, self.START, pd.Timedelta("1D"))
+        with self.assertRaises(ValueError):
+            plan_tasks(["a"], self.START, self.START + pd.Timedelta("1D"), pd.Timedelta(0))
+
+    def test_checkpoint(self):
+        """
+        test, that recorded tasks are found again, and a cut off line is ignored
+        """
+        task = BackfillTask("a", self.START, self.START + pd.Timedelta("1D"))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "checkpoint.jsonl")
+            checkpoint = Checkpoint(path)
+            self.assertNotIn(task, checkpoint)
+            checkpoint.record(task, dict(rows=1))
+            with open(path, "a") as f:
+                f.write('{"task": "b/')
+            with self.assertLogs(level="WARNING"):
+                checkpoint = Checkpoint(path)
+            self.assertIn(task, checkpoint)
+            self.assertEqual(len(checkpoint.done), 1)
+
+    def test_run(self):
+        """
+        test, that only unfinished tasks run, and failed ones are not checkpointed
+        """
+        tasks = plan_tasks(["a", "b"], self.START, self.START + pd.Timedelta("3D"), pd.Timedelta("1D"))
+        checkpoint = Checkpoint(None)
+        checkpoint.record(tasks[0], {})
+
+        def run_task(target_uri, storage, task, metadata):
+            if task == tasks[1]:
+                raise RuntimeError("broken")
+            return dict(rows=10, labels=5, wall=0., metadata_hits=3, metadata_misses=1)
+
+        stats = JobStats("test")
+        with mock.patch("backfill.ProcessPoolExecutor", ThreadPoolExecutor), \
+                mock.patch("backfill.run_task", run_task), self.assertLogs(level="ERROR"):
+            failed = backfill.run_backfill("db", tasks, checkpoint, stats, workers=2)
+        self.assertListEqual(list(failed), [tasks[1].key])
+        self.assertDictEqual(
+            {k: v for k, v in stats.info["backfill"].items() if k != "rows_per_second"},
+            dict(
+                tasks=6, skipped=1, done=4, failed=1, rows=40, labels=20,
+                metadata_hits=12, metadata_misses=4, metadata_hit_rate=0.75,
+            ),
+        )
+        self.assertNotIn(tasks[1], checkpoint)
+        self.assertEqual(len(checkpoint.done), 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import struct
+import types
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+import sqlalchemy
+from sqlalchemy.orm import Session
+from tsm_datastore_lib.SqlAlchemy.Model import Observation
+
+import copy_reader
+
+
+def copy_output(rows, null_number: bool = False) -> bytes:
+    """ The output of a binary COPY of (result_time, result_type, result_number) rows. """
+    out = copy_reader.SIGNATURE + struct.pack(">ii", 0, 0)
+    for time, result_type, number in rows:
+        micros = (time - pd.Timestamp("2000-01-01", tz="UTC")) // pd.Timedelta("1us")
+        out += struct.pack(">hiqih", 3, 8, micros, 2, result_type)
+        out += struct.pack(">i", -1) if null_number else struct.pack(">id", 8, number)
+    return out + copy_reader.TRAILER
+
+
+class TestCopyReader(unittest.TestCase):
+
+    TIMES = pd.date_range("2020-01-01", periods=3, freq="10min", tz="UTC")
+
+    def test_decode(self):
+        """
+        test, that the rows are decoded like read_sql returns them
+        """
+        rows = copy_reader.decode(copy_output(zip(self.TIMES, [0, 0, 0], [1.5, np.nan, -2.])))
+        frame = copy_reader.to_frame(rows)
+        pd.testing.assert_index_equal(frame.index, pd.DatetimeIndex(self.TIMES, name="result_time"))
+        self.assertEqual(frame["result_type"].dtype, np.int8)
+        np.testing.assert_array_equal(frame["result_number"].to_numpy(), [1.5, np.nan, -2.])
+
+        self.assertEqual(len(copy_reader.decode(copy_output([]))), 0)
+
+    def test_other_layouts(self):
+        """
+        test, that NULLs are detected and broken output fails
+        """
+        self.assertIsNone(copy_reader.decode(copy_output(zip(self.TIMES, [0, 0, 0], [1., 2., 3.]), null_number=True)))
+        with self.assertRaises(ValueError):
+            copy_reader.decode(b"not a copy")
+        with self.assertRaises(ValueError):
+            copy_reader.decode(copy_output(zip(self.TIMES, [0] * 3, [1.] * 3))[:-2])
+
+    def test_chunks(self):
+        """
+        test, that output written in small pieces is decoded in chunks like at once
+        """
+        times = pd.date_range("2020-01-01", periods=1000, freq="1min", tz="UTC")
+        output = copy_output(zip(times, [0] * 1000, np.arange(1000.)))
+        decoder = copy_reader.CopyDecoder(chunk_size=1000)
+        for pos in range(0, len(output), 7):
+            decoder.write(output[pos:pos + 7])
+            # only the rows of less than a chunk are kept undecoded
+            self.assertLess(len(decoder._pending), 1000 + copy_reader.ROW.itemsize)
+        self.assertGreater(len(decoder._chunks), 30)
+        np.testing.assert_array_equal(decoder.result(), copy_reader.decode(output))
+
+        output = copy_output(zip(times, [0] * 1000, np.arange(1000.)), null_number=True)
+        decoder = copy_reader.CopyDecoder(chunk_size=1000)
+        for pos in range(0, len(output), 7):
+            decoder.write(output[pos:pos + 7])
+        self.assertIsNone(decoder.result())
+
+    def test_other_types(self):
+        """
+        test, that observations with other values than numbers are not copied at all
+        """
+        cursor = mock.Mock()
+        session = mock.Mock(bind=types.SimpleNamespace(dialect=types.SimpleNamespace(name="postgresql", driver="psycopg2")))
+        session.connection.return_value.connection.cursor.return_value = cursor
+        query = mock.Mock(session=session)
+        with mock.patch("copy_reader._copy_statement"), \
+                mock.patch("copy_reader._has_other_types", return_value=True) as has_other_types:
+            self.assertIsNone(copy_reader.read_numbers(query))
+        has_other_types.assert_called_once_with(query)
+        cursor.copy_expert.assert_not_called()
+
+    def test_fallback(self):
+        """
+        test, that other databases than PostgreSQL are not read with COPY
+        """
+        session = Session(sqlalchemy.create_engine("sqlite://"))
+        self.assertIsNone(copy_reader.read_numbers(session.query(Observation.result_time)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import pstats
+import tempfile
+import unittest
+from unittest import mock
+
+from instrumentation import JobStats, Stage, profiled
+
+
+class TestStage(unittest.TestCase):
+
+    def test_accumulate(self):
+        """
+        test, that a stage sums up its calls
+        """
+        stage = Stage("parse")
+        clock = iter([0., 1., 10., 13.])
+        with mock.patch("instrumentation.time.perf_counter", lambda: next(clock)):
+            for rows in (5, 7):
+                with stage:
+                    stage.rows += rows
+        result = stage.to_dict()
+        self.assertEqual(result["wall"], 4.)
+        self.assertEqual(result["rows"], 12)
+        self.assertEqual(result["calls"], 2)
+
+    def test_peak_rss(self):
+        """
+        test, that the peak rss is sampled when a stage is exited, not when the summary is built
+        """
+        rss = [100]
+        stats = JobStats("parse")
+        with mock.patch("instrumentation.peak_rss", lambda: rss[0]):
+            with stats.stage("download"):
+                rss[0] = 150
+            with stats.stage("parse"):
+                rss[0] = 400
+            with stats.stage("download"):
+                pass
+            rss[0] = 1000
+            summary = stats.summary()
+        self.assertEqual(summary["peak_rss"], 1000)
+        self.assertEqual(summary["stages"]["download"]["peak_rss"], 400)
+        self.assertEqual(summary["stages"]["download"]["rss_growth"], 50)
+        self.assertEqual(summary["stages"]["parse"]["peak_rss"], 400)
+        self.assertEqual(summary["stages"]["parse"]["rss_growth"], 250)
+
+
+class TestJobStats(unittest.TestCase):
+
+    def test_summary(self):
+        """
+        test, that the summary holds the info and all stages and is json-serializable
+        """
+        stats = JobStats("parse", thing_uuid="thing")
+        self.assertIs(stats.stage("store"), stats.stage("store"))
+        with stats.stage("store") as stage:
+            stage.rows += 3
+        with self.assertLogs(level="INFO") as logs:
+            summary = stats.log()
+        self.assertEqual(json.loads(logs.records[0].getMessage()), summary)
+        self.assertEqual(summary["job"], "parse")
+        self.assertEqual(summary["thing_uuid"], "thing")
+        self.assertEqual(summary["stages"]["store"]["rows"], 3)
+        self.assertGreater(summary["peak_rss"], 0)
+
+
+class TestProfiled(unittest.TestCase):
+
+    def test_profiled(self):
+        """
+        test, that the profile of the block is written to the path
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "job.prof")
+            with profiled(path):
+                sorted(range(1000))
+            self.assertGreater(pstats.Stats(path).total_calls, 0)
+
+            with profiled(None):
+                pass
+            self.assertListEqual(os.listdir(tmp), ["job.prof"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+import instrumentation
+import main
+
+
+class TestRunQaqcJob(unittest.TestCase):
+
+    def run_job(self, unprocessed: bool, budget=None, labels: int = 2):
+        frame = pd.DataFrame({1: [1., 2.]}, index=pd.date_range("2022-01-01", periods=2, freq="1min"))
+        datastore = mock.Mock()
+        with mock.patch.multiple(
+                "main.qaqc", compile_qaqc_config=mock.DEFAULT, get_data_from_frame=mock.DEFAULT,
+                get_data=mock.DEFAULT, has_unprocessed=mock.DEFAULT, count_rows=mock.DEFAULT,
+        ) as patched, mock.patch("main.qaqc_labels.check_storage"), \
+                mock.patch("main._run_qaqc_slice", return_value=labels) as run_slice:
+            patched["has_unprocessed"].return_value = unprocessed
+            patched["count_rows"].side_effect = [1, 0]
+            done = main.run_qaqc_job(datastore, instrumentation.JobStats("parse"), frame, budget=budget)
+        return done, patched, run_slice
+
+    def test_frame_covers_all(self):
+        """
+        test, that the parsed frame is enough, if no other data is unprocessed
+        """
+        done, patched, run_slice = self.run_job(unprocessed=False)
+        self.assertTrue(done)
+        patched["get_data_from_frame"].assert_called_once()
+        patched["get_data"].assert_not_called()
+        self.assertEqual(run_slice.call_count, 1)
+
+    def test_frame_misses_data(self):
+        """
+        test, that unprocessed data besides the parsed frame is loaded from the datastore
+        """
+        done, patched, run_slice = self.run_job(unprocessed=True)
+        self.assertTrue(done)
+        patched["get_data"].assert_called_once()
+        self.assertEqual(run_slice.call_count, 2)
+
+        done, patched, run_slice = self.run_job(unprocessed=True, budget=mock.Mock())
+        self.assertTrue(done)
+        self.assertEqual(patched["get_data"].call_count, 2)
+
+        # a slice, that uploads no labels, leaves data unprocessed
+        done, patched, run_slice = self.run_job(unprocessed=True, budget=mock.Mock(), labels=0)
+        self.assertFalse(done)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+from memory import MemoryBudget, MIN_ROWS, cgroup_limit, frame_bytes
+
+
+class TestMemoryBudget(unittest.TestCase):
+
+    def test_parse(self):
+        """
+        test, that sizes are binary, and an empty value disables the budget
+        """
+        self.assertEqual(MemoryBudget.parse("512M").limit, 512 * 1024 ** 2)
+        self.assertEqual(MemoryBudget.parse("1GiB").limit, 1024 ** 3)
+        self.assertIsNone(MemoryBudget.parse(None))
+        self.assertIsNone(MemoryBudget.parse(""))
+        with self.assertRaises(ValueError):
+            MemoryBudget.parse("0")
+
+    def test_auto(self):
+        """
+        test, that 'auto' uses a fraction of the cgroup limit, if there is one
+        """
+        with mock.patch("builtins.open", mock.mock_open(read_data="1073741824\n")):
+            self.assertEqual(cgroup_limit(), 1024 ** 3)
+            self.assertEqual(MemoryBudget.parse("auto").limit, int(.75 * 1024 ** 3))
+        with mock.patch("builtins.open", mock.mock_open(read_data="max\n")):
+            self.assertIsNone(cgroup_limit())
+            self.assertIsNone(MemoryBudget.parse("auto"))
+
+    def test_rows(self):
+        """
+        test, that batches shrink at once for larger rows, and grow gradually for smaller ones
+        """
+        budget = MemoryBudget(10 ** 7)
+        self.assertEqual(budget.rows("fetch"), 10 ** 6 // 1024)
+        budget.observe("fetch", 2000 * 1000, 1000)
+        self.assertEqual(budget.rows("fetch"), 500)
+        self.assertEqual(budget.rows("fetch", parts=2), 250)
+        budget.observe("fetch", 1000 * 1000, 1000)
+        self.assertEqual(budget.rows("fetch"), int(10 ** 6 / 1750))
+        # never less than a minimum
+        budget.observe("fetch", 10 ** 12, 1)
+        self.assertEqual(budget.rows("fetch"), MIN_ROWS)
+        self.assertEqual(budget.report()["rows"]["fetch"], MIN_ROWS)
+
+    def test_frame_bytes(self):
+        """
+        test, that the objects of a frame are counted
+        """
+        numbers = pd.DataFrame({"a": range(100)}, dtype="int64")
+        strings = numbers.astype(str)
+        self.assertGreater(frame_bytes(strings), frame_bytes(numbers))
+        self.assertEqual(frame_bytes(numbers["a"]), frame_bytes(numbers))
+
+
+if __name__ == "__main__":
+    unittest.main()
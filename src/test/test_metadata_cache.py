@@ -0,0 +1,144 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import tempfile
+import types
+import unittest
+from unittest import mock
+
+from tsm_datastore_lib.SqlAlchemyDatastore import DatastreamNotFoundError
+
+from Datastore.CachedDatastore import CachedDatastore
+from metadata_cache import DatastreamInfo, MetadataCache, get_thing_properties, subscribe
+from MockDatastore import MockDatastore
+
+THING = "057d8bba-40b3-11ec-a337-125e5a40a845"
+
+
+class QueryingDatastore(MockDatastore):
+    """ Counts the metadata queries. """
+
+    def __init__(self):
+        super().__init__(parser_kwargs={"delimiter": ","})
+        self.queries = 0
+        self.thing = types.SimpleNamespace(properties={"QAQC": {"default": 0}})
+        self.version = "1"
+
+    def thing_version(self):
+        return self.version
+
+    @property
+    def sqla_thing(self):
+        self.queries += 1
+        return self.thing
+
+    def get_parser_parameters(self, parser_type):
+        self.queries += 1
+        return super().get_parser_parameters(parser_type)
+
+    def get_datastream(self, position):
+        self.queries += 1
+        if int(position) > 2:
+            raise DatastreamNotFoundError(position)
+        return types.SimpleNamespace(id=10 + int(position), name=f"thing/{position}", position=str(position))
+
+
+class TestMetadataCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def lookup(self, datastore):
+        get_thing_properties(datastore)
+        datastore.get_parser_parameters("CsvParser")
+        return [datastore.get_datastream(pos) for pos in (0, 1, 0, 1)]
+
+    def test_job(self):
+        """
+        test, that repeated lookups of a job are cached and values can't be changed by callers
+        """
+        raw = QueryingDatastore()
+        datastore = CachedDatastore(raw, MetadataCache(), THING)
+        streams = self.lookup(datastore)
+        self.assertEqual(streams[0], DatastreamInfo(id=10, name="thing/0", position="0"))
+        self.assertEqual(raw.queries, 4)
+        self.assertEqual(datastore.cache.counts["hits"], 2)
+
+        datastore.get_parser_parameters("CsvParser")["delimiter"] = ";"
+        self.assertDictEqual(datastore.get_parser_parameters("CsvParser"), {"delimiter": ","})
+
+        # missing datastreams aren't cached, they may be created
+        for _ in range(2):
+            with self.assertRaises(DatastreamNotFoundError):
+                datastore.get_datastream(3)
+        self.assertEqual(raw.queries, 6)
+
+    def test_warm(self):
+        """
+        test, that a later job with the same directory queries no metadata, until the ttl passed
+        """
+        self.lookup(CachedDatastore(QueryingDatastore(), MetadataCache(self.tmp.name), THING))
+
+        raw = QueryingDatastore()
+        cache = MetadataCache(self.tmp.name)
+        self.assertEqual(self.lookup(CachedDatastore(raw, cache, THING))[1].id, 11)
+        self.assertEqual(raw.queries, 0)
+        self.assertEqual(cache.report()["hit_rate"], 1.)
+
+        with mock.patch("metadata_cache.time.time", return_value=10**12):
+            self.lookup(CachedDatastore(raw, MetadataCache(self.tmp.name), THING))
+        self.assertEqual(raw.queries, 4)
+
+    def test_invalidate(self):
+        """
+        test, that a config-changed message drops the metadata of its thing
+        """
+        client = mock.Mock()
+        cache = MetadataCache(self.tmp.name)
+        subscribe(client, cache)
+        topic, on_message = client.message_callback_add.call_args.args
+
+        raw = QueryingDatastore()
+        datastore = CachedDatastore(raw, cache, THING)
+        self.lookup(datastore)
+        raw.thing.properties = {}
+        on_message(client, None, types.SimpleNamespace(topic=topic, payload=json.dumps({"thing_uuid": "other"})))
+        self.assertIn("QAQC", get_thing_properties(datastore))
+        on_message(client, None, types.SimpleNamespace(topic=topic, payload=json.dumps({"thing_uuid": THING})))
+        self.assertNotIn("QAQC", get_thing_properties(datastore))
+        self.assertNotIn("QAQC", get_thing_properties(CachedDatastore(raw, MetadataCache(self.tmp.name), THING)))
+        self.assertEqual(cache.counts["invalidated"], 2)
+
+    def test_version(self):
+        """
+        test, that a later job doesn't use warm metadata, after the thing changed in the database
+        """
+        self.lookup(CachedDatastore(QueryingDatastore(), MetadataCache(self.tmp.name), THING))
+
+        raw = QueryingDatastore()
+        self.lookup(CachedDatastore(raw, MetadataCache(self.tmp.name), THING))
+        self.assertEqual(raw.queries, 0)
+
+        # e.g. a config-changed message was sent between the jobs
+        raw.version = "2"
+        raw.thing.properties = {}
+        cache = MetadataCache(self.tmp.name)
+        datastore = CachedDatastore(raw, cache, THING)
+        self.assertNotIn("QAQC", get_thing_properties(datastore))
+        self.assertEqual(cache.counts["stale"], 1)
+        self.lookup(datastore)
+        self.assertEqual(raw.queries, 4)
+
+        # the metadata of the new version is warm again
+        raw = QueryingDatastore()
+        raw.version = "2"
+        self.lookup(CachedDatastore(raw, MetadataCache(self.tmp.name), THING))
+        self.assertEqual(raw.queries, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+import unittest
+
+from instrumentation import JobStats
+from pipeline import Pipeline
+
+
+class TestPipeline(unittest.TestCase):
+
+    def test_order(self):
+        """
+        test, that all items pass all stages in order, each stage in its own thread
+        """
+        stats = JobStats("test")
+        threads, got = set(), []
+
+        def double(items):
+            for i in items:
+                threads.add(threading.current_thread().name)
+                yield 2 * i
+
+        def collect(items):
+            threads.add(threading.current_thread().name)
+            got.extend(items)
+            return []
+
+        pipeline = Pipeline(stats, maxsize=2)
+        pipeline.run(("source", range(1000)), ("double", double), ("collect", collect))
+        self.assertListEqual(got, [2 * i for i in range(1000)])
+        self.assertEqual(len(threads), 2)
+        self.assertNotIn(threading.current_thread().name, threads)
+
+        report = stats.info["pipeline"]
+        self.assertListEqual(list(report["stages"]), ["source", "double", "collect"])
+        self.assertEqual(stats.stages["double"].calls, 1000)
+
+    def test_bottleneck(self):
+        """
+        test, that the slowest stage is reported as bottleneck, while the others wait
+        """
+        stats = JobStats("test")
+
+        def slow(items):
+            for i in items:
+                time.sleep(.01)
+                yield i
+
+        pipeline = Pipeline(stats, maxsize=1, poll=.01)
+        pipeline.run(("source", range(20)), ("slow", slow), ("sink", lambda items: list(items) and []))
+        report = pipeline.report
+        self.assertEqual(report["bottleneck"], "slow")
+        self.assertGreater(report["stages"]["slow"]["utilization"], .5)
+        # the source is blocked by the full queue, the sink waits for items
+        self.assertGreater(report["stages"]["source"]["wait_out"], report["stages"]["source"]["busy"])
+        self.assertGreater(report["stages"]["sink"]["wait_in"], report["stages"]["sink"]["busy"])
+
+    def test_error(self):
+        """
+        test, that an error in any stage stops all stages and is raised
+        """
+        closed = threading.Event()
+
+        def source():
+            try:
+                for i in range(10**9):
+                    yield i
+            finally:
+                closed.set()
+
+        def fail(items):
+            for i in items:
+                if i == 100:
+                    raise KeyError(i)
+                yield i
+
+        pipeline = Pipeline(JobStats("test"), poll=.01)
+        with self.assertRaises(KeyError):
+            pipeline.run(("source", source()), ("fail", fail), ("sink", lambda items: list(items) and []))
+        self.assertTrue(closed.is_set())
+        self.assertIn("sink", pipeline.report["stages"])
+
+        # an error of the first stage
+        def broken():
+            yield 1
+            raise IOError("connection reset")
+
+        with self.assertRaises(IOError):
+            pipeline.run(("source", broken()), ("sink", lambda items: list(items) and []))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+from unittest import mock
+
+from progress import AbstractProgressSink, ProgressReporter
+
+
+class ListSink(AbstractProgressSink):
+    def __init__(self):
+        self.reports = []
+
+    def emit(self, report: dict) -> None:
+        self.reports.append(report)
+
+
+class TestProgressReporter(unittest.TestCase):
+
+    def test_throttling(self):
+        """
+        test, that reports are only emitted once per interval
+        """
+        sink = ListSink()
+        clock = [0.]
+        with mock.patch("progress.time.monotonic", lambda: clock[0]):
+            progress = ProgressReporter("test", sink=sink, interval=10)
+            progress.set_length(1000)
+            for _ in range(1000):
+                clock[0] += 0.01
+                progress.update()
+            progress.finish()
+
+        # 10 seconds in total -> at most one intermediate and the final report
+        self.assertLessEqual(len(sink.reports), 2)
+        final = sink.reports[-1]
+        self.assertEqual(final["done"], 1000)
+        self.assertEqual(final["percent"], 100.)
+        self.assertEqual(final["eta"], 0.)
+        self.assertAlmostEqual(final["rate"], 100.)
+
+    def test_unknown_length(self):
+        """
+        test, that percent and ETA are unset, if the length is unknown
+        """
+        sink = ListSink()
+        progress = ProgressReporter("test", sink=sink)
+        progress.update(5)
+        progress.finish()
+        self.assertIsNone(sink.reports[-1]["percent"])
+        self.assertIsNone(sink.reports[-1]["eta"])
+
+
+if __name__ == "__main__":
+    unittest.main()
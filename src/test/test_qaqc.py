@@ -0,0 +1,177 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import types
+import unittest
+from typing import Optional, Union
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+import saqc
+
+from qaqc import (
+    RESULT_COLUMNS, InvalidQaqcConfigError, _compact, _compile, _extract_by_result_type, count_rows,
+    get_data_from_frame,
+)
+
+
+class TestReadObservations(unittest.TestCase):
+
+    INDEX = pd.date_range("2020-01-01", periods=4, freq="1h", tz="UTC", name="result_time")
+
+    def frame(self, **columns) -> pd.DataFrame:
+        """ A frame of observations as read from the database, all values None by default. """
+        df = pd.DataFrame({c: [None] * 4 for c in ["result_type", *RESULT_COLUMNS]}, index=self.INDEX)
+        for name, values in columns.items():
+            df[name] = values
+        return df
+
+    def test_compact(self):
+        """
+        test, that the type is a byte and result columns without values are dropped
+        """
+        df = _compact(self.frame(result_type=[0, 0, 1, 0], result_number=[1., 2., None, 4.], result_string=[None, None, "x", None]))
+        self.assertEqual(df["result_type"].dtype, np.int8)
+        self.assertListEqual(list(df.columns), ["result_type", "result_number", "result_string"])
+
+    def test_extract(self):
+        """
+        test, that the value is taken from the column of its result type
+        """
+        df = _compact(self.frame(result_type=[0, 0, 0, 0], result_number=[1., 2., np.nan, 4.]))
+        got = _extract_by_result_type(df)
+        self.assertEqual(got.dtype, float)
+        pd.testing.assert_index_equal(got.index, self.INDEX)
+        np.testing.assert_array_equal(got.to_numpy(), [1., 2., np.nan, 4.])
+
+        df = _compact(self.frame(
+            result_type=[0, 1, 3, 2],
+            result_number=[1.5, None, None, None],
+            result_string=[None, "x", None, None],
+            result_json=[None, None, None, {"a": 1}],
+            result_boolean=[None, None, True, None],
+        ))
+        self.assertListEqual(_extract_by_result_type(df).tolist(), [1.5, "x", True, {"a": 1}])
+
+        with self.assertRaises(IndexError):
+            _extract_by_result_type(self.frame(result_type=[0, 0, 4, 0]))
+        self.assertTrue(_extract_by_result_type(self.frame().iloc[:0]).empty)
+
+
+def flagRange(self, field: str, min: float = -np.inf, max: float = np.inf, flag: Optional[float] = None,
+              window: Union[str, int] = 1, label: str = "", **kwargs):
+    return self
+
+
+class FreqString(str):
+    pass
+
+
+def flagMAD(self, field: str, window: Union[FreqString, int], z: float = 3.5, dfilter=None):
+    return self
+
+
+class TestCompile(unittest.TestCase):
+
+    @staticmethod
+    def properties(*tests):
+        return dict(default=0, configs=[dict(type="SaQC", context_window="1h", tests=list(tests))])
+
+    def compile(self, *tests):
+        with mock.patch.object(saqc.SaQC, "flagRange", flagRange, create=True), \
+                mock.patch.object(saqc.SaQC, "flagMAD", flagMAD, create=True):
+            return _compile(self.properties(*tests))
+
+    def test_saqc_signature(self):
+        """
+        test, that the kwargs are checked against the signature of saqc itself, not only the fakes
+        """
+        test = dict(function="flagRange", position=1, kwargs=dict(min="0", max=10))
+        step, = _compile(self.properties(test)).steps
+        self.assertDictEqual(step.call_kwargs(), dict(min=0., max=10.))
+        with self.assertRaises(InvalidQaqcConfigError):
+            _compile(self.properties(dict(test, kwargs=dict(min="low"))))
+
+    def test_coerce(self):
+        """
+        test, that numbers given as strings are converted and other types pass unchanged
+        """
+        kwargs = dict(min="0", max=10, label="x", window="1h", other=[1])
+        step, = self.compile(dict(function="flagRange", position=1, kwargs=kwargs)).steps
+        self.assertDictEqual(step.call_kwargs(), dict(min=0., max=10., label="x", window="1h", other=[1]))
+        step, = self.compile(dict(function="flagMAD", position=1, kwargs=dict(window="30min", z="4", dfilter=[]))).steps
+        self.assertDictEqual(step.call_kwargs(), dict(window="30min", z=4., dfilter=[]))
+
+    def test_invalid(self):
+        """
+        test, that arguments of the wrong type fail, before any data is loaded
+        """
+        for function, kwargs in [
+            ("flagRange", dict(min="low")),
+            ("flagRange", dict(max=True)),
+            ("flagRange", dict(window=1.5)),
+            ("flagMAD", dict(window="often")),
+            ("flagMAD", dict(window="1h", z=None)),
+        ]:
+            with self.subTest(kwargs=kwargs), self.assertRaises(InvalidQaqcConfigError):
+                self.compile(dict(function=function, position=1, kwargs=kwargs))
+
+    def test_frozen(self):
+        """
+        test, that the kwargs of a compiled step can't be changed by the config or callers
+        """
+        kwargs = dict(min=0, other=[1])
+        step, = self.compile(dict(function="flagRange", position=1, kwargs=kwargs)).steps
+        kwargs["other"].append(2)
+        with self.assertRaises(TypeError):
+            step.kwargs["min"] = 1
+        step.call_kwargs()["other"].append(3)
+        self.assertListEqual(step.kwargs["other"], [1])
+
+
+class TestDataFromFrame(unittest.TestCase):
+
+    INDEX = pd.date_range("2020-01-02", periods=3, freq="1h", name="result_time")
+
+    def load(self, frame: pd.DataFrame, context: pd.DataFrame):
+        config = pd.DataFrame(dict(position=[1, 2], window=["1d", "1d"]))
+        datastore = types.SimpleNamespace(
+            get_datastream=lambda pos: types.SimpleNamespace(id=pos, name=f"thing/{pos}", position=str(pos))
+        )
+        with mock.patch("qaqc.get_context_window_data", return_value=context):
+            return get_data_from_frame(datastore, config, frame)
+
+    def test_no_context(self):
+        """
+        test, that parsed data without a context window gets the UTC index of the stored data
+        """
+        frame = pd.DataFrame({1: [1., np.nan, 3.], 2: ["a", "b", None]}, index=self.INDEX)
+        empty = pd.DataFrame(columns=["result_type", "result_number"], index=pd.DatetimeIndex([], tz="UTC"))
+        data = self.load(frame, empty)
+        expected = self.INDEX.tz_localize("UTC")
+        pd.testing.assert_index_equal(data.data["1"].index, expected[[0, 2]], check_names=False)
+        self.assertListEqual(data.data["1"].tolist(), [1., 3.])
+        self.assertListEqual(data.data["2"].tolist(), ["a", "b"])
+        self.assertEqual(count_rows(data), 4)
+
+    def test_context(self):
+        """
+        test, that the context window is put before the parsed data
+        """
+        frame = pd.DataFrame({1: [1., 2., 3.]}, index=self.INDEX)
+        context = pd.DataFrame(
+            dict(result_type=[0], result_number=[0.]),
+            index=pd.DatetimeIndex(["2020-01-02 00:30"], name="result_time").tz_localize("Europe/Berlin"),
+        )
+        data = self.load(frame, context)
+        self.assertEqual(str(data.data["1"].index.tz), "UTC")
+        self.assertListEqual(data.data["1"].tolist(), [0., 1., 2., 3.])
+        self.assertEqual(data.attrs["1"]["rows"], 3)
+        self.assertEqual(len(data.attrs["1"]["context_index"]), 1)
+        self.assertTrue(data.data["2"].empty)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+import time
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from qaqc_cache import ResultCache, parse_allowlist, split_blocks
+
+
+class TestResultCache(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.directory = self._tmp.name
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_allowlist(self):
+        allowlist = parse_allowlist(" flagRange, flagMAD=window,flagConstants=2h,")
+        self.assertDictEqual(allowlist, {"flagRange": "0s", "flagMAD": "window", "flagConstants": "2h"})
+        self.assertDictEqual(parse_allowlist(""), {})
+
+        cache = ResultCache(self.directory, allowlist)
+        self.assertEqual(cache.margin("flagRange", {"min": 0}), pd.Timedelta(0))
+        self.assertEqual(cache.margin("flagConstants", {}), pd.Timedelta("2h"))
+        self.assertEqual(cache.margin("flagMAD", {"window": "30min"}), pd.Timedelta("30min"))
+        # a window of a number of values has no time margin
+        self.assertIsNone(cache.margin("flagMAD", {"window": 10}))
+        self.assertIsNone(cache.margin("flagMissing", {}))
+
+    def test_split_blocks(self):
+        index = pd.DatetimeIndex(["2022-01-01 23:00", "2022-01-02 00:00", "2022-01-02 12:00", "2022-01-04 01:00"])
+        blocks = split_blocks(index, "1D")
+        self.assertListEqual([(a, b) for *_, a, b in blocks], [(0, 1), (1, 3), (3, 4)])
+        self.assertEqual(blocks[1][0], pd.Timestamp("2022-01-02"))
+        self.assertEqual(blocks[1][1], pd.Timestamp("2022-01-03"))
+        self.assertListEqual(split_blocks(pd.DatetimeIndex([]), "1D"), [])
+
+    def test_key(self):
+        index = pd.date_range("2022-01-01", periods=10, freq="1h")
+        data = pd.Series(np.arange(10.), index=index)
+        flags = pd.Series(-np.inf, index=index)
+        key = ResultCache.key("flagRange", {"min": 0, "max": 5}, data, flags)
+        self.assertEqual(key, ResultCache.key("flagRange", {"max": 5, "min": 0}, data.copy(), flags.copy()))
+
+        changed = data.copy()
+        changed.iloc[3] = 99
+        flagged = flags.copy()
+        flagged.iloc[3] = 255.
+        for other in [
+            ResultCache.key("flagRange", {"min": 0, "max": 6}, data, flags),
+            ResultCache.key("flagMAD", {"min": 0, "max": 5}, data, flags),
+            ResultCache.key("flagRange", {"min": 0, "max": 5}, changed, flags),
+            ResultCache.key("flagRange", {"min": 0, "max": 5}, data, flagged),
+            ResultCache.key("flagRange", {"min": 0, "max": 5}, data.shift(freq="1h"), flags),
+            ResultCache.key("flagRange", {"min": 0, "max": 5}, data, flags, salt="2.3"),
+        ]:
+            self.assertNotEqual(key, other)
+
+    def test_get_put(self):
+        cache = ResultCache(self.directory, {})
+        flags = np.array([np.nan, 255., -np.inf])
+        self.assertIsNone(cache.get("a", 3))
+        cache.put("a", flags)
+        np.testing.assert_array_equal(cache.get("a", 3), flags)
+        # a different length is a miss
+        self.assertIsNone(cache.get("a", 4))
+        self.assertDictEqual(cache.counts, dict(hits=1, misses=2, evicted=0))
+        # the entries survive the process
+        np.testing.assert_array_equal(ResultCache(self.directory, {}).get("a", 3), flags)
+
+    def test_eviction(self):
+        flags = np.zeros(1000)
+        cache = ResultCache(self.directory, {})
+        cache.put("probe", flags)
+        size = os.path.getsize(cache._path("probe"))
+
+        cache = ResultCache(self.directory, {}, max_size=3 * size)
+        past = time.time() - 100
+        for i, key in enumerate(["b", "c"]):
+            cache.put(key, flags)
+            os.utime(cache._path(key), (past + i, past + i))
+        os.utime(cache._path("probe"), (past + 2, past + 2))
+        # 'b' is used recently, so 'c' is the least recently used
+        cache.get("b", 1000)
+        cache.put("d", flags)
+        self.assertEqual(cache.counts["evicted"], 1)
+        self.assertListEqual(sorted(os.listdir(self.directory)), ["b.npy", "d.npy", "probe.npy"])
+
+
+if __name__ == "__main__":
+    unittest.main()
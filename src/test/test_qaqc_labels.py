@@ -0,0 +1,100 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+import sqlalchemy
+from sqlalchemy.dialects import postgresql
+
+import qaqc_labels
+
+
+class RecordingSession:
+    """ Records the statements, no database needed. """
+
+    def __init__(self, result=()):
+        self.statements = []
+        self.result = result
+
+    def execute(self, stmt):
+        self.statements.append(stmt)
+        return mock.Mock(all=lambda: list(self.result))
+
+    def connection(self):
+        return None
+
+    def params(self, i: int) -> dict:
+        return self.statements[i].compile(dialect=postgresql.dialect()).params
+
+
+class TestLabelStorage(unittest.TestCase):
+
+    def test_check_storage(self):
+        """
+        test, that unknown storages and other databases than PostgreSQL fail early
+        """
+        engine = sqlalchemy.create_engine("sqlite://")
+        qaqc_labels.check_storage(engine, "jsonb")
+        with self.assertRaises(ValueError):
+            qaqc_labels.check_storage(engine, "csv")
+        with self.assertRaises(NotImplementedError):
+            qaqc_labels.check_storage(engine, "normalized")
+
+    def test_unprocessed(self):
+        """
+        test, that observations with a normalized label are processed
+        """
+        jsonb = str(qaqc_labels.unprocessed("jsonb").compile(dialect=postgresql.dialect()))
+        normalized = str(qaqc_labels.unprocessed("normalized").compile(dialect=postgresql.dialect()))
+        self.assertNotIn("observation_quality", jsonb)
+        self.assertIn("NOT (EXISTS", normalized)
+        self.assertIn(jsonb, normalized)
+
+    def test_label_ids(self):
+        """
+        test, that every distinct label is inserted once and cached
+        """
+        metas = ['{"func": "flagRange"}', '{"func": "flagMAD"}', '{"func": "flagRange"}']
+        hashes = {m: qaqc_labels.hashlib.md5(m.encode()).hexdigest() for m in metas}
+        session = RecordingSession([(hashes[metas[0]], 1), (hashes[metas[1]], 2)])
+        cache = {}
+        self.assertListEqual(qaqc_labels.get_label_ids(session, metas, cache), [1, 2, 1])
+        self.assertEqual(len(session.statements), 2)
+        self.assertEqual(len([k for k in session.params(0) if k.startswith("hash")]), 2)
+
+        # known labels need no statement
+        self.assertListEqual(qaqc_labels.get_label_ids(session, metas[:1], cache), [1])
+        self.assertEqual(len(session.statements), 2)
+
+    def test_write_flags(self):
+        """
+        test, that flags are written by observation id, unknown times are skipped
+        """
+        ids = pd.DataFrame({
+            "id": [10, 11, 12],
+            "result_time": pd.date_range("2020-01-01", periods=3, freq="1h", tz="UTC"),
+        })
+        # naive times are UTC, the last one has no observation
+        times = pd.DatetimeIndex(["2020-01-01 02:00", "2020-01-01 00:00", "2020-01-01 05:00"])
+        session = RecordingSession()
+        with mock.patch("qaqc_labels.pd.read_sql", return_value=ids):
+            n = qaqc_labels.write_flags(session, 1, times, np.array([np.nan, 3., 4.]), np.array([np.nan, 255., 25.]))
+        self.assertEqual(n, 2)
+        params = session.params(0)
+        self.assertListEqual(
+            [(params[f"observation_id_m{i}"], params[f"label_id_m{i}"], params[f"flag_m{i}"]) for i in range(2)],
+            [(12, None, None), (10, 3, 255.)],
+        )
+
+        with mock.patch("qaqc_labels.UPLOAD_BATCH_SIZE", 1), \
+                mock.patch("qaqc_labels.pd.read_sql", return_value=ids):
+            session = RecordingSession()
+            qaqc_labels.write_flags(session, 1, times, np.array([np.nan, 3., 4.]), np.array([np.nan, 255., 25.]))
+        self.assertEqual(len(session.statements), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
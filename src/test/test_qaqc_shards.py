@@ -0,0 +1,107 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import concurrent.futures
+import types
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+import qaqc
+from qaqc_shards import ShardPool, plan_shards
+
+
+def spikes(data, flags, scheme, var_name, func_name, kwargs, start, stop):
+    """ A test local to 2 values on either side, like `_test_block`. """
+    median = data.rolling(5, center=True, min_periods=1).median()
+    result = np.where((data - median).abs() > kwargs["thresh"], 255., np.nan)
+    return result[start:stop]
+
+
+class Flags(dict):
+    def __init__(self, index):
+        super().__init__(x=pd.Series(-np.inf, index=index))
+        self.appended = []
+        self.history = {"x": types.SimpleNamespace(append=lambda flags, meta: self.appended.append((flags, meta)))}
+
+
+class TestShards(unittest.TestCase):
+
+    def setUp(self):
+        index = pd.date_range("2022-01-01", periods=1000, freq="1min")
+        rng = np.random.default_rng(42)
+        values = rng.normal(size=len(index))
+        values[rng.choice(len(index), 30)] += 10
+        self.data = pd.Series(values, index=index)
+
+    def qc_obj(self):
+        return types.SimpleNamespace(data=pd.DataFrame({"x": self.data}), _flags=Flags(self.data.index), _scheme=None)
+
+    def pool(self, allowlist, **kwargs) -> ShardPool:
+        pool = ShardPool(allowlist, workers=3, min_rows=10, **kwargs)
+        # threads instead of processes, the patched test isn't picklable
+        pool._executor = concurrent.futures.ThreadPoolExecutor(3)
+        return pool
+
+    def test_plan(self):
+        """
+        test, that the shards cover the index once and overlap by the margin
+        """
+        index = self.data.index
+        plan = plan_shards(index, 4, pd.Timedelta("10min"))
+        self.assertEqual(len(plan), 4)
+        self.assertListEqual([start for _, _, start, _ in plan], [0, 250, 500, 750])
+        self.assertListEqual([stop for *_, stop in plan], [250, 500, 750, 1000])
+        for lo, hi, start, stop in plan:
+            self.assertEqual(lo, max(0, start - 10))
+            self.assertEqual(hi, min(len(index), stop + 10))
+        # never more shards than values
+        self.assertEqual(len(plan_shards(index[:2], 4, pd.Timedelta(0))), 2)
+
+    def test_margin(self):
+        """
+        test, that only allowed tests on long series are sharded
+        """
+        pool = ShardPool({"flagRange": "0s", "flagMAD": "window"}, workers=2, min_rows=10)
+        self.assertEqual(pool.margin("flagMAD", {"window": "1h"}, 100), pd.Timedelta("1h"))
+        self.assertIsNone(pool.margin("flagMAD", {"window": 10}, 100))
+        self.assertIsNone(pool.margin("flagRange", {}, 5))
+        self.assertIsNone(pool.margin("flagMissing", {}, 100))
+        self.assertEqual(pool.counts["sequential"], 3)
+
+    def test_sharded(self):
+        """
+        test, that the stitched flags equal the flags of a sequential run
+        """
+        expected = spikes(self.data, None, None, "x", "flagSpikes", {"thresh": 5}, 0, len(self.data))
+        self.assertTrue((expected == 255.).any())
+        qc_obj = self.qc_obj()
+        with mock.patch("qaqc._test_block", spikes), \
+                self.pool({"flagSpikes": "2min"}, verify=True) as pool:
+            self.assertIs(qaqc._run_sharded(qc_obj, "x", "flagSpikes", {"thresh": 5}, pool), qc_obj)
+        flags, meta = qc_obj._flags.appended[0]
+        np.testing.assert_array_equal(flags.to_numpy(), expected)
+        self.assertEqual(meta["func"], "flagSpikes")
+        self.assertDictEqual(pool.counts, dict(sharded=1, sequential=0, shards=6, mismatches=0))
+
+    def test_verify(self):
+        """
+        test, that a too small margin is detected and the sequential flags are kept
+        """
+        expected = spikes(self.data, None, None, "x", "flagSpikes", {"thresh": 1}, 0, len(self.data))
+        qc_obj = self.qc_obj()
+        with mock.patch("qaqc._test_block", spikes), \
+                self.pool({"flagSpikes": "0s"}, verify=True) as pool:
+            qaqc._run_sharded(qc_obj, "x", "flagSpikes", {"thresh": 1}, pool)
+        flags, _ = qc_obj._flags.appended[0]
+        np.testing.assert_array_equal(flags.to_numpy(), expected)
+        self.assertEqual(pool.counts["mismatches"], 1)
+
+        # field and target change other variables
+        self.assertIsNone(qaqc._run_sharded(self.qc_obj(), "x", "flagSpikes", {"target": "y"}, pool))
+
+
+if __name__ == "__main__":
+    unittest.main()